@@ -1,13 +1,18 @@
-import socket, struct, datetime, os, time
+import socket, struct, datetime, os, time, threading, select, re, heapq, atexit
 
 BLOCK_SIZE = 256
 SAMPLE_RATE = 44100.0
 OSCS = 64
-MAX_QUEUE = 400
+MAX_QUEUE = 3000 # deltas a synth's event queue holds, EVENT_FIFO_LEN in amy.h
 [SINE, PULSE, SAW, TRIANGLE, NOISE, KS, PCM, ALGO, PARTIAL, PARTIALS, OFF] = range(11)
+ALGO_OSCS = 8 # an ALGO voice uses its osc, the 6 operators after it and maybe an LFO after those
+# How long each wave takes to render per osc, next to a SINE, from bench.wave_cost(). ALGO is the whole voice
+WAVE_COST = {SINE: 1, PULSE: 2.2, SAW: 1.5, TRIANGLE: 1, NOISE: 4, KS: 2.5, PCM: 1, ALGO: 22, PARTIAL: 1, PARTIALS: 1, OFF: 0}
 TARGET_AMP, TARGET_DUTY, TARGET_FREQ, TARGET_FILTER_FREQ, TARGET_RESONANCE, TARGET_FEEDBACK, TARGET_LINEAR = (1, 2, 4, 8, 16, 32, 64)
 FILTER_NONE, FILTER_LPF, FILTER_BPF, FILTER_HPF = range(4)
 ALLES_LATENCY_MS = 1000
+ALLES_PING_TIME_MS = 10000
+ALLES_MAX_AHEAD_MS = 10000 # how far ahead backpressure() lets a message go, well inside MAX_DRIFT_MS in amy.h
 UDP_PORT = 9294
 
 sock = 0
@@ -66,6 +71,18 @@ def preset(which,osc=0, **kwargs):
 send_buffer = ""
 buffer_size = 0
 
+# Or call coalesce() to have send() group messages into datagrams for you, like Nagle's algorithm.
+# A datagram goes out when it is full, window_ms after its first message, or margin_ms before the earliest
+# message in it is due to play on the synths, whichever comes first. coalesce(0) turns it off and flushes.
+coalesce_size = 0
+coalesce_window_ms = 2
+coalesce_margin_ms = 100
+coalesce_buffer = ""
+coalesce_retries = 1
+coalesce_deadline = None # time.monotonic() the coalesce_buffer has to go out by
+coalesce_condition = threading.Condition()
+coalesce_thread = None
+
 
 
 def millis():
@@ -79,53 +96,155 @@ def millis():
 
 # Removes trailing 0s and x.0000s 
 def trunc(number):
+    # ints format the same either way, and skip the float formatting
+    if(type(number) is int): return str(number)
     return ('%.10f' % number).rstrip('0').rstrip('.')
 
+# The AMY message parameters, in the order message() writes them: (keyword, code, default)
+# Numbers are sent if >= 0, bp strings if not empty and algo_source if not None. retries is accepted but not sent.
+message_params = (
+    ("osc", "v", 0), ("wave", "w", -1), ("duty", "d", -1), ("feedback", "b", -1), ("freq", "f", -1), ("note", "n", -1),
+    ("patch", "p", -1), ("phase", "P", -1), ("detune", "u", -1), ("client", "c", -1), ("amp", "a", -1), ("vel", "l", -1),
+    ("volume", "V", -1), ("resonance", "R", -1), ("filter_freq", "F", -1), ("ratio", "I", -1), ("algorithm", "o", -1),
+    ("bp0", "A", ""), ("bp1", "B", ""), ("bp2", "C", ""), ("algo_source", "O", None),
+    ("bp0_target", "T", -1), ("bp1_target", "W", -1), ("bp2_target", "X", -1), ("mod_target", "g", -1), ("mod_source", "L", -1),
+    ("reset", "S", -1), ("debug", "D", -1), ("eq_l", "x", -1), ("eq_m", "y", -1), ("eq_h", "z", -1), ("filter_type", "G", -1),
+    ("synth_time", "k", -1),
+)
+message_keywords = set([p[0] for p in message_params] + ["timestamp", "retries"])
+
+# message()'s params in the order it takes them positionally, as it always has
+message_positional = ("osc", "wave", "patch", "note", "vel", "amp", "freq", "duty", "feedback", "timestamp", "reset", "phase",
+    "client", "retries", "volume", "filter_freq", "resonance", "bp0", "bp1", "bp2", "bp0_target", "bp1_target", "bp2_target",
+    "mod_target", "debug", "mod_source", "eq_l", "eq_m", "eq_h", "filter_type", "algorithm", "ratio", "detune", "algo_source")
+
+# One formatter per distinct set of keyword args given to message()
+message_formatters = {}
+
+def compile_message(keys):
+    # A function that formats a message from a dict of just these keywords. Which params it looks at, their codes and
+    # how each is sent (number, bp string or algo_source) come from message_params once here, not for every message
+    for k in keys:
+        if k not in message_keywords:
+            raise TypeError("message() got an unexpected keyword argument '%s'" % (k))
+    fields = tuple([(name, code, default, 1 if default == "" else 2 if default is None else 0) \
+        for (name, code, default) in message_params if name in keys or default == 0])
+    def formatter(kwargs):
+        timestamp = kwargs.get("timestamp")
+        if(timestamp is None): timestamp = millis()
+        m = ["t", str(timestamp) if type(timestamp) is int else ('%.10f' % timestamp).rstrip('0').rstrip('.')]
+        for (name, code, default, kind) in fields:
+            v = kwargs.get(name, default)
+            if(kind == 0):
+                if(v < 0): continue
+                v = str(v) if type(v) is int else ('%.10f' % v).rstrip('0').rstrip('.')
+            elif(kind == 1):
+                if(not len(v)): continue
+            else:
+                if(v is None): continue
+                v = str(v)
+            m.append(code)
+            m.append(v)
+        m.append("Z")
+        return "".join(m)
+    return formatter
+
 # Construct an AMY message
-def message(osc=0, wave=-1, patch=-1, note=-1, vel=-1, amp=-1, freq=-1, duty=-1, feedback=-1, timestamp=None, reset=-1, phase=-1, \
-        client=-1, retries=1, volume=-1, filter_freq = -1, resonance = -1, bp0="", bp1="", bp2="", bp0_target=-1, bp1_target=-1, bp2_target=-1, mod_target=-1, \
-        debug=-1, mod_source=-1, eq_l = -1, eq_m = -1, eq_h = -1, filter_type= -1, algorithm=-1, ratio = -1, detune = -1, algo_source=None):
+def message(*args, **kwargs):
+    if(len(args)):
+        if(len(args) > len(message_positional)):
+            raise TypeError("message() takes at most %d positional arguments (%d given)" % (len(message_positional), len(args)))
+        for (name, v) in zip(message_positional, args):
+            if(name in kwargs):
+                raise TypeError("message() got multiple values for argument '%s'" % (name))
+            kwargs[name] = v
+    keys = tuple(kwargs)
+    formatter = message_formatters.get(keys)
+    if formatter is None:
+        formatter = compile_message(keys)
+        message_formatters[keys] = formatter
+    return formatter(kwargs)
+
+# The binary message params, in the engine's enum binary_params (mask bit) order, with their struct format.
+# bp is a count of pairs then (uint16 ms, float32) pairs, algo is a count then int8 oscs
+BINARY_MAGIC = 0xA5
+binary_params = (
+    ("osc", "B"), ("wave", "B"), ("vel", "f"), ("freq", "f"), ("note", "B"), ("amp", "f"), ("patch", "H"),
+    ("phase", "f"), ("feedback", "f"), ("bp0", "bp"), ("bp1", "bp"), ("bp2", "bp"), ("bp0_target", "B"), ("bp1_target", "B"),
+    ("bp2_target", "B"), ("client", "H"), ("duty", "f"), ("detune", "f"), ("volume", "f"), ("resonance", "f"), ("filter_freq", "f"),
+    ("ratio", "f"), ("algorithm", "B"), ("algo_source", "algo"), ("mod_target", "B"), ("mod_source", "B"), ("reset", "B"), ("debug", "B"),
+    ("eq_l", "f"), ("eq_m", "f"), ("eq_h", "f"), ("filter_type", "B"),
+)
+message_defaults = dict([(name, default) for (name, code, default) in message_params])
 
-    m = ""
+# Construct an AMY message in the compact binary format, see parse_binary_task() in amy.c.
+# It sends the same params message() would, about half the size. Returns None for a message the binary format
+# can't hold (a breakpoint time over 65535ms, a number out of range or longer than 255 bytes), send those as ASCII.
+def binary_message(**kwargs):
+    for k in kwargs:
+        if k not in message_keywords:
+            raise TypeError("binary_message() got an unexpected keyword argument '%s'" % (k))
+    # Binary messages only carry host time
+    if(kwargs.get("synth_time", -1) >= 0): return None
+    timestamp = kwargs.get("timestamp")
     if(timestamp is None): timestamp = millis()
-    m = m + "t" + trunc(timestamp)
-    if(osc>=0): m = m + "v" + trunc(osc)
-    if(wave>=0): m = m + "w" + trunc(wave)
-    if(duty>=0): m = m + "d" + trunc(duty)
-    if(feedback>=0): m = m + "b" + trunc(feedback)
-    if(freq>=0): m = m + "f" + trunc(freq)
-    if(note>=0): m = m + "n" + trunc(note)
-    if(patch>=0): m = m + "p" + trunc(patch)
-    if(phase>=0): m = m + "P" + trunc(phase)
-    if(detune>=0): m = m + "u" + trunc(detune)
-    if(client>=0): m = m + "c" + trunc(client)
-    if(amp>=0): m = m + "a" + trunc(amp)
-    if(vel>=0): m = m + "l" + trunc(vel)
-    if(volume>=0): m = m + "V" + trunc(volume)
-    if(resonance>=0): m = m + "R" + trunc(resonance)
-    if(filter_freq>=0): m = m + "F" + trunc(filter_freq)
-    if(ratio>=0): m = m + "I" + trunc(ratio)
-    if(algorithm>=0): m = m + "o" + trunc(algorithm)
-    if(len(bp0)): m = m +"A%s" % (bp0)
-    if(len(bp1)): m = m +"B%s" % (bp1)
-    if(len(bp2)): m = m +"C%s" % (bp2)
-    if(algo_source is not None): m = m +"O%s" % (algo_source)
-    if(bp0_target>=0): m = m + "T" +trunc(bp0_target)
-    if(bp1_target>=0): m = m + "W" +trunc(bp1_target)
-    if(bp2_target>=0): m = m + "X" +trunc(bp2_target)
-    if(mod_target>=0): m = m + "g" + trunc(mod_target)
-    if(mod_source>=0): m = m + "L" + trunc(mod_source)
-    if(reset>=0): m = m + "S" + trunc(reset)
-    if(debug>=0): m = m + "D" + trunc(debug)
-    if(eq_l>=0): m = m + "x" + trunc(eq_l)
-    if(eq_m>=0): m = m + "y" + trunc(eq_m)
-    if(eq_h>=0): m = m + "z" + trunc(eq_h)
-    if(filter_type>=0): m = m + "G" + trunc(filter_type)
-    return m+'Z'
+    mask = 0
+    # Whole ms, then 256ths of a ms past them so a fractional timestamp lands between samples like it does in ASCII
+    whole_ms = int(timestamp // 1)
+    fmt = "<IB"
+    values = [whole_ms, int((timestamp - whole_ms) * 256)]
+    for (bit, (name, kind)) in enumerate(binary_params):
+        v = kwargs.get(name, message_defaults[name])
+        if(kind == "bp"):
+            if(not len(v)): continue
+            bps = v.split(",")
+            if(len(bps) % 2 or "" in bps): return None
+            fmt = fmt + "B" + "Hf" * (len(bps) // 2)
+            values.append(len(bps) // 2)
+            for i in range(0, len(bps), 2):
+                values.append(int(float(bps[i])))
+                values.append(float(bps[i+1]))
+        elif(kind == "algo"):
+            if(v is None): continue
+            # Empty sources stay unset (-2) like they do in parse_algorithm()
+            sources = [int(s) if len(s) else -2 for s in str(v).split(",")]
+            fmt = fmt + "B" + "b" * len(sources)
+            values = values + [len(sources)] + sources
+        else:
+            if(v < 0): continue
+            fmt = fmt + kind
+            values.append(float(v) if kind == "f" else int(v))
+        mask = mask | (1 << bit)
+    # The mask goes 7 bits per byte, with the high bit set if there's more
+    mask_bytes = bytearray()
+    while(mask > 0x7F):
+        mask_bytes.append(0x80 | (mask & 0x7F))
+        mask = mask >> 7
+    mask_bytes.append(mask)
+    try:
+        body = struct.pack(fmt, *values)
+    except struct.error:
+        return None
+    length = 2 + len(mask_bytes) + len(body)
+    if(length > 255):
+        return None
+    return bytes([BINARY_MAGIC, length]) + bytes(mask_bytes) + body
+
+# Send messages in the binary format from now on, or go back to ASCII with binary(False). Synths understand both at once.
+binary_format = False
+
+def binary(on=True):
+    global binary_format
+    binary_format = on
 
 def transmit(message, retries=1):
+    # Binary messages are carried in strs as latin-1, one char per byte, so they buffer and pack like ASCII ones
+    if(local_amy is not None):
+        # A local AMY gets it right away, no need to retry
+        local_amy.send(message.encode('latin-1'))
+        return
     for x in range(retries):
-        get_sock().sendto(message.encode('ascii'), get_multicast_group())
+        get_sock().sendto(message.encode('latin-1'), get_multicast_group())
 
 def buffer(size=508):
     global buffer_size
@@ -138,9 +257,86 @@ def flush(retries=1):
     transmit(send_buffer)
     send_buffer = ""
 
+def coalesce(size=508, window_ms=2, margin_ms=100):
+    global coalesce_size, coalesce_window_ms, coalesce_margin_ms, coalesce_thread
+    with coalesce_condition:
+        coalesce_size = size
+        coalesce_window_ms = window_ms
+        coalesce_margin_ms = margin_ms
+        if(coalesce_size == 0):
+            coalesce_flush()
+        elif(coalesce_thread is None):
+            coalesce_thread = threading.Thread(target=coalesce_task, daemon=True)
+            coalesce_thread.start()
+        coalesce_condition.notify()
+
+def coalesce_flush():
+    # Send the coalesced datagram now. Call with coalesce_condition held
+    global coalesce_buffer, coalesce_retries, coalesce_deadline
+    if(len(coalesce_buffer)):
+        transmit(coalesce_buffer, retries=coalesce_retries)
+    coalesce_buffer = ""
+    coalesce_retries = 1
+    coalesce_deadline = None
+
+def coalesce_task():
+    # Background thread that sends the coalesced datagram when its deadline comes up
+    global coalesce_thread
+    with coalesce_condition:
+        while(coalesce_size > 0):
+            if(coalesce_deadline is None):
+                coalesce_condition.wait()
+            else:
+                wait_s = coalesce_deadline - time.monotonic()
+                if(wait_s > 0):
+                    coalesce_condition.wait(wait_s)
+                else:
+                    coalesce_flush()
+        coalesce_thread = None
+
+def coalesce_exit():
+    # The coalesce thread is a daemon, so send what's left when the script ends instead of losing it
+    with coalesce_condition:
+        coalesce_flush()
+
+atexit.register(coalesce_exit)
+
+def coalesce_send(m, timestamp, retries=1):
+    # Add a message to the coalesced datagram, sending the datagram first if m won't fit in it
+    global coalesce_buffer, coalesce_retries, coalesce_deadline
+    with coalesce_condition:
+        if(len(coalesce_buffer) + len(m) > coalesce_size):
+            coalesce_flush()
+        now = time.monotonic()
+        # The synths play this at timestamp + ALLES_LATENCY_MS, it has to get there margin_ms before that
+        deadline = now + min(coalesce_window_ms, timestamp + ALLES_LATENCY_MS - coalesce_margin_ms - millis()) / 1000.0
+        coalesce_buffer = coalesce_buffer + m
+        coalesce_retries = max(coalesce_retries, retries)
+        if(coalesce_deadline is None or deadline < coalesce_deadline):
+            coalesce_deadline = deadline
+            coalesce_condition.notify()
+        if(deadline <= now):
+            coalesce_flush()
+
+def encode(**kwargs):
+    # One message the way send() sends it, binary if binary() is on and it fits the binary format
+    m = None
+    if(binary_format):
+        m = binary_message(**kwargs)
+    if(m is None):
+        return message(**kwargs)
+    return m.decode('latin-1')
+
 def send(retries=1, **kwargs):
     global send_buffer
-    m = message(**kwargs)
+    # Stamp it now so a coalesce deadline, the queue estimate and the message agree on the time
+    if((coalesce_size > 0 or queue_policy is not None) and kwargs.get("timestamp") is None): kwargs["timestamp"] = millis()
+    if(queue_policy is not None):
+        queue_admit(delta_count(**kwargs), kwargs["timestamp"], kwargs.get("client", -1))
+    m = encode(**kwargs)
+    if(coalesce_size > 0):
+        coalesce_send(m, kwargs["timestamp"], retries=retries)
+        return
     if(buffer_size > 0):
         if(len(send_buffer + m) > buffer_size):
             transmit(send_buffer, retries=retries)
@@ -150,6 +346,243 @@ def send(retries=1, **kwargs):
     else:
         transmit(m,retries=retries)
 
+def trunc_column(values):
+    # trunc() over a whole numpy column at once, with one %-format for all of the floats
+    if(values.dtype.kind in "iub"):
+        return list(map(str, values.astype('int64').tolist()))
+    text = ('%.10f\x00' * len(values)) % tuple(values.tolist())
+    return [t.rstrip('0').rstrip('.') for t in text.split('\x00')[:-1]]
+
+def encode_many(events):
+    # Encode a batch of events into a list of AMY messages, the same ones encode() would make for each.
+    # events is a list of dicts of message() kwargs, or a numpy structured array with one field per AMY parameter.
+    # Structured arrays are encoded a column at a time. Numbers < 0 and empty strings in a column are not sent.
+    if(not hasattr(events, "dtype")):
+        return [encode(**e) for e in events]
+    names = events.dtype.names
+    for k in names:
+        if k not in message_keywords:
+            raise TypeError("encode_many() got an unexpected field '%s'" % (k))
+    if(len(events) == 0):
+        return []
+    if(binary_format):
+        # Binary messages are packed one at a time, with the unsent numbers and strings left out of each row
+        return [encode(**dict([(k, v) for (k, v) in zip(names, row) if not (v == "" if isinstance(v, str) else v < 0)])) \
+            for row in events.tolist()]
+    # Build one format for the batch. Params sent in every row go into the format with their code,
+    # params sent in only some rows carry their own code (or nothing) in the column
+    if("timestamp" in names):
+        fmt = "t%s"
+        columns = [trunc_column(events["timestamp"])]
+    else:
+        fmt = "t" + str(millis())
+        columns = []
+    for (name, code, default) in message_params:
+        if(name in names):
+            values = events[name]
+            if(values.dtype.kind in "US"):
+                values = values.astype(str)
+                sent = values != ""
+            else:
+                sent = values >= 0
+            if(sent.all()):
+                fmt = fmt + code + "%s"
+                columns.append(values.tolist() if values.dtype.kind == "U" else trunc_column(values))
+            elif(sent.any()):
+                # Only format the rows that send this param
+                text = values[sent].tolist() if values.dtype.kind == "U" else trunc_column(values[sent])
+                column = [""] * len(events)
+                for (i, t) in zip(sent.nonzero()[0].tolist(), text):
+                    column[i] = code + t
+                fmt = fmt + "%s"
+                columns.append(column)
+        elif(default == 0):
+            fmt = fmt + code + "0"
+    fmt = fmt + "Z"
+    if(not len(columns)):
+        return [fmt] * len(events)
+    return [fmt % row for row in zip(*columns)]
+
+def pack(messages, size=508):
+    # Group messages into as few datagrams of at most size bytes as we can, keeping their order
+    datagrams = []
+    d = ""
+    for m in messages:
+        if(len(d) + len(m) > size and len(d)):
+            datagrams.append(d)
+            d = m
+        else:
+            d = d + m
+    if(len(d)):
+        datagrams.append(d)
+    return datagrams
+
+def send_many(events, retries=1, size=508):
+    # Send a batch of events, see encode_many(), packed into datagrams of at most size bytes.
+    # Goes straight out, it does not go through the buffer() buffer.
+    if(queue_policy is not None):
+        return send_many_admitted(events, retries=retries, size=size)
+    for d in pack(encode_many(events), size=size):
+        transmit(d, retries=retries)
+
+def send_many_admitted(events, retries=1, size=508):
+    # send_many() with backpressure on. Each datagram goes once the queues have room for all of its messages
+    if(hasattr(events, "dtype")):
+        names = events.dtype.names
+        rows = [dict(zip(names, e)) for e in events.tolist()]
+    else:
+        rows = events
+    messages = encode_many(events)
+    now = millis()
+    d = ""
+    admits = []
+    for (m, row) in zip(messages, rows):
+        if(len(d) + len(m) > size and len(d)):
+            for a in admits: queue_admit(*a)
+            transmit(d, retries=retries)
+            d = ""
+            admits = []
+        d = d + m
+        admits.append((delta_count(**row), row.get("timestamp", now), row.get("client", -1)))
+    if(len(d)):
+        for a in admits: queue_admit(*a)
+        transmit(d, retries=retries)
+
+def send_paced(datagrams, lookahead_ms=250, retries=1):
+    # Send datagrams of (first timestamp, last timestamp, deltas, datagram), in order, each lookahead_ms before its
+    # first timestamp, sleeping in between. With backpressure() on, each waits for room for its deltas too.
+    # Anything send() is holding in the coalesce or send buffer goes first, so it isn't sent after these
+    with coalesce_condition:
+        coalesce_flush()
+    if(len(send_buffer)):
+        flush(retries=retries)
+    # A local AMY that isn't live plays nothing until render(), so don't sleep for it. Each datagram goes as soon as
+    # there's room in its queue, rendering ahead for room unless backpressure() is "raise"
+    offline = local_amy is not None and not local_amy_live
+    for (first, last, deltas, d) in datagrams:
+        if(offline):
+            local_admit(deltas, queue_capacity(), wait=(queue_policy != "raise"))
+        else:
+            wait_ms = first - lookahead_ms - millis()
+            if(wait_ms > 0):
+                time.sleep(wait_ms / 1000.0)
+            if(queue_policy is not None):
+                queue_admit(deltas, last)
+        transmit(d, retries=retries)
+
+
+"""
+    Backpressure. A synth's event queue holds MAX_QUEUE deltas, one per param of each message (and one per number in
+    a breakpoint string), and it drops what doesn't fit. With backpressure() on, send() counts the deltas in each
+    message and keeps an estimate of each client's queue: a message's deltas are on it from when it's sent until
+    it plays, ALLES_LATENCY_MS after its timestamp
+"""
+queue_policy = None
+queue_size = None # deltas a queue holds, None for queue_capacity()
+queue_lock = threading.Lock()
+queue_heaps = {} # client, -1 for everyone or a group > 255 -> heap of (host ms its deltas play, deltas)
+queue_counts = {} # deltas in each of queue_heaps
+
+class QueueFull(Exception):
+    pass
+
+def backpressure(policy="wait", size=None):
+    # policy "wait" makes send() wait until the message fits in the queues it goes to, and isn't more than
+    # ALLES_MAX_AHEAD_MS ahead of playing, then send it. "raise" raises QueueFull instead, and None turns it
+    # off. size is how many deltas a queue holds, by default the local AMY's queue length or MAX_QUEUE.
+    # Returns the policy it had
+    global queue_policy, queue_size
+    if(policy not in ("wait", "raise", None)):
+        raise ValueError("policy has to be wait, raise or None")
+    with queue_lock:
+        old = queue_policy
+        queue_policy = policy
+        queue_size = size
+        if(policy is None):
+            queue_heaps.clear()
+            queue_counts.clear()
+    return old
+
+# Params that are not added to the queue
+queue_free_params = set(["osc", "client", "timestamp", "synth_time", "retries", "reset", "debug"])
+
+def delta_count(**kwargs):
+    # How many deltas add_event() makes of a message on a synth
+    count = 0
+    for (k, v) in kwargs.items():
+        if(k in queue_free_params or v is None):
+            continue
+        if(type(v) is str):
+            # A breakpoint string is up to 8 time, value pairs, and algo_source up to 6 oscs
+            count = count + min(len([x for x in v.split(",") if len(x.strip())]), 16 if k != "algo_source" else 6)
+        elif(v >= 0):
+            count = count + 1
+    return count
+
+def queue_capacity():
+    if(queue_size is not None):
+        return queue_size
+    if(local_amy is not None):
+        return local_amy.config()["event_fifo_len"]
+    return MAX_QUEUE
+
+def queue_latency():
+    if(local_amy is not None):
+        return local_amy.config()["latency_ms"]
+    return ALLES_LATENCY_MS
+
+def queue_estimate(client=-1, now=None):
+    # Deltas we think are waiting on client's queue at host time now. For everyone (-1) or a group, the fullest
+    # one's. Call with queue_lock held
+    if(now is None): now = millis()
+    for (k, heap) in queue_heaps.items():
+        while(len(heap) and heap[0][0] <= now):
+            queue_counts[k] = queue_counts[k] - heapq.heappop(heap)[1]
+    groups = [g for g in queue_counts if g > 255]
+    def one(c):
+        return queue_counts.get(-1, 0) + queue_counts.get(c, 0) + sum([queue_counts[g] for g in groups if c % (g - 255) == 0])
+    if(client >= 0 and client <= 255):
+        return one(client)
+    members = [c for c in queue_counts if c >= 0 and c <= 255 and (client < 0 or c % (client - 255) == 0)]
+    # Clients we haven't sent to on their own could be in all of the groups
+    return max([one(c) for c in members] + [queue_counts.get(-1, 0) + sum([queue_counts[g] for g in groups])])
+
+def queue_admit(count, timestamp, client=-1):
+    # Wait until count deltas playing at timestamp + the latency fit on client's queue, or raise, then count them
+    size = queue_capacity()
+    if(count > size):
+        raise QueueFull("a message of %d deltas won't fit in a queue of %d" % (count, size))
+    if(local_amy is not None and not local_amy_live):
+        return local_admit(count, size, wait=(queue_policy == "wait"))
+    play = timestamp + queue_latency()
+    while 1:
+        with queue_lock:
+            now = millis()
+            if(queue_estimate(client, now) + count <= size and play - now <= ALLES_MAX_AHEAD_MS):
+                if(client not in queue_heaps):
+                    queue_heaps[client] = []
+                    queue_counts[client] = 0
+                heapq.heappush(queue_heaps[client], (play, count))
+                queue_counts[client] = queue_counts[client] + count
+                return
+            if(queue_policy == "raise"):
+                raise QueueFull("client %d's queue is full, or the message is too far ahead" % (client))
+            if(play - now > ALLES_MAX_AHEAD_MS):
+                wake = play - ALLES_MAX_AHEAD_MS
+            else:
+                # When the next deltas play and leave the queues
+                wake = min([h[0][0] for h in queue_heaps.values() if len(h)] + [now + 100])
+        time.sleep(max(1, wake - now) / 1000.0)
+
+def local_admit(count, size, wait=True):
+    # A local AMY that isn't live only plays its queue as it renders, not as time goes by. So its real queue is
+    # what counts, and waiting for room means rendering ahead into render_backlog, which render() returns first
+    while(local_amy.queued() + count > size):
+        if(not wait):
+            raise QueueFull("the local AMY's queue is full, render() to play some of it")
+        render_ahead()
+
+
 """
     Convenience functions
 """
@@ -158,11 +591,317 @@ def reset(osc=None):
     if(osc is not None):
         send(reset=osc)
     else:
-        send(reset=100) # reset > ALLES_OSCS resets all oscs
+        send(reset=OSCS) # reset > OSCS-1 resets all oscs
 
 def volume(volume, client = -1):
     send(client=client, volume=volume)
 
+def note_on(vel=1, **kwargs):
+    send(vel=vel, **kwargs)
+
+def note_off(**kwargs):
+    send(vel=0, **kwargs)
+
+
+"""
+    Lookahead scheduling. Sleeping between send()s makes every note as late as the OS wakes us up, and the lateness
+    adds up. A Scheduler instead holds events for the times they should play and sends them in batches, stamped
+    with those times, lookahead_ms before they are due. The synths' own queues play them on time
+"""
+class Scheduler:
+    # Times are host ms like millis(), or beats at bpm from beat 0 at start (default lookahead_ms from now).
+    # Messages for one client also carry its own clock's time for them, see host_to_synth_time(). Each batch goes out between
+    # lookahead_ms - batch_ms and lookahead_ms before its events, so lookahead_ms has to be under ALLES_LATENCY_MS
+    def __init__(self, bpm=120, lookahead_ms=250, batch_ms=100, start=None):
+        if(lookahead_ms >= ALLES_LATENCY_MS or batch_ms > lookahead_ms):
+            raise ValueError("lookahead_ms has to be less than ALLES_LATENCY_MS (%d) and at least batch_ms" % (ALLES_LATENCY_MS))
+        self.bpm = bpm
+        self.lookahead_ms = lookahead_ms
+        self.batch_ms = batch_ms
+        self.start = millis() + lookahead_ms if start is None else start
+        self.events = [] # heap of (time, order added, send() kwargs)
+        self.added = 0
+        self.lock = threading.Lock()
+
+    def time_of(self, beat):
+        return self.start + beat * 60000.0 / self.bpm
+
+    def at(self, t, **kwargs):
+        # Play send(**kwargs) at host time t
+        if("timestamp" in kwargs):
+            raise TypeError("the Scheduler stamps messages with their time, pass it as t (or a beat) instead of timestamp")
+        with self.lock:
+            heapq.heappush(self.events, (t, self.added, kwargs))
+            self.added = self.added + 1
+
+    def beat(self, beat, **kwargs):
+        self.at(self.time_of(beat), **kwargs)
+
+    def release(self):
+        # Send everything due in the next lookahead_ms, packed into datagrams. Returns how many messages went
+        horizon = millis() + self.lookahead_ms
+        messages = []
+        admits = []
+        with self.lock:
+            while(len(self.events) and self.events[0][0] <= horizon):
+                (t, order, kwargs) = heapq.heappop(self.events)
+                if(queue_policy is not None):
+                    admits.append((delta_count(**kwargs), t, kwargs.get("client", -1)))
+                if(kwargs.get("client", -1) >= 0):
+                    synth_time = host_to_synth_time(kwargs["client"], t)
+                    if(synth_time is not None): kwargs = dict(kwargs, synth_time=synth_time)
+                messages.append(encode(timestamp=t, **kwargs))
+        # With backpressure on, wait for room for the batch outside the lock, so at() still works meanwhile
+        for a in admits: queue_admit(*a)
+        for d in pack(messages):
+            transmit(d)
+        return len(messages)
+
+    def wait(self, t=None):
+        # Release batches, sleeping in between, until everything before host time t has gone out. With no t, until
+        # everything has. Call it with the time of what you'll add next to stay lookahead_ms ahead of it
+        while 1:
+            self.release()
+            with self.lock:
+                next_time = self.events[0][0] if len(self.events) else None
+            if(t is not None and millis() + self.lookahead_ms >= t): return
+            if(t is None and next_time is None): return
+            if(next_time is None or (t is not None and t < next_time)): next_time = t
+            # Wake when the next event is batch_ms into the lookahead, to send it with whatever else is due by then
+            time.sleep(max(0, next_time - self.lookahead_ms + self.batch_ms - millis()) / 1000.0)
+
+
+"""
+    Voice allocation. A VoiceAllocator hands out oscs on each client for notes and knows which are busy
+"""
+class Voice:
+    def __init__(self, client, osc, oscs, start, end, vel, cost):
+        self.client = client
+        self.osc = osc
+        self.oscs = oscs
+        self.start = start
+        self.end = end # when its envelope is over, or None to hold it until release()
+        self.vel = vel
+        self.cost = cost
+        self.stolen = [] # voices note_on() took to make room for this one, send them a note off
+
+    def __repr__(self):
+        return "<Voice client %d oscs %d-%d vel %s>" % (self.client, self.osc, self.osc + self.oscs - 1, trunc(self.vel))
+
+class VoiceAllocator:
+    # A voice is a run of oscs that are used together: 1 for most waves, ALGO_OSCS for ALGO, or 1 + oscs_alloc for a
+    # PARTIALS patch. Voices are busy from note_on() until release() or the end of their envelope, if given.
+    # Each voice costs what its wave does in WAVE_COST (per osc, except ALGO), and without a client note_on() puts
+    # it where it scores lowest: the load it would make as a part of budget (or of the oscs, with no budget), plus
+    # how unreliable the client is, plus its round trip as a part of ALLES_LATENCY_MS. Reliability and RTT come from
+    # table, a client table like sync() returns or a function like sync_clients that returns one. Clients are
+    # those in the table, if there is no clients list. A client can't go over budget, when none has room note_on()
+    # steals the voice that started first (steal="oldest") or the one with the lowest velocity ("quietest").
+    # Times are host ms, default now, so it works with Scheduler times too
+    def __init__(self, clients=None, oscs=OSCS, steal="oldest", budget=None, table=None):
+        if(steal not in ("oldest", "quietest")):
+            raise ValueError("steal has to be oldest or quietest")
+        if(clients is None and table is None): clients = 1
+        self.clients = list(range(clients)) if type(clients) is int else clients
+        self.oscs = oscs
+        self.steal = steal
+        self.budget = budget
+        self.table = table
+        self.voices = {}
+        self.lock = threading.Lock()
+
+    def client_table(self):
+        if(self.table is None): return {}
+        return self.table() if callable(self.table) else self.table
+
+    def expire(self, t):
+        # Forget the voices whose envelopes are over by t
+        for c in self.voices:
+            self.voices[c] = [v for v in self.voices[c] if v.end is None or v.end > t]
+
+    def free_run(self, client, oscs):
+        # The first osc of the first run of oscs free oscs on client, or None
+        busy = [False] * self.oscs
+        for v in self.voices.get(client, []):
+            for o in range(v.osc, min(v.osc + v.oscs, self.oscs)):
+                busy[o] = True
+        run = 0
+        for o in range(self.oscs):
+            run = 0 if busy[o] else run + 1
+            if(run == oscs):
+                return o - oscs + 1
+        return None
+
+    def load(self, client, t=None):
+        # The cost of what client is playing at t
+        with self.lock:
+            if(t is not None): self.expire(t)
+            return sum([v.cost for v in self.voices.get(client, [])])
+
+    def free_oscs(self, client, t=None):
+        with self.lock:
+            self.expire(millis() if t is None else t)
+            return self.oscs - sum([v.oscs for v in self.voices.get(client, [])])
+
+    def score(self, client, cost, info):
+        load = sum([v.cost for v in self.voices.get(client, [])]) + cost
+        score = load / float(self.budget if self.budget is not None else self.oscs)
+        if(info.get("reliability") is not None): score = score + 1 - info["reliability"]
+        if(info.get("avg_rtt") is not None): score = score + info["avg_rtt"] / float(ALLES_LATENCY_MS)
+        return score
+
+    def note_on(self, oscs=1, vel=1, duration_ms=None, client=None, t=None, wave=None, cost=None):
+        # Take a voice of oscs oscs for a note at t that lasts duration_ms, or until release() if None. Its cost is
+        # from wave, or give it. With neither it's one per osc
+        if(oscs > self.oscs):
+            raise ValueError("a voice of %d oscs won't fit in %d" % (oscs, self.oscs))
+        if(cost is None):
+            cost = WAVE_COST.get(wave, 1) * (1 if wave == ALGO else oscs)
+        if(t is None): t = millis()
+        table = self.client_table()
+        with self.lock:
+            self.expire(t)
+            if(client is not None):
+                clients = [client]
+            else:
+                clients = self.clients if self.clients is not None else list(table.keys())
+            if(not len(clients)):
+                raise ValueError("no clients to put a voice on")
+            for c in clients:
+                self.voices.setdefault(c, [])
+            clients = sorted(clients, key=lambda c: self.score(c, cost, table.get(c, {})))
+            for c in clients:
+                if(self.budget is not None and len(self.voices[c]) and \
+                    sum([v.cost for v in self.voices[c]]) + cost > self.budget):
+                    continue
+                osc = self.free_run(c, oscs)
+                if(osc is not None):
+                    voice = Voice(c, osc, oscs, t, None if duration_ms is None else t + duration_ms, vel, cost)
+                    self.voices[c].append(voice)
+                    return voice
+            # No room. Pick the run of oscs whose voices are the best to steal, and steal just those, plus the next
+            # best on its client until it's in budget
+            best = None
+            for (rank, c) in enumerate(clients):
+                for osc in range(self.oscs - oscs + 1):
+                    victims = [v for v in self.voices[c] if v.osc < osc + oscs and v.osc + v.oscs > osc]
+                    if(self.budget is not None):
+                        rest = sorted([v for v in self.voices[c] if v not in victims], key=self.steal_order)
+                        load = sum([v.cost for v in rest])
+                        while(len(rest) and load + cost > self.budget):
+                            victims.append(rest.pop(0))
+                            load = load - victims[-1].cost
+                    if(not len(victims)): continue
+                    # The run whose most worth keeping voice is least worth it, then the fewest voices, then the client
+                    key = (max([self.steal_order(v) for v in victims]), len(victims), rank)
+                    if(best is None or key < best[0]):
+                        best = (key, c, osc, victims)
+            (key, c, osc, stolen) = best
+            for v in stolen:
+                self.voices[c].remove(v)
+            voice = Voice(c, osc, oscs, t, None if duration_ms is None else t + duration_ms, vel, cost)
+            voice.stolen = stolen
+            self.voices[c].append(voice)
+            return voice
+
+    def steal_order(self, voice):
+        # Voices that sort first are stolen first
+        if(self.steal == "quietest"):
+            return (voice.vel, voice.start)
+        return (voice.start,)
+
+    def release(self, voice, t=None):
+        # The note is off at t, its oscs are free from then. Give the release time of its envelope in t if it has one
+        with self.lock:
+            if(voice in self.voices.get(voice.client, [])):
+                voice.end = millis() if t is None else t
+
+
+"""
+    A local AMY on this computer, through libamy (build it in main/amy with python setup.py install)
+"""
+local_amy = None
+local_amy_live = False
+# What the synths on the network have. OSCS and BLOCK_SIZE are the local AMY's while there is one
+ALLES_OSCS = OSCS
+ALLES_BLOCK_SIZE = BLOCK_SIZE
+
+# Send messages to a local AMY instead of the network until stop(). They wait for render(), or with immediate
+# play out the speakers. render_threads splits the oscs over that many threads. config can set
+# oscs, block_size, event_fifo_len and latency_ms, e.g. start(oscs=512, block_size=64)
+def start(immediate=False, render_threads=1, **config):
+    global local_amy, local_amy_live, OSCS, BLOCK_SIZE
+    import libamy
+    libamy.start(**config)
+    libamy.render_threads(render_threads)
+    if(immediate): libamy.live_start()
+    local_amy = libamy
+    local_amy_live = immediate
+    config = libamy.config()
+    OSCS = config["oscs"]
+    BLOCK_SIZE = config["block_size"]
+
+def stop():
+    global local_amy, local_amy_live, OSCS, BLOCK_SIZE
+    if(local_amy is None): return
+    if(local_amy_live): local_amy.live_stop()
+    local_amy.stop()
+    local_amy = None
+    local_amy_live = False
+    render_backlog.clear()
+    OSCS = ALLES_OSCS
+    BLOCK_SIZE = ALLES_BLOCK_SIZE
+
+# The arrays render() renders into, grown as needed and reused so rendering in a loop doesn't allocate
+render_buffers = {}
+# Audio rendered ahead to make room in a local AMY's queue, that render() hasn't returned yet
+render_backlog = []
+RENDER_AHEAD_S = 0.01
+
+# Render the next seconds of the local AMY as a numpy array of int16 samples, or float32 from -1 to 1.
+# The array is reused by the next render(), copy it to keep it
+def render(seconds, dtype='int16'):
+    import numpy as np
+    if(local_amy is None):
+        raise RuntimeError("no local AMY, call alles.start() first")
+    count = int(seconds * SAMPLE_RATE)
+    samples = render_array(np.int16, count)
+    done = 0
+    while(done < count and len(render_backlog)):
+        ahead = render_backlog[0]
+        n = min(len(ahead), count - done)
+        samples[done:done + n] = ahead[:n]
+        if(n == len(ahead)):
+            render_backlog.pop(0)
+        else:
+            render_backlog[0] = ahead[n:]
+        done = done + n
+    if(done < count):
+        # Half a sample over so the seconds come back to exactly count - done samples
+        local_amy.render((count - done + 0.5) / SAMPLE_RATE, samples[done:])
+    if(np.dtype(dtype) == np.float32):
+        return np.multiply(samples, 1.0/32768.0, out=render_array(np.float32, count))
+    return samples
+
+def render_ahead():
+    # Render RENDER_AHEAD_S more of the local AMY into render_backlog
+    import numpy as np
+    render_backlog.append(np.frombuffer(local_amy.render(RENDER_AHEAD_S), dtype=np.int16))
+
+def render_array(dtype, count):
+    # The first count items of the reused array of dtype
+    import numpy as np
+    a = render_buffers.get(dtype)
+    if(a is None or len(a) < count):
+        a = np.empty(count, dtype=dtype)
+        render_buffers[dtype] = a
+    return a[:count]
+
+# Play rendered samples out the speakers
+def play(samples):
+    import sounddevice as sd
+    sd.play(samples, int(SAMPLE_RATE))
+
 
 """
     Run a scale through all the synth's sounds
@@ -181,29 +920,35 @@ def test():
 def play_patches(wait=0.500, patch_total = 100, **kwargs):
     once = True
     patch_count = 0
+    s = Scheduler()
+    t = s.start
     while True:
         for i in range(24):
             patch = patch_count % patch_total
             patch_count = patch_count + 1
-            send(osc=i % OSCS, note=i+50, wave=ALGO, patch=patch, vel=1, **kwargs)
-            time.sleep(wait)
-            send(osc=i % OSCS, vel=0)
+            s.at(t, osc=i % OSCS, note=i+50, wave=ALGO, patch=patch, vel=1, **kwargs)
+            t = t + wait * 1000
+            s.at(t, osc=i % OSCS, vel=0)
+            s.wait(t)
 
 """
     Play up to ALLES_OSCS patches at once
 """
 def polyphony(max_voices=OSCS,**kwargs):
     note = 0
-    oscs = []
-    for i in range(int(max_voices/2)):
-        oscs.append(int(i))
-        oscs.append(int(i+(OSCS/2)))
-    print(str(oscs))
+    # ALGO voices take ALGO_OSCS oscs each
+    size = ALGO_OSCS if kwargs.get("wave", -1) == ALGO else 1
+    voices = VoiceAllocator(clients=[-1], oscs=min(OSCS, max_voices * size))
+    s = Scheduler()
+    t = s.start
     while(1):
-        osc = oscs[note % max_voices]
-        print("osc %d note %d filter %f " % (osc, 30+note, note*50))
-        send(osc=osc, **kwargs, patch=note, filter_type=FILTER_NONE, filter_freq=note*50, note=30+(note), client = -1, vel=1)
-        time.sleep(0.5)
+        voice = voices.note_on(oscs=size, t=t)
+        for stolen in voice.stolen:
+            s.at(t, osc=stolen.osc, client=-1, vel=0)
+        print("osc %d note %d filter %f " % (voice.osc, 30+note, note*50))
+        s.at(t, osc=voice.osc, **kwargs, patch=note, filter_type=FILTER_NONE, filter_freq=note*50, note=30+(note), client = -1, vel=1)
+        t = t + 500
+        s.wait(t)
         note =(note + 1) % 64
 
 def eq_test():
@@ -223,13 +968,16 @@ def eq_test():
 def sweep(speed=0.100, res=0.5, loops = -1):
     end = 2000
     cur = 0
+    s = Scheduler()
+    t = s.start
     while(loops != 0):
         for i in [0, 1, 4, 5, 1, 3, 4, 5]:
             cur = (cur + 100) % end
-            send(osc=0,filter_type=FILTER_LPF, filter_freq=cur+250, resonance=res, wave=PULSE, note=50+i, duty=0.50, vel=1)
-            send(osc=1,filter_type=FILTER_LPF, filter_freq=cur+500, resonance=res, wave=PULSE, note=50+12+i, duty=0.25, vel=1)
-            send(osc=2,filter_type=FILTER_LPF, filter_freq=cur, resonance=res, wave=PULSE, note=50+6+i, duty=0.90, vel=1)
-            time.sleep(speed)
+            s.at(t, osc=0,filter_type=FILTER_LPF, filter_freq=cur+250, resonance=res, wave=PULSE, note=50+i, duty=0.50, vel=1)
+            s.at(t, osc=1,filter_type=FILTER_LPF, filter_freq=cur+500, resonance=res, wave=PULSE, note=50+12+i, duty=0.25, vel=1)
+            s.at(t, osc=2,filter_type=FILTER_LPF, filter_freq=cur, resonance=res, wave=PULSE, note=50+6+i, duty=0.90, vel=1)
+            t = t + speed * 1000
+            s.wait(t)
 
 """
     An example drum machine using osc+PCM presets
@@ -244,24 +992,29 @@ def drums(bpm=120, loops=-1, **kwargs):
     [bass, snare, hat, cow, hicow, silent] = [1, 2, 4, 8, 16, 32]
     pattern = [bass+hat, hat+hicow, bass+hat+snare, hat+cow, hat, hat+bass, snare+hat, hat]
     bassline = [50, 0, 0, 0, 50, 52, 51, 0]
+    # Eighth notes
+    s = Scheduler(bpm=bpm*2)
+    step = 0
     while (loops != 0):
         loops = loops - 1
         for i,x in enumerate(pattern):
             if(x & bass): 
-                send(osc=0, vel=4, **kwargs)
+                s.beat(step, osc=0, vel=4, **kwargs)
             if(x & snare):
-                send(osc=2, vel=1.5)
+                s.beat(step, osc=2, vel=1.5)
             if(x & hat): 
-                send(osc=3, vel=1)
+                s.beat(step, osc=3, vel=1)
             if(x & cow): 
-                send(osc=4, vel=1)
+                s.beat(step, osc=4, vel=1)
             if(x & hicow): 
-                send(osc=5, vel=1)
+                s.beat(step, osc=5, vel=1)
             if(bassline[i]>0):
-                send(osc=7, vel=0.5, note=bassline[i]-12, **kwargs)
+                s.beat(step, osc=7, vel=0.5, note=bassline[i]-12, **kwargs)
             else:
-                send(vel=0, osc=7, **kwargs)
-            time.sleep(1.0/(bpm*2/60))
+                s.beat(step, vel=0, osc=7, **kwargs)
+            step = step + 1
+            s.wait(s.time_of(step))
+    s.wait()
 
 
 """
@@ -355,11 +1108,14 @@ def decode_battery_mask(mask):
 
 def sync(count=10, delay_ms=100):
     global sock
-    import re
     # Sends sync packets to all the listeners so they can correct / get the time
+    # If sync_start() is running it owns the replies, so this just returns its client table
+    if(sync_thread is not None):
+        return sync_clients()
     clients = {}
     client_map = {}
     battery_map = {}
+    telemetry_map = {}
     start_time = millis()
     last_sent = 0
     time_sent = {}
@@ -374,16 +1130,21 @@ def sync(count=10, delay_ms=100):
             sock.sendto(output.encode('ascii'), get_multicast_group())
             i = i + 1
             last_sent = tic
+        # Sleep until a reply comes in or the next sync is due
+        select.select([sock], [], [], max(0, delay_ms - (millis() - start_time - last_sent)) / 1000.0)
         try:
             data, address = sock.recvfrom(1024)
             data = data.decode('ascii')
             #print("received %s from %s" % (data, address))
             if(data[0] == '_'):
                 data = data[:-1]
-                try:
-                    [_, client_time, sync_index, client_id, ipv4, battery] = re.split(r'[sicry]',data)
-                except ValueError:
+                reply = parse_sync_reply(data)
+                if(reply is None):
                     print("What! %s" % (data))
+                    continue
+                [client_time, sync_index, client_id, ipv4, battery, telemetry] = reply
+                if(telemetry is not None):
+                    telemetry_map[ipv4] = telemetry
                 if(int(sync_index) <= i): # skip old ones from a previous run
                     #print ("recvd at %d:  %s %s %s %s" % (millis(), client_time, sync_index, client_id, ipv4))
                     # ping sets client index to -1, so make sure this is a sync response 
@@ -391,7 +1152,9 @@ def sync(count=10, delay_ms=100):
                         client_map[int(ipv4)] = int(client_id)
                         battery_map[int(ipv4)] = battery
                         rtt[int(ipv4)] = rtt.get(int(ipv4), {})
-                        rtt[int(ipv4)][int(sync_index)] = millis()-time_sent[int(sync_index)]
+                        received = millis()
+                        rtt[int(ipv4)][int(sync_index)] = received-time_sent[int(sync_index)]
+                        clock_sample(int(client_id), int(ipv4), time_sent[int(sync_index)], received, int(client_time))
         except socket.error:
             pass
 
@@ -413,10 +1176,187 @@ def sync(count=10, delay_ms=100):
         clients[client_map[ipv4]]["avg_rtt"] = float(total_rtt_ms) / float(hit) # todo compute std.dev
         clients[client_map[ipv4]]["ipv4"] = ipv4
         clients[client_map[ipv4]]["battery"] = decode_battery_mask(int(battery_map[ipv4]))
+        clients[client_map[ipv4]]["offset"], clients[client_map[ipv4]]["drift_ppm"] = clock_offset(ipv4)
+        clients[client_map[ipv4]].update(telemetry_map.get(ipv4, {}))
     # Return this as a map for future use
     return clients
 
 
+"""
+    Background sync. sync_start() sends a sync every interval_ms and keeps a live table of the clients from their
+    replies and pings, sync_clients() reads it without waiting on the network
+"""
+sync_interval_ms = 1000
+sync_window = 10 # reliability and avg_rtt are over this many of the last syncs
+sync_thread = None
+sync_running = False
+sync_lock = threading.Lock()
+sync_sent = {} # sync index -> millis() it was sent
+sync_seen = {} # ipv4 -> {"client", "battery", "last_seen", "last_rtt", "rtt": {sync index: ms}, "telemetry"}
+sync_table = {} # what sync_clients() returns, swapped for a new dict on every update and never changed after
+
+def parse_sync_reply(data):
+    # A _s<time>i<index>c<client>r<ipv4>y<battery>q<qsize>d<drops>l<late>u<load %>m<peak load %>Z reply or ping as
+    # (time, index, client, ipv4, battery, telemetry), or None. telemetry is None from synths too old to send it
+    m = re.match(r'_s(-?\d+)i(-?\d+)c(-?\d+)r(\d+)y(\d+)(?:q(\d+)d(\d+)l(\d+)u(\d+)m(\d+))?Z?$', data)
+    if m is None: return None
+    g = m.groups()
+    telemetry = None
+    if(g[5] is not None):
+        telemetry = {"qsize": int(g[5]), "drops": int(g[6]), "late": int(g[7]),
+            "render_load": int(g[8]) / 100.0, "render_peak": int(g[9]) / 100.0}
+    return tuple(map(int, g[:5])) + (telemetry,)
+
+def sync_start(interval_ms=1000, window=10):
+    global sync_thread, sync_running, sync_interval_ms, sync_window
+    with sync_lock:
+        sync_interval_ms = interval_ms
+        sync_window = window
+        if(sync_thread is None):
+            sync_running = True
+            sync_thread = threading.Thread(target=sync_task, daemon=True)
+            sync_thread.start()
+
+def sync_stop():
+    global sync_thread, sync_running
+    with sync_lock:
+        sync_running = False
+        if(sync_thread is not None):
+            sync_thread.join()
+        sync_thread = None
+
+def sync_clients():
+    # The clients seen by sync_start(), keyed by client id like sync(). Each has ipv4, battery, reliability, avg_rtt
+    # and rtt (the latest, in ms) and last_seen (its millis()), and from its latest reply or ping qsize, drops, late,
+    # render_load and render_peak, see parse_sync_reply(). Synths that haven't been heard from for two of their 10s
+    # pings are gone from it. Don't change what it returns, it is shared
+    return sync_table
+
+def sync_task():
+    # Background thread for sync_start(). Synths only keep the index as an int8, so it goes around at 128
+    index = 0
+    next_send = time.monotonic()
+    while(sync_running):
+        now = time.monotonic()
+        if(now >= next_send):
+            sent = millis()
+            sync_sent[index] = sent
+            # Replies to the last sync with this index are too old to count now
+            for seen in sync_seen.values():
+                seen["rtt"].pop(index, None)
+            get_sock().sendto(("s%di%dZ" % (sent, index)).encode('ascii'), get_multicast_group())
+            index = (index + 1) % 128
+            next_send = now + sync_interval_ms / 1000.0
+            sync_update()
+        if(select.select([get_sock()], [], [], max(0, next_send - time.monotonic()))[0]):
+            # Take everything that came in at once
+            while 1:
+                try:
+                    data, address = get_sock().recvfrom(1024)
+                except socket.error:
+                    break
+                reply = parse_sync_reply(data.decode('latin-1'))
+                if(reply is not None):
+                    sync_reply(*reply)
+            sync_update()
+
+def sync_reply(client_time, index, client, ipv4, battery, telemetry=None):
+    # Note a sync reply (or a ping, whose index is -1) from a synth
+    now = millis()
+    seen = sync_seen.setdefault(ipv4, {"rtt": {}, "last_rtt": None, "telemetry": {}})
+    seen["client"] = client
+    seen["battery"] = battery
+    seen["last_seen"] = now
+    if(telemetry is not None):
+        seen["telemetry"] = telemetry
+    if(index >= 0 and index in sync_sent):
+        seen["rtt"][index] = now - sync_sent[index]
+        seen["last_rtt"] = seen["rtt"][index]
+        clock_sample(client, ipv4, sync_sent[index], now, client_time)
+
+def sync_update():
+    # Recompute sync_table from what's come in
+    global sync_table
+    now = millis()
+    # Syncs sent long enough ago to have had their replies, newest first
+    settled = sorted([i for i in sync_sent if now - sync_sent[i] > ALLES_LATENCY_MS], key=lambda i: -sync_sent[i])
+    settled = settled[:sync_window]
+    table = {}
+    for ipv4 in list(sync_seen.keys()):
+        seen = sync_seen[ipv4]
+        if(now - seen["last_seen"] > ALLES_PING_TIME_MS * 2):
+            del sync_seen[ipv4]
+            continue
+        rtts = [seen["rtt"][i] for i in settled if i in seen["rtt"]]
+        (offset, drift_ppm) = clock_offset(ipv4)
+        table[seen["client"]] = {
+            "ipv4": ipv4,
+            "battery": decode_battery_mask(seen["battery"]),
+            "reliability": float(len(rtts)) / len(settled) if len(settled) else 0.0,
+            "avg_rtt": float(sum(rtts)) / len(rtts) if len(rtts) else None,
+            "rtt": seen["last_rtt"],
+            "last_seen": seen["last_seen"],
+            "offset": offset,
+            "drift_ppm": drift_ppm,
+        }
+        table[seen["client"]].update(seen["telemetry"])
+    sync_table = table
+
+
+"""
+    Clock estimation. Every sync reply is a sample of a synth's clock against ours, like NTP: it was read somewhere
+    in the round trip, so its offset from us is its time minus the middle of the round trip, give or take half
+    the round trip. The samples with the shortest round trips are the best ones, and a line through them gives
+    the offset now and how fast the synth's crystal drifts from ours
+"""
+clock_history = 300 # samples kept per synth, five minutes of sync_start()
+clock_lock = threading.Lock()
+clock_samples = {} # ipv4 -> [(host ms in the middle of the round trip, synth ms - that, round trip ms)]
+clock_models = {} # ipv4 -> (host ms, offset then, drift in ms per ms)
+clock_ipv4 = {} # client id -> ipv4
+
+def clock_sample(client, ipv4, sent, received, client_time):
+    # A synth answered the sync we sent at host time sent, with its clock at client_time, and we got it at received
+    middle = (sent + received) / 2.0
+    with clock_lock:
+        samples = clock_samples.setdefault(ipv4, [])
+        samples.append((middle, client_time - middle, received - sent))
+        del samples[:-clock_history]
+        clock_ipv4[client] = ipv4
+        clock_models[ipv4] = clock_fit(samples)
+
+def clock_fit(samples):
+    # Least squares line through the quarter of the samples with the shortest round trips, as (host ms, offset, drift)
+    best = sorted(samples, key=lambda s: s[2])[:max(2, len(samples) // 4)]
+    mean_t = sum([s[0] for s in best]) / len(best)
+    mean_offset = sum([s[1] for s in best]) / len(best)
+    var = sum([(s[0] - mean_t) ** 2 for s in best])
+    if(var == 0):
+        return (mean_t, mean_offset, 0.0)
+    return (mean_t, mean_offset, sum([(s[0] - mean_t) * (s[1] - mean_offset) for s in best]) / var)
+
+def clock_offset(ipv4, t=None):
+    # A synth's estimated clock minus ours at host time t (default now) in ms, and its drift in ppm. (None, None) if
+    # we haven't heard from it
+    with clock_lock:
+        model = clock_models.get(ipv4)
+    if model is None: return (None, None)
+    if t is None: t = millis()
+    (t0, offset, drift) = model
+    return (offset + drift * (t - t0), drift * 1e6)
+
+def host_to_synth_time(client, t):
+    # What this client's own clock will read at host time t, to send as synth_time (k). Synths take a timestamp as
+    # host time through the computed_delta of whichever sync reached them last, from any host, which was off by
+    # that sync's trip across the network and drifts until the next one. A synth_time skips computed_delta, so none
+    # of that matters. None for clients we haven't had a sync reply from, and broadcast messages (client -1)
+    with clock_lock:
+        model = clock_models.get(clock_ipv4.get(client))
+    if model is None: return None
+    (t0, offset, drift) = model
+    return t + offset + drift * (t - t0)
+
+
 
 def battery_test():
     tic = time.time()
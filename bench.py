@@ -0,0 +1,385 @@
+# bench.py
+# Micro-benchmarks for the host side of alles. Run one with e.g. python -c "import bench; bench.message_rate()"
+import alles, time, random
+
+
+# The message() encoder as it was before it became table driven, kept to compare speed and output against
+def legacy_message(osc=0, wave=-1, patch=-1, note=-1, vel=-1, amp=-1, freq=-1, duty=-1, feedback=-1, timestamp=None, reset=-1, phase=-1, \
+        client=-1, retries=1, volume=-1, filter_freq = -1, resonance = -1, bp0="", bp1="", bp2="", bp0_target=-1, bp1_target=-1, bp2_target=-1, mod_target=-1, \
+        debug=-1, mod_source=-1, eq_l = -1, eq_m = -1, eq_h = -1, filter_type= -1, algorithm=-1, ratio = -1, detune = -1, algo_source=None):
+    def trunc(number):
+        return ('%.10f' % number).rstrip('0').rstrip('.')
+    m = ""
+    if(timestamp is None): timestamp = alles.millis()
+    m = m + "t" + trunc(timestamp)
+    if(osc>=0): m = m + "v" + trunc(osc)
+    if(wave>=0): m = m + "w" + trunc(wave)
+    if(duty>=0): m = m + "d" + trunc(duty)
+    if(feedback>=0): m = m + "b" + trunc(feedback)
+    if(freq>=0): m = m + "f" + trunc(freq)
+    if(note>=0): m = m + "n" + trunc(note)
+    if(patch>=0): m = m + "p" + trunc(patch)
+    if(phase>=0): m = m + "P" + trunc(phase)
+    if(detune>=0): m = m + "u" + trunc(detune)
+    if(client>=0): m = m + "c" + trunc(client)
+    if(amp>=0): m = m + "a" + trunc(amp)
+    if(vel>=0): m = m + "l" + trunc(vel)
+    if(volume>=0): m = m + "V" + trunc(volume)
+    if(resonance>=0): m = m + "R" + trunc(resonance)
+    if(filter_freq>=0): m = m + "F" + trunc(filter_freq)
+    if(ratio>=0): m = m + "I" + trunc(ratio)
+    if(algorithm>=0): m = m + "o" + trunc(algorithm)
+    if(len(bp0)): m = m +"A%s" % (bp0)
+    if(len(bp1)): m = m +"B%s" % (bp1)
+    if(len(bp2)): m = m +"C%s" % (bp2)
+    if(algo_source is not None): m = m +"O%s" % (algo_source)
+    if(bp0_target>=0): m = m + "T" +trunc(bp0_target)
+    if(bp1_target>=0): m = m + "W" +trunc(bp1_target)
+    if(bp2_target>=0): m = m + "X" +trunc(bp2_target)
+    if(mod_target>=0): m = m + "g" + trunc(mod_target)
+    if(mod_source>=0): m = m + "L" + trunc(mod_source)
+    if(reset>=0): m = m + "S" + trunc(reset)
+    if(debug>=0): m = m + "D" + trunc(debug)
+    if(eq_l>=0): m = m + "x" + trunc(eq_l)
+    if(eq_m>=0): m = m + "y" + trunc(eq_m)
+    if(eq_h>=0): m = m + "z" + trunc(eq_h)
+    if(filter_type>=0): m = m + "G" + trunc(filter_type)
+    return m+'Z'
+
+
+# A mix of the kinds of messages the examples send: notes, note offs, presets and partials breakpoints
+def example_messages(count=1000, seed=0):
+    r = random.Random(seed)
+    ts = alles.millis()
+    msgs = []
+    for i in range(count):
+        ts = ts + r.randint(0, 20)
+        which = i % 4
+        if(which == 0):
+            msgs.append({"osc":r.randint(0, 63), "wave":alles.ALGO, "note":r.randint(30, 90), "patch":r.randint(0, 127), "vel":1, "timestamp":ts})
+        elif(which == 1):
+            msgs.append({"osc":r.randint(0, 63), "vel":0, "timestamp":ts})
+        elif(which == 2):
+            msgs.append({"osc":r.randint(0, 63), "wave":alles.SAW, "filter_freq":2500, "resonance":5, "filter_type":alles.FILTER_LPF, \
+                "bp0":"100,0.5,25,0", "bp0_target":alles.TARGET_AMP+alles.TARGET_FILTER_FREQ, "timestamp":ts})
+        else:
+            msgs.append({"timestamp":ts + r.random(), "osc":r.randint(0, 63), "wave":alles.PARTIAL, "amp":r.random(), "freq":r.uniform(20, 8000), \
+                "feedback":r.random(), "bp0":"40,%s,0,0" % alles.trunc(r.random()), "bp1":"40,%s,0,0" % alles.trunc(r.uniform(0.9, 1.1)), "bp2":"", \
+                "bp0_target":alles.TARGET_AMP+alles.TARGET_LINEAR, "bp1_target":alles.TARGET_FREQ+alles.TARGET_LINEAR, \
+                "bp2_target":alles.TARGET_FEEDBACK+alles.TARGET_LINEAR, "vel":r.choice([-1, 0, r.random()]), "phase":r.choice([-1, r.random()])})
+    return msgs
+
+def rate(fn, msgs, repeat=5):
+    # Best messages/sec of a few runs of fn over msgs
+    best = 0
+    for i in range(repeat):
+        tic = time.perf_counter()
+        for m in msgs:
+            fn(**m)
+        best = max(best, len(msgs) / (time.perf_counter() - tic))
+    return best
+
+def message_rate(count=20000):
+    # Messages/sec of the old and new message() encoders, after checking they write the same bytes
+    msgs = example_messages(count)
+    for m in msgs:
+        if(alles.message(**m) != legacy_message(**m)):
+            raise ValueError("message() differs from legacy_message() for %s" % (m))
+    before = rate(legacy_message, msgs)
+    after = rate(alles.message, msgs)
+    print("message(): %d msgs/sec before, %d msgs/sec after (%2.2fx)" % (before, after, after/before))
+    return (before, after)
+
+def send_many_rate(count=20000):
+    # Events/sec encoding a partials-like score with message() one at a time vs. encode_many() over a structured array,
+    # and how many datagrams send() vs. send_many() would use for it
+    import numpy as np
+    r = np.random.RandomState(0)
+    events = np.zeros(count, dtype=[("timestamp", "i8"), ("osc", "i4"), ("wave", "i4"), ("freq", "f8"), ("amp", "f8"), \
+        ("vel", "f8"), ("bp0", "U32"), ("bp0_target", "i4")])
+    events["timestamp"] = alles.millis() + np.cumsum(r.randint(0, 5, count))
+    events["osc"] = r.randint(0, alles.OSCS, count)
+    events["wave"] = alles.PARTIAL
+    events["freq"] = r.uniform(20, 8000, count)
+    events["amp"] = r.uniform(0, 1, count)
+    events["vel"] = np.where(r.uniform(0, 1, count) > 0.9, r.uniform(0, 1, count), -1)
+    events["bp0"] = ["40,%s,0,0" % alles.trunc(a) for a in r.uniform(0.5, 1.5, count)]
+    events["bp0_target"] = alles.TARGET_AMP + alles.TARGET_LINEAR
+    dicts = [dict(zip(events.dtype.names, e.tolist())) for e in events]
+    tic = time.perf_counter()
+    one_at_a_time = [alles.message(**d) for d in dicts]
+    before = count / (time.perf_counter() - tic)
+    tic = time.perf_counter()
+    batch = alles.encode_many(events)
+    datagrams = alles.pack(batch)
+    after = count / (time.perf_counter() - tic)
+    if(batch != one_at_a_time):
+        raise ValueError("encode_many() differs from message()")
+    print("encode: %d events/sec one at a time, %d events/sec batched (%2.2fx). %d datagrams instead of %d" % \
+        (before, after, after/before, len(datagrams), count))
+    return (before, after)
+
+def binary_size(count=20000):
+    # Bytes per message and messages per datagram of the example messages as ASCII and as binary
+    msgs = example_messages(count)
+    ascii = [alles.message(**m) for m in msgs]
+    binary = [alles.binary_message(**m) for m in msgs]
+    binary = [a if b is None else b.decode('latin-1') for (a, b) in zip(ascii, binary)]
+    for (name, encoded) in (("ascii", ascii), ("binary", binary)):
+        print("%s: %2.1f bytes/message, %2.1f messages/datagram" % (name, sum(map(len, encoded)) / count, count / len(alles.pack(encoded))))
+
+def queue_rate(count=30000, repeat=5):
+    # ns per add and per play of the AMY event queue for count deltas at random times. Needs libamy, see main/amy/setup.py
+    import libamy
+    results = [libamy.queue_benchmark(count, seed) for seed in range(repeat)]
+    add = min([r[0] for r in results])
+    pop = min([r[1] for r in results])
+    print("event queue: %2.1f ns/insert, %2.1f ns/pop for %d deltas" % (add, pop, count))
+    return (add, pop)
+
+def render_rate(seconds=10, threads=(1, 2, 4), voices=64):
+    # How much faster than real time a local AMY renders voices filtered saw notes with each number of render threads
+    import libamy
+    import numpy as np
+    results = {}
+    for t in threads:
+        alles.start(immediate=False, render_threads=t)
+        for osc in range(0, voices):
+            alles.send(osc=osc, wave=alles.SAW, filter_type=alles.FILTER_LPF, filter_freq=2000, resonance=2, \
+                note=30 + osc % 48, vel=0.1, timestamp=0)
+        alles.render(0.1)
+        tic = time.perf_counter()
+        alles.render(seconds)
+        results[t] = seconds / (time.perf_counter() - tic)
+        alles.stop()
+        print("%d render threads: %2.1fx real time" % (t, results[t]))
+    return results
+
+def onset_error(count=1000, seed=0, spacing_ms=50):
+    # Samples between where count notes at random fractional ms times should start and where a local AMY starts them.
+    # Each note is a short saw, silent before it, so its onset is its first nonzero sample
+    import numpy as np
+    r = random.Random(seed)
+    alles.start(immediate=False)
+    config = alles.local_amy.config()
+    rate = config["sample_rate"]
+    # The first message sets the time base, host time start_ms is our sample 0 plus the latency
+    start_ms = 1000.0
+    alles.send(osc=0, vel=0, timestamp=start_ms)
+    latency = (config["latency_ms"] * rate) // 1000
+    expected = []
+    for i in range(count):
+        t = start_ms + spacing_ms * (i + 1) + r.uniform(0, spacing_ms / 2)
+        alles.send(osc=0, wave=alles.SAW, note=60, vel=1, timestamp=t)
+        alles.send(osc=0, vel=0, timestamp=t + spacing_ms / 4)
+        expected.append(int(t * rate / 1000.0) - int(start_ms * rate / 1000.0) + latency)
+    samples = alles.render((spacing_ms * (count + 2)) / 1000.0 + config["latency_ms"] / 1000.0)
+    alles.stop()
+    # Look from an eighth of a spacing before where each should start, which is always after the last one's note off
+    before = int(spacing_ms * rate / 8000)
+    errors = []
+    for e in expected:
+        errors.append(int(np.flatnonzero(samples[e - before:])[0]) - before)
+    errors = np.array(errors)
+    print("onset error over %d notes: mean %2.2f samples, max %d samples, %d%% within one sample" % \
+        (count, np.mean(np.abs(errors)), np.max(np.abs(errors)), 100 * np.mean(np.abs(errors) <= 1)))
+    return errors
+
+def wave_cost(seconds=3, voices=64):
+    # Render time of voices notes of each wave on a local AMY, next to SINE, for alles.WAVE_COST. ALGO is per voice
+    # of ALGO_OSCS oscs. PCM and PARTIALS play out too soon to time this way, they are costed like PARTIAL
+    waves = (("SINE", alles.SINE, 1), ("PULSE", alles.PULSE, 1), ("SAW", alles.SAW, 1), ("TRIANGLE", alles.TRIANGLE, 1), \
+        ("NOISE", alles.NOISE, 1), ("KS", alles.KS, 1), ("ALGO", alles.ALGO, alles.ALGO_OSCS), ("PARTIAL", alles.PARTIAL, 1))
+    times = {}
+    for (name, wave, size) in waves:
+        alles.start(immediate=False, oscs=voices * size)
+        for osc in range(0, voices * size, size):
+            alles.send(osc=osc, wave=wave, patch=5 if wave == alles.ALGO else -1, note=50 + osc % 20, vel=0.01, timestamp=0)
+        alles.render(0.05)
+        tic = time.perf_counter()
+        alles.render(seconds)
+        times[name] = time.perf_counter() - tic
+        alles.stop()
+    for (name, wave, size) in waves:
+        print("%s: %2.2f" % (name, times[name] / times["SINE"]))
+    return dict([(name, times[name] / times["SINE"]) for name in times])
+
+def render_profile(seconds=3, voices=16):
+    # Render time per sample of each wave from libamy's render profiling (build with AMY_PROFILE=1), next to SINE.
+    # Times only while each osc is audible, so unlike wave_cost() it can cost PCM too. ALGO is per voice
+    import libamy
+    waves = (("SINE", alles.SINE, 1), ("PULSE", alles.PULSE, 1), ("SAW", alles.SAW, 1), ("TRIANGLE", alles.TRIANGLE, 1), \
+        ("NOISE", alles.NOISE, 1), ("KS", alles.KS, 1), ("PCM", alles.PCM, 1), ("ALGO", alles.ALGO, alles.ALGO_OSCS), \
+        ("PARTIAL", alles.PARTIAL, 1))
+    alles.start(immediate=False, oscs=voices * sum([size for (name, wave, size) in waves]))
+    osc = 0
+    for (name, wave, size) in waves:
+        for v in range(voices):
+            alles.send(osc=osc, wave=wave, patch=5 if wave == alles.ALGO else v, note=50 + v, vel=0.01, timestamp=0)
+            osc = osc + size
+    alles.render(0.05)
+    libamy.profile(True)
+    alles.render(seconds)
+    profile = libamy.profile(False)
+    alles.stop()
+    costs = {}
+    for (name, stats) in profile["waves"].items():
+        costs[name] = float(stats["hold_and_modify"] + stats["render"] + stats["filter"]) / stats["samples"]
+    for name in costs:
+        print("%s: %2.2f (%d renders)" % (name, costs[name] / costs["SINE"], profile["waves"][name]["renders"]))
+    return dict([(name, costs[name] / costs["SINE"]) for name in costs])
+
+def example_breakpoints(seconds=10, hop_ms=40, partials_at_once=120, seed=0):
+    # Breakpoints like loris makes for sequence(): partials_at_once partials going at any time, each a run of
+    # breakpoints hop_ms apart lasting 0.1 to 2 seconds, as [ms, partial_idx, freq, amp, bw, phase]
+    r = random.Random(seed)
+    breakpoints = []
+    partial_idx = 0
+    for slot in range(partials_at_once):
+        t = r.randint(0, 2000)
+        while(t < seconds * 1000):
+            count = r.randint(3, 50)
+            freq = r.uniform(50, 8000)
+            for bp_idx in range(count):
+                phase = -1
+                if(bp_idx == count - 1): phase = -2
+                if(bp_idx == 0): phase = r.random()
+                breakpoints.append([t + bp_idx * hop_ms, partial_idx, freq * r.uniform(0.99, 1.01), r.uniform(0.001, 0.1), \
+                    r.uniform(0, 1), phase])
+            partial_idx = partial_idx + 1
+            t = t + count * hop_ms + r.randint(0, 500)
+    return breakpoints
+
+# partials.link() as it was, scanning forward for each breakpoint's next one, to compare speed and output against
+def legacy_link(breakpoints, max_oscs=alles.OSCS):
+    from collections import deque
+    time_ordered = sorted(breakpoints, key=lambda x:x[0])
+    first_time = time_ordered[0][0]
+    sequence = []
+    min_q_len = max_oscs
+    osc_map = {}
+    osc_q = deque(range(max_oscs)) 
+    for i,s in enumerate(time_ordered):
+        next_idx = -1
+        time_delta, amp_delta, freq_delta, bw_delta = (0,0,0,0)
+        if(s[5] != -2):
+            next_idx = i+1
+            while(time_ordered[next_idx][1] != s[1]):
+                next_idx = next_idx + 1
+            n = time_ordered[next_idx]
+            time_delta = n[0] - s[0]
+            amp_delta = n[3]/s[3]
+            freq_delta = n[2]/s[2]
+            if(s[4]>0):
+                bw_delta = n[4]/s[4]
+            else:
+                bw_delta = 0
+        s.append(time_delta)
+        s.append(amp_delta)
+        s.append(freq_delta)
+        s.append(bw_delta)
+        s[0] = s[0] - first_time
+        if(s[5]>=0):
+            if(len(osc_q)):
+                osc_map[s[1]] = osc_q.popleft()
+                s[1] = osc_map[s[1]]
+                sequence.append(s)
+        else:
+            osc = osc_map.get(s[1], None)
+            if(osc is not None):
+                s[1] = osc_map[s[1]]
+                sequence.append(s)
+                if(s[5] == -2):
+                    osc_q.appendleft(osc)
+        if(len(osc_q) < min_q_len): min_q_len = len(osc_q)
+    return (sequence, first_time, min_q_len)
+
+def link_rate(lengths=(10, 60, 300), legacy_max_s=60):
+    # Seconds partials.link() takes on example_breakpoints() lengths seconds long. Up to legacy_max_s it also times
+    # the old forward scan and checks they make the same sequence without stealing, past that the old one takes minutes
+    import copy
+    import partials
+    import numpy as np
+    results = {}
+    for seconds in lengths:
+        breakpoints = example_breakpoints(seconds)
+        tic = time.perf_counter()
+        linked = partials.link(breakpoints, steal=False)
+        results[seconds] = time.perf_counter() - tic
+        line = "%ds, %d breakpoints: %2.2fs" % (seconds, len(breakpoints), results[seconds])
+        if(seconds <= legacy_max_s):
+            tic = time.perf_counter()
+            legacy = legacy_link(copy.deepcopy(breakpoints))
+            line = line + ", was %2.2fs" % (time.perf_counter() - tic)
+            legacy_sequence = np.array([tuple(s) for s in legacy[0]], dtype=partials.SEQUENCE_DTYPE)
+            if(legacy[1:] != linked[1:3] or len(legacy_sequence) != len(linked[0]) or not np.all(legacy_sequence == linked[0])):
+                raise AssertionError("partials.link() made a different sequence than it used to")
+        print(line)
+    return results
+
+def stealing(seconds=10, max_oscs=(16, 32, 64)):
+    # How much of the energy of example_breakpoints() partials.link() loses at each of max_oscs, dropping new partials
+    # when they're all busy like it used to next to stealing them from quieter ones
+    import partials
+    breakpoints = example_breakpoints(seconds)
+    results = {}
+    for oscs in max_oscs:
+        for steal in (False, True):
+            report = partials.link(breakpoints, max_oscs=oscs, steal=steal)[3]
+            results[(oscs, steal)] = report["dropped_energy"] / report["energy"]
+            print("%d oscs, %s: dropped %d of %d partials, stole %d oscs, lost %2.2f%% of the energy" % (oscs, \
+                "stealing" if steal else "dropping", report["dropped"], report["partials"], report["stolen"], 100.0 * results[(oscs, steal)]))
+    return results
+
+def compile_rate(seconds=10, replays=((1, 1), (1.5, 0.5), (0.75, 2))):
+    # Seconds partials.compile_sequence() takes to make the datagrams for example_breakpoints() seconds long at each
+    # (time_ratio, pitch_ratio) of replays, from one link()
+    import partials
+    sequence = partials.link(example_breakpoints(seconds))[0]
+    results = {}
+    for (time_ratio, pitch_ratio) in replays:
+        tic = time.perf_counter()
+        datagrams = partials.compile_sequence(sequence, time_ratio=time_ratio, pitch_ratio=pitch_ratio)
+        results[(time_ratio, pitch_ratio)] = time.perf_counter() - tic
+        print("time_ratio %2.2f, pitch_ratio %2.2f: %d breakpoints in %d datagrams, %2.3fs" % (time_ratio, pitch_ratio, \
+            len(sequence), len(datagrams), results[(time_ratio, pitch_ratio)]))
+    return results
+
+def extract_time(filename, max_len_s=60, freq_res=10, analysis_window=100, amp_floor=-30, freq_drift=20, hop_time=0.04):
+    # Seconds loris takes to analyze filename like partials.sequence() does, next to pulling the breakpoints out of
+    # its PartialList with partials.breakpoints() and linking them
+    import partials, loris, pydub
+    import numpy as np
+    audio = pydub.AudioSegment.from_file(filename)[:int(max_len_s*1000.0)]
+    y = np.array(audio.get_array_of_samples())
+    if audio.channels == 2:
+        y = y.reshape((-1, 2))[:,1]
+    y = np.float64(y) / 2**15
+    analyzer = loris.Analyzer(freq_res, analysis_window)
+    analyzer.setAmpFloor(amp_floor)
+    analyzer.setFreqDrift(freq_drift)
+    analyzer.setHopTime(hop_time)
+    tic = time.perf_counter()
+    partials_it = analyzer.analyze(y, audio.frame_rate)
+    analysis = time.perf_counter() - tic
+    tic = time.perf_counter()
+    (breakpoints, partial_count) = partials.breakpoints(partials_it)
+    extraction = time.perf_counter() - tic
+    tic = time.perf_counter()
+    partials.link(breakpoints)
+    linking = time.perf_counter() - tic
+    print("%d breakpoints: analysis %2.2fs, extraction %2.2fs, linking %2.2fs" % (len(breakpoints), analysis, extraction, linking))
+    return (analysis, extraction, linking)
+
+def decimation(filename, tolerances=((5, 0.5), (10, 1), (20, 2)), **kwargs):
+    # How many breakpoints (so messages, and lines of partials.h) partials.sequence() makes of filename with each
+    # (cents, db) of decimation, next to none
+    import partials
+    (m, s) = partials.sequence(filename, **kwargs)
+    results = {(0, 0): len(s)}
+    print("none: %d breakpoints" % (len(s)))
+    for (cents, db) in tolerances:
+        (m, s) = partials.sequence(filename, cents=cents, db=db, **kwargs)
+        results[(cents, db)] = len(s)
+        print("%s cents, %s dB: %d breakpoints, %2.1f%%" % (cents, db, len(s), 100.0 * len(s) / results[(0, 0)]))
+    return results
@@ -1,4 +1,3 @@
-import time
 import random
 import alles
 
@@ -16,6 +15,8 @@ def dir_drums(bpm=120, loops=-1, **kwargs):
         [60, 60, 60, 60, 60, 60, 0, 60], [68, 68, 68, 68, 68, 68, 0, 68]]
 
     next_sleepytime_in = 4
+    s = alles.Scheduler()
+    t = s.start
 
     while (loops != 0):
         loops = loops - 1
@@ -25,19 +26,19 @@ def dir_drums(bpm=120, loops=-1, **kwargs):
 
         for i,x in enumerate(pattern):
             if(x & bass):
-                alles.send(osc=0, vel=4, **kwargs)
+                s.at(t, osc=0, vel=4, **kwargs)
             if(x & snare):
-                alles.send(osc=2, vel=1.5)
+                s.at(t, osc=2, vel=1.5)
             if(x & hat):
-                alles.send(osc=3, vel=1)
+                s.at(t, osc=3, vel=1)
             if(x & cow):
-                alles.send(osc=4, vel=1)
+                s.at(t, osc=4, vel=1)
             if(x & hicow):
-                alles.send(osc=5, vel=1)
+                s.at(t, osc=5, vel=1)
             if(bassline[i]>0):
-                alles.send(osc=7, vel=0.5, note=bassline[i]-12, **kwargs)
+                s.at(t, osc=7, vel=0.5, note=bassline[i]-12, **kwargs)
             else:
-                alles.send(vel=0, osc=7, **kwargs)
+                s.at(t, vel=0, osc=7, **kwargs)
 
             if (next_sleepytime_in == 0):
                 sleepytime_multi = random.choice([[1.0,8], [0.5,4], [0.333,3], [0.25,4]])
@@ -45,6 +46,8 @@ def dir_drums(bpm=120, loops=-1, **kwargs):
                 next_sleepytime_in = sleepytime_multi[1]
 
             next_sleepytime_in -= 1
-            time.sleep(sleepytime)
+            t = t + sleepytime * 1000
+            s.wait(t)
+    s.wait()
 
 
@@ -143,7 +143,7 @@ def play_patch(patch_number, midinote=50, length_s = 2, keyup_s = 1):
 	setup_patch(p,midinote)
 
 	alles.note_on(osc=6,vel=4)
-	us_samples0 = alles.render(keyup_s)
+	us_samples0 = alles.render(keyup_s).copy() # the next render() reuses its array
 	alles.note_off(osc=6)
 	us_samples1 = alles.render(length_s - keyup_s)
 	us_samples = np.hstack((us_samples0, us_samples1))
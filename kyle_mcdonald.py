@@ -1,14 +1,21 @@
 import alles
-from time import sleep
-clients = list(alles.sync().keys())
+voices = alles.VoiceAllocator(table=alles.sync())
+s = alles.Scheduler()
+t = s.start
 try:
     for i in range(400): 
-        alles.send(wave=alles.ALGO,
+        voice = voices.note_on(oscs=alles.ALGO_OSCS, wave=alles.ALGO, duration_ms=1000, t=t)
+        for stolen in voice.stolen:
+            s.at(t, osc=stolen.osc, vel=0, client=stolen.client)
+        s.at(t, wave=alles.ALGO,
+            osc=voice.osc,
             note=[[60,58][(i//32)%2],[48,52][(i//48)%2]][(i//64)%2]+[0,3,5,7,10,11][i%6]*2,
             vel=0.1*(i%9),
             patch=14+i%2,
-            client=clients[i%len(clients)])
-        sleep([0.08,0.05,0.1][i%3]*(i%3))
+            client=voice.client)
+        t = t + [80,50,100][i%3]*(i%3)
+        s.wait(t)
+    s.wait()
 except KeyboardInterrupt:
     pass
 alles.reset()
@@ -52,7 +52,7 @@ void esp_render_task( void * pvParameters) {
     printf("I'm renderer #%d on core #%d and i'm handling oscs %d up until %d\n", which, xPortGetCoreID(), start, end);
     while(1) {
         ulTaskNotifyTake(pdTRUE, portMAX_DELAY);
-        render_task(start, end, which);
+        render_task(start, end, which, BLOCK_SIZE);
         xTaskNotifyGive(fillbufferTask);
     }
 }
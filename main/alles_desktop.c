@@ -23,10 +23,37 @@ extern int get_first_ip_address(char *host);
 extern void print_devices();
 char *local_ip, *raw_file;
 
+void print_usage() {
+    printf("usage: alles\n\t[-i multicast interface ip address, default, autodetect]\n");
+    printf("\t[-d sound device id, use -l to list, default, autodetect]\n");
+    printf("\t[-c sound channel, default -1 for all channels on device]\n");
+    printf("\t[-o offset for client ID, use for multiple copies of this program on the same host, default is 0]\n");
+    printf("\t[-t number of threads to render oscs with, default 1, max %d]\n", MAX_RENDER_THREADS);
+    printf("\t[-v number of oscs, default %d]\n", DEFAULT_OSCS);
+    printf("\t[-b block size in samples, default %d]\n", DEFAULT_BLOCK_SIZE);
+    printf("\t[-e number of events the queue can store, default %d]\n", DEFAULT_EVENT_FIFO_LEN);
+    printf("\t[-m latency in ms, default %d]\n", DEFAULT_LATENCY_MS);
+    printf("\t[-l list all sound devices and exit]\n");
+    printf("\t[-g show debug info]\n");
+    printf("\t[-r output audio to specified raw file (1-channel 16-bit signed int, 44100Hz)\n");
+    printf("\t[-h show this help and exit]\n");
+}
+
+// A whole number option, or -1 if it isn't one
+long number_arg(char *arg) {
+    char *end;
+    long value = strtol(arg, &end, 10);
+    if(end == arg || *end != 0) return -1;
+    return value;
+}
+
 int main(int argc, char ** argv) {
     sync_init();
-    start_amy();
-    reset_oscs();
+    uint8_t threads = 1;
+    long oscs = DEFAULT_OSCS;
+    long block_size = DEFAULT_BLOCK_SIZE;
+    long event_fifo_len = DEFAULT_EVENT_FIFO_LEN;
+    long latency_ms = DEFAULT_LATENCY_MS;
 
     // For now, indicate ip address via commandline
     local_ip = (char*)malloc(sizeof(char)*1025);
@@ -36,7 +63,7 @@ int main(int argc, char ** argv) {
     get_first_ip_address(local_ip);
 
     int opt;
-    while((opt = getopt(argc, argv, ":i:d:c:r:o:lgh")) != -1) 
+    while((opt = getopt(argc, argv, ":i:d:c:r:o:t:v:b:e:m:lgh")) != -1) 
     { 
         switch(opt) 
         { 
@@ -55,6 +82,21 @@ int main(int argc, char ** argv) {
             case 'o': 
                 quartet_offset = atoi(optarg);
                 break; 
+            case 't':
+                threads = atoi(optarg);
+                break;
+            case 'v':
+                oscs = number_arg(optarg);
+                break;
+            case 'b':
+                block_size = number_arg(optarg);
+                break;
+            case 'e':
+                event_fifo_len = number_arg(optarg);
+                break;
+            case 'm':
+                latency_ms = number_arg(optarg);
+                break;
             case 'l':
                 print_devices();
                 return 0;
@@ -63,14 +105,7 @@ int main(int argc, char ** argv) {
                 DEBUG = 1;
                 break;
             case 'h':
-                printf("usage: alles\n\t[-i multicast interface ip address, default, autodetect]\n");
-                printf("\t[-d sound device id, use -l to list, default, autodetect]\n");
-                printf("\t[-c sound channel, default -1 for all channels on device]\n");
-                printf("\t[-o offset for client ID, use for multiple copies of this program on the same host, default is 0]\n");
-                printf("\t[-l list all sound devices and exit]\n");
-                printf("\t[-g show debug info]\n");
-                printf("\t[-r output audio to specified raw file (1-channel 16-bit signed int, 44100Hz)\n");
-                printf("\t[-h show this help and exit]\n");
+                print_usage();
                 return 0;
                 break;
             case ':': 
@@ -81,6 +116,19 @@ int main(int argc, char ** argv) {
                 break; 
         } 
     }
+    // These size the buffers start_amy() allocates, so don't let them wrap around
+    if(oscs < 1 || oscs > UINT16_MAX || block_size < 1 || block_size > 4096 || event_fifo_len < 1 || event_fifo_len > UINT32_MAX || latency_ms < 0 || latency_ms > UINT32_MAX) {
+        printf("oscs must be 1-65535, block size 1-4096, event queue length at least 1 and latency at least 0\n");
+        print_usage();
+        return 1;
+    }
+    amy_oscs = oscs;
+    amy_block_size = block_size;
+    amy_event_fifo_len = event_fifo_len;
+    amy_latency_ms = latency_ms;
+    start_amy();
+    reset_oscs();
+    set_render_threads(threads);
     live_start();
     create_multicast_ipv4_socket();
     pthread_t thread_id;
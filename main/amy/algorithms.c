@@ -75,39 +75,39 @@ struct FmAlgorithm algorithms[32] = {
 };
 // End of MSFA stuff
 
-float zeros[BLOCK_SIZE];
+float * zeros;
 
 
 // a = 0
-void zero(float *a) {
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+void zero(float *a, uint16_t len) {
+    for(uint16_t i=0;i<len;i++) {
         a[i] = 0;
     }
 }
 
 
 // b = a + b
-void add(float *a, float*b) {
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+void add(float *a, float*b, uint16_t len) {
+    for(uint16_t i=0;i<len;i++) {
         b[i] = (a[i] + b[i]);
     }
 }
 
-void render_mod(float *in, float*out, uint8_t osc, float feedback_level, uint8_t algo_osc) {
-    hold_and_modify(osc);
-    if(synth[osc].wave == SINE) render_fm_sine(out, osc, in, feedback_level, algo_osc);
+void render_mod(float *in, float*out, uint16_t osc, float feedback_level, uint16_t algo_osc, uint16_t len) {
+    hold_and_modify(osc, len);
+    if(synth[osc].wave == SINE) render_fm_sine(out, osc, in, feedback_level, algo_osc, len);
 }
 
-void note_on_mod(uint8_t osc, uint8_t algo_osc) {
+void note_on_mod(uint16_t osc, uint16_t algo_osc) {
     synth[osc].note_on_clock = total_samples;
     synth[osc].status = IS_ALGO_SOURCE; // to ensure it's rendered
     if(synth[osc].wave==SINE) fm_sine_note_on(osc, algo_osc);
 }
 
-void algo_note_off(uint8_t osc) {
+void algo_note_off(uint16_t osc) {
     for(uint8_t i=0;i<MAX_ALGO_OPS;i++) {
         if(synth[osc].algo_source[i] >=0 ) {
-            uint8_t o = synth[osc].algo_source[i];
+            uint16_t o = synth[osc].algo_source[i];
             synth[o].note_on_clock = -1;
             synth[o].note_off_clock = total_samples; 
         }
@@ -117,7 +117,7 @@ void algo_note_off(uint8_t osc) {
     synth[osc].note_off_clock = total_samples;          
 }
 
-void algo_setup_patch(uint8_t osc) {
+void algo_setup_patch(uint16_t osc) {
     algorithms_parameters_t p = fm_patches[synth[osc].patch % ALGO_PATCHES];
     synth[osc].algorithm = p.algo;
     synth[osc].feedback = p.feedback;
@@ -161,7 +161,7 @@ void algo_setup_patch(uint8_t osc) {
     }
 }
 
-void algo_note_on(uint8_t osc) {    
+void algo_note_on(uint16_t osc) {    
     // trigger all the source operator voices
     if(synth[osc].patch >= 0) { 
         algo_setup_patch(osc);
@@ -174,22 +174,27 @@ void algo_note_on(uint8_t osc) {
 }
 
 void algo_init() {
+    zeros = (float*)malloc(sizeof(float) * BLOCK_SIZE);
     for(uint16_t i=0;i<BLOCK_SIZE;i++) zeros[i] = 0;
 }
 
+void algo_deinit() {
+    free(zeros);
+}
+
 
 
 
-void render_algo(float * buf, uint8_t osc) { 
+void render_algo(float * buf, uint16_t osc, uint16_t len) { 
     float scratch[3][BLOCK_SIZE];
 
     struct FmAlgorithm algo = algorithms[synth[osc].algorithm];
 
     // starts at op 6
     float *in_buf, *out_buf;
-    zero(scratch[0]);
-    zero(scratch[1]);
-    zero(scratch[2]);
+    zero(scratch[0], len);
+    zero(scratch[1], len);
+    zero(scratch[2], len);
     for(uint8_t op=0;op<MAX_ALGO_OPS;op++) {
         if(synth[osc].algo_source[op] >=0 && synth[synth[osc].algo_source[op]].status == IS_ALGO_SOURCE) {
             float feedback_level = 0;
@@ -206,34 +211,34 @@ void render_algo(float * buf, uint8_t osc) {
                 in_buf = scratch[1]; 
             }
             if(algo.ops[op] & OUT_BUS_ONE) { 
-                zero(scratch[0]);
+                zero(scratch[0], len);
                 out_buf = scratch[0]; 
             }
             if(algo.ops[op] & OUT_BUS_TWO) { 
-                zero(scratch[1]);
+                zero(scratch[1], len);
                 out_buf = scratch[1]; 
             }
             if(algo.ops[op] & OUT_BUS_ADD) { 
-                zero(scratch[2]);
+                zero(scratch[2], len);
                 out_buf = scratch[2]; 
             }
-            render_mod(in_buf, out_buf, synth[osc].algo_source[op], feedback_level, osc);
+            render_mod(in_buf, out_buf, synth[osc].algo_source[op], feedback_level, osc, len);
             // TODO -- we could save a buffer here as render adds to out_buf anyway
             if(algo.ops[op] & OUT_BUS_ADD) { 
                 // which thing to add to?
                 if(algo.ops[op] & OUT_BUS_ONE) {
-                    add(scratch[2], scratch[0]); 
+                    add(scratch[2], scratch[0], len); 
                 } else if(algo.ops[op] & OUT_BUS_TWO) {
-                    add(scratch[2], scratch[1]); 
+                    add(scratch[2], scratch[1], len); 
                 } else {
-                    add(scratch[2], buf);
+                    add(scratch[2], buf, len);
                 }
 
 
             }
         }
     }
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+    for(uint16_t i=0;i<len;i++) {
         buf[i] = buf[i] * msynth[osc].amp;
     }
 }
@@ -9,17 +9,33 @@
 // TODO -- refactor this to make this not so reliant, maybe a callback for rendering
 #ifdef ESP_PLATFORM
 #include "../alles.h"
+#include "esp_timer.h"
+#ifdef AMY_PROFILE
+#include "xtensa/hal.h"
+#endif
 extern SemaphoreHandle_t xQueueSemaphore;
 extern TaskHandle_t renderTask[2]; // one per core
 #else
 // Local rendering
 #include <soundio/soundio.h>
 #include <pthread.h>
+#include <time.h>
 struct SoundIo *soundio;
+// Like xQueueSemaphore, this keeps the multicast thread (or libamy's send()) from adding deltas while the audio
+// callback takes them off
+pthread_mutex_t queue_mutex = PTHREAD_MUTEX_INITIALIZER;
 #endif
 
 uint8_t DEBUG = 0;
 
+#ifndef ESP_PLATFORM
+// Set these before start_amy() to change them
+uint16_t amy_oscs = DEFAULT_OSCS;
+uint16_t amy_block_size = DEFAULT_BLOCK_SIZE;
+uint32_t amy_event_fifo_len = DEFAULT_EVENT_FIFO_LEN;
+uint32_t amy_latency_ms = DEFAULT_LATENCY_MS;
+#endif
+
 // Global state 
 struct state global;
 // set of deltas for the fifo to be played
@@ -29,9 +45,18 @@ struct event * synth;
 // envelope-modified per-osc state
 struct mod_event * msynth;
 
-// Two float mixing blocks, one per core of rendering
+// Float mixing blocks, one per core (or desktop render thread) of rendering
 float ** fbl;
-float per_osc_fb[2][BLOCK_SIZE];
+float * per_osc_fb[MAX_RENDER_THREADS];
+#ifndef ESP_PLATFORM
+// The whole block, mixed together from the pieces it gets split into at event times
+float * mix_block;
+#endif
+#ifdef ESP_PLATFORM
+uint8_t render_threads = 2;
+#else
+uint8_t render_threads = 1;
+#endif
 
 // block -- what gets sent to the DAC -- -32768...32767 (wave file, int16 LE)
 i2s_sample_type * block;
@@ -62,9 +87,12 @@ int8_t check_init(amy_err_t (*fn)(), char *name) {
 
 
 int8_t global_init() {
-    global.next_event_write = 0;
-    global.event_start = NULL;
     global.event_qsize = 0;
+    global.event_seq = 0;
+    global.event_drops = 0;
+    global.event_late = 0;
+    global.render_load = 0;
+    global.render_peak = 0;
     global.volume = 1;
     global.eq[0] = 0;
     global.eq[1] = 0;
@@ -118,58 +146,73 @@ struct event default_event() {
 
 
 
+// The event queue is a binary min-heap in events[], ordered by time and then by the order deltas were added, so
+// params sent together still play in the order add_event() wrote them. events[0] is always the next delta to play 
+// and the free slot is always events[global.event_qsize], so adding and playing a delta are both O(log n).
+uint8_t delta_before(struct delta *a, struct delta *b) {
+    if(a->time != b->time) return (int32_t)(a->time - b->time) < 0; // time is in samples, so it can wrap too
+    return (int32_t)(a->seq - b->seq) < 0; // seq can wrap
+}
+
+// Add d to the heap of *size deltas, which has room for it
+void delta_heap_push(struct delta * heap, uint32_t * size, struct delta d) {
+    // Move parents down until we find where the new delta goes
+    uint32_t i = (*size)++;
+    while(i > 0) {
+        uint32_t parent = (i - 1) / 2;
+        if(!delta_before(&d, &heap[parent])) break;
+        heap[i] = heap[parent];
+        i = parent;
+    }
+    heap[i] = d;
+}
+
+// Take the first delta off the heap of *size deltas, *size > 0
+struct delta delta_heap_pop(struct delta * heap, uint32_t * size) {
+    struct delta next = heap[0];
+    struct delta last = heap[--(*size)];
+    uint32_t i = 0;
+    // Move the earlier child up until we find where the last delta goes
+    while(1) {
+        uint32_t child = i * 2 + 1;
+        if(child >= *size) break;
+        if(child + 1 < *size && delta_before(&heap[child + 1], &heap[child])) child++;
+        if(!delta_before(&heap[child], &last)) break;
+        heap[i] = heap[child];
+        i = child;
+    }
+    heap[i] = last;
+    return next;
+}
+
 void add_delta_to_queue(struct delta d) {
 #ifdef ESP_PLATFORM
     //  Take the queue mutex before starting
     xSemaphoreTake(xQueueSemaphore, portMAX_DELAY);
+#else
+    pthread_mutex_lock(&queue_mutex);
 #endif
     if(global.event_qsize < EVENT_FIFO_LEN) {
-        // scan through the memory to find a free slot, starting at write pointer
-        uint16_t write_location = global.next_event_write;
-        int16_t found = -1;
-        // guaranteed to find eventually if qsize stays accurate
-        while(found<0) {
-            if(events[write_location].time == UINT32_MAX) found = write_location;
-            write_location = (write_location + 1) % EVENT_FIFO_LEN;
-        }
-        // Found a mem location. Copy the data in and update the write pointers.
-        events[found].time = d.time;
-        events[found].osc = d.osc;
-        events[found].param = d.param;
-        events[found].data = d.data;
-        global.next_event_write = write_location;
-        global.event_qsize++;
-
-        // Now insert it into the sorted list for fast playback
-        // First, see if it's eariler than the first item, special case
-        if(d.time < global.event_start->time) {
-            events[found].next = global.event_start;
-            global.event_start = &events[found];
-        } else {
-            // or it's got to be found somewhere
-            struct delta* ptr = global.event_start; 
-            int8_t inserted = -1;
-            while(inserted<0) {
-                if(d.time < ptr->next->time) { 
-                    // next should point to me, and my next should point to old next
-                    events[found].next = ptr->next;
-                    ptr->next = &events[found];
-                    inserted = 1;
-                }
-                ptr = ptr->next;
-            }
-        }
+        d.seq = global.event_seq++;
+        delta_heap_push(events, &global.event_qsize, d);
         event_counter++;
 
     } else {
-        // If there's no room in the queue, just skip the message
-        // TODO -- report this somehow? 
+        // If there's no room in the queue, just skip the message, and count it for the sync replies
+        global.event_drops++;
     }
 #ifdef ESP_PLATFORM
     xSemaphoreGive( xQueueSemaphore );
+#else
+    pthread_mutex_unlock(&queue_mutex);
 #endif
 }
 
+// Take the next delta off the queue. Call it with the queue mutex held and global.event_qsize > 0
+struct delta pop_delta_from_queue() {
+    return delta_heap_pop(events, &global.event_qsize);
+}
+
 
 void add_event(struct event e) {
     // make delta objects out of the UDP event and add them to the queue
@@ -216,7 +259,7 @@ void add_event(struct event e) {
     message_counter++;
 }
 
-void reset_osc(uint8_t i ) {
+void reset_osc(uint16_t i ) {
     // set all the synth state to defaults
     synth[i].osc = i; // self-reference to make updating oscs easier
     synth[i].wave = SINE;
@@ -241,10 +284,13 @@ void reset_osc(uint8_t i ) {
     msynth[i].filter_freq = 0;
     synth[i].resonance = 0.7;
     msynth[i].resonance = 0.7;
+    msynth[i].mod_scale = 0;
+    msynth[i].mod_stepped = 0;
     synth[i].velocity = 0;
     synth[i].step = 0;
     synth[i].sample = DOWN;
     synth[i].substep = 0;
+    synth[i].fade = 0;
     synth[i].status = OFF;
     synth[i].mod_source = -1;
     synth[i].mod_target = 0; 
@@ -263,7 +309,7 @@ void reset_osc(uint8_t i ) {
 }
 
 void reset_oscs() {
-    for(uint8_t i=0;i<OSCS;i++) reset_osc(i);
+    for(uint16_t i=0;i<OSCS;i++) reset_osc(i);
     // Also reset filters and volume
     global.volume = 1;
     global.eq[0] = 0;
@@ -288,29 +334,22 @@ int8_t oscs_init() {
     // Set all oscillators to their default values
     reset_oscs();
 
-    // Make a fencepost last event with no next, time of end-1, and call it start for now, all other events get inserted before it
-    events[0].next = NULL;
-    events[0].time = UINT32_MAX - 1;
-    events[0].osc = 0;
-    events[0].data = 0;
-    events[0].param = NO_PARAM;
-    global.next_event_write = 1;
-    global.event_start = &events[0];
-    global.event_qsize = 1; // queue will always have at least 1 thing in it 
-
-    // Set all the other events to empty
-    for(uint16_t i=1;i<EVENT_FIFO_LEN;i++) { 
-        events[i].time = UINT32_MAX;
-        events[i].next = NULL;
-        events[i].osc = 0;
-        events[i].data = 0;
-        events[i].param = NO_PARAM;
+    // Start with an empty queue
+    global.event_qsize = 0;
+    global.event_seq = 0;
+    fbl = (float**) malloc(sizeof(float*) * MAX_RENDER_THREADS); // one per core or render thread
+    for(uint8_t core=0;core<MAX_RENDER_THREADS;core++) {
+        fbl[core] = (float*)malloc(sizeof(float) * BLOCK_SIZE);
+        per_osc_fb[core] = (float*)malloc(sizeof(float) * BLOCK_SIZE);
+        for(uint16_t i=0;i<BLOCK_SIZE;i++) { fbl[core][i] = 0; per_osc_fb[core][i] = 0; }
     }
-    fbl = (float**) malloc(sizeof(float*) * 2); // one per core, just core 0 used off esp32
-    fbl[0]= (float*)malloc(sizeof(float) * BLOCK_SIZE);
-    fbl[1]= (float*)malloc(sizeof(float) * BLOCK_SIZE);
-    // Clear out both as local mode won't use fbl[1] 
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) { fbl[0][i] =0; fbl[1][i] = 0;}
+#ifndef ESP_PLATFORM
+    mix_block = (float*)malloc(sizeof(float) * BLOCK_SIZE);
+#endif
+#ifdef AMY_PROFILE
+    profile_osc_ticks = malloc(sizeof(*profile_osc_ticks) * OSCS);
+    profile_clear();
+#endif
     total_samples = 0;
     computed_delta = 0;
     computed_delta_set = 0;
@@ -321,16 +360,22 @@ int8_t oscs_init() {
 
 
 void show_debug(uint8_t type) { 
+#ifdef AMY_PROFILE
+    // D10 starts render profiling from zero, D11 prints it and D12 stops it
+    if(type == 10) { amy_profile(1); return; }
+    if(type == 11) { amy_profile_print(); return; }
+    if(type == 12) { amy_profile(0); return; }
+#endif
 #ifdef ESP_PLATFORM
     esp_show_debug(type);
 #endif
     if(type>1) {
-        struct delta * ptr = global.event_start;
+        // These are in heap order, only the first one is sure to be the next to play
         uint16_t q = global.event_qsize;
         if(q > 25) q = 25;
         for(uint16_t i=0;i<q;i++) {
+            struct delta * ptr = &events[i];
             printf("%d time %u osc %d param %d - %f %d\n", i, ptr->time, ptr->osc, ptr->param, *(float *)&ptr->data, *(int *)&ptr->data);
-            ptr = ptr->next;
         }
     }
     if(type>2) {
@@ -338,7 +383,7 @@ void show_debug(uint8_t type) {
         //printf("global: filter %f resonance %f volume %f status %d\n", global.filter_freq, global.resonance, global.volume, global.status);
         printf("global: volume %f eq: %f %f %f \n", global.volume, global.eq[0], global.eq[1], global.eq[2]);
         //printf("mod global: filter %f resonance %f\n", mglobal.filter_freq, mglobal.resonance);
-        for(uint8_t i=0;i<OSCS;i++) {
+        for(uint16_t i=0;i<OSCS;i++) {
             printf("osc %d: status %d amp %f wave %d freq %f duty %f mod_target %d mod source %d velocity %f filter_freq %f ratio %f feedback %f resonance %f step %f algo %d detune %f source %d,%d,%d,%d,%d,%d  \n",
                 i, synth[i].status, synth[i].amp, synth[i].wave, synth[i].freq, synth[i].duty, synth[i].mod_target, synth[i].mod_source, 
                 synth[i].velocity, synth[i].filter_freq, synth[i].ratio, synth[i].feedback, synth[i].resonance, synth[i].step, synth[i].algorithm, synth[i].detune,
@@ -360,17 +405,27 @@ void show_debug(uint8_t type) {
 
    
 void oscs_deinit() {
+#ifndef ESP_PLATFORM
+    // Stop the render workers before their buffers go away
+    set_render_threads(1);
+#endif
     //for(uint8_t i=0;i<I2S_BUFFERS;i++) free(dbl_block[i]); 
     free(block);
-    free(fbl[0]);
-    free(fbl[1]);
+    for(uint8_t core=0;core<MAX_RENDER_THREADS;core++) { free(fbl[core]); free(per_osc_fb[core]); }
     free(fbl);
+#ifndef ESP_PLATFORM
+    free(mix_block);
+#endif
     free(synth);
     free(msynth);
     free(events);
+#ifdef AMY_PROFILE
+    free(profile_osc_ticks);
+#endif
 
     ks_deinit();
     filters_deinit();
+    algo_deinit();
 }
 
 
@@ -408,7 +463,7 @@ void play_event(struct delta d) {
     if(trig) synth[d.osc].note_on_clock = total_samples;
 
     // TODO: event-only side effect, remove
-    if(d.param == MOD_SOURCE) { synth[d.osc].mod_source = *(int8_t *)&d.data; synth[*(int8_t *)&d.data].status = IS_MOD_SOURCE; }
+    if(d.param == MOD_SOURCE) { synth[d.osc].mod_source = *(int16_t *)&d.data; synth[*(int16_t *)&d.data].status = IS_MOD_SOURCE; }
     if(d.param == MOD_TARGET) synth[d.osc].mod_target = *(int8_t *)&d.data; 
 
     if(d.param == RATIO) synth[d.osc].ratio = *(float *)&d.data;
@@ -421,8 +476,8 @@ void play_event(struct delta d) {
 
     if(d.param >= ALGO_SOURCE_START && d.param < ALGO_SOURCE_END) {
         uint8_t which_source = d.param - ALGO_SOURCE_START;
-        synth[d.osc].algo_source[which_source] = *(int8_t *)&d.data; 
-        synth[*(int8_t*)&d.data].status=IS_ALGO_SOURCE;
+        synth[d.osc].algo_source[which_source] = *(int16_t *)&d.data; 
+        synth[*(int16_t*)&d.data].status=IS_ALGO_SOURCE;
     }
 
     // For global changes, just make the change, no need to update the per-osc synth
@@ -481,8 +536,8 @@ void play_event(struct delta d) {
 
 }
 
-// Apply an mod & bp, if any, to the osc
-void hold_and_modify(uint8_t osc) {
+// Apply an mod & bp, if any, to the osc, for the next len samples
+void hold_and_modify(uint16_t osc, uint16_t len) {
     // Copy all the modifier variables
     msynth[osc].amp = synth[osc].amp;
     msynth[osc].duty = synth[osc].duty;
@@ -503,13 +558,15 @@ void hold_and_modify(uint8_t osc) {
         if(synth[osc].breakpoint_target[i] & TARGET_RESONANCE) msynth[osc].resonance = msynth[osc].resonance * scale;
         all_set_scale = all_set_scale + scale;
     }
-    if(all_set_scale == 0) { // all BP sets were 0, which means we are in a note off and nobody is active anymore. time to stop the note.
+    // all BP sets were 0, which means we are in a note off and nobody is active anymore. time to stop the note.
+    // A PARTIAL fading out stops itself in render_partial() once the fade is done, which can take a few pieces of blocks
+    if(all_set_scale == 0 && !(synth[osc].wave == PARTIAL && synth[osc].substep == 2)) {
         synth[osc].status=OFF;
         synth[osc].note_off_clock = -1;
     }
 
     // And the mod -- mod scale is (original + (original * scale))
-    float scale = compute_mod_scale(osc);
+    float scale = compute_mod_scale(osc, len);
     if(synth[osc].mod_target & TARGET_AMP) msynth[osc].amp = msynth[osc].amp + (msynth[osc].amp * scale);
     if(synth[osc].mod_target & TARGET_DUTY) msynth[osc].duty = msynth[osc].duty + (msynth[osc].duty * scale);
     if(synth[osc].mod_target & TARGET_FREQ) msynth[osc].freq = msynth[osc].freq + (msynth[osc].freq * scale);
@@ -519,48 +576,242 @@ void hold_and_modify(uint8_t osc) {
 }
 
 
-void render_task(uint8_t start, uint8_t end, uint8_t core) {
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) { fbl[core][i] = 0; per_osc_fb[core][i] = 0; }
-    for(uint8_t osc=start; osc<end; osc++) {
+#ifdef AMY_PROFILE
+uint8_t amy_profiling = 0;
+uint64_t (*profile_osc_ticks)[PROFILE_STAGES];
+struct profile_wave profile_waves[MAX_RENDER_THREADS][PROFILE_WAVES];
+uint64_t profile_eq_ticks;
+uint32_t profile_eq_renders;
+uint32_t profile_osc_running[MAX_RENDER_THREADS]; // ticks so far for the osc each thread is rendering
+
+// Ticks on a clock that wraps, take two and subtract them to get how long something took
+uint32_t profile_ticks() {
+#ifdef ESP_PLATFORM
+    return xthal_get_ccount();
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint32_t)((uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec);
+#endif
+}
+
+// Oscs with a wave we don't know count as OFF, like render_task() treats them
+uint8_t profile_wave(uint16_t osc) {
+    if(synth[osc].wave < 0 || synth[osc].wave >= PROFILE_WAVES) return OFF;
+    return synth[osc].wave;
+}
+
+// Add the ticks since start to osc's stage and its wave, and return now to start the next stage from
+uint32_t profile_stage(uint32_t start, uint16_t osc, uint8_t stage, uint8_t core) {
+    uint32_t now = profile_ticks();
+    uint32_t ticks = now - start;
+    profile_osc_ticks[osc][stage] += ticks;
+    profile_waves[core][profile_wave(osc)].ticks[stage] += ticks;
+    profile_osc_running[core] += ticks;
+    return now;
+}
+
+// osc is done rendering, put how long it all took in its wave's histogram
+void profile_osc(uint16_t osc, uint8_t core, uint16_t len) {
+    struct profile_wave * w = &profile_waves[core][profile_wave(osc)];
+    uint32_t ticks = profile_osc_running[core];
+    uint8_t bucket = 0;
+    while(ticks > 1 && bucket < PROFILE_BUCKETS - 1) { ticks = ticks >> 1; bucket++; }
+    w->histogram[bucket]++;
+    w->renders++;
+    w->samples += len;
+    profile_osc_running[core] = 0;
+}
+
+void profile_clear() {
+    memset(profile_osc_ticks, 0, sizeof(*profile_osc_ticks) * OSCS);
+    memset(profile_waves, 0, sizeof(profile_waves));
+    memset(profile_osc_running, 0, sizeof(profile_osc_running));
+    profile_eq_ticks = 0;
+    profile_eq_renders = 0;
+}
+
+// Turn profiling on, from zero, or off. The counts stay until it's turned on again
+void amy_profile(uint8_t on) {
+    amy_profiling = 0;
+    if(on) profile_clear();
+    amy_profiling = on;
+}
+
+void amy_profile_print() {
+    const char * waves[PROFILE_WAVES] = { "SINE", "PULSE", "SAW", "TRIANGLE", "NOISE", "KS", "PCM", "ALGO", "PARTIAL", "PARTIALS", "OFF" };
+    printf("------ render profile in %s since profiling started (%s)\n", PROFILE_TICKS_PER_SECOND == 1000000000 ? "ns" : "cycles",
+        amy_profiling ? "on" : "off");
+    for(uint8_t wave=0;wave<PROFILE_WAVES;wave++) {
+        // Add up the threads
+        struct profile_wave w;
+        memset(&w, 0, sizeof(w));
+        for(uint8_t core=0;core<MAX_RENDER_THREADS;core++) {
+            for(uint8_t i=0;i<PROFILE_STAGES;i++) w.ticks[i] += profile_waves[core][wave].ticks[i];
+            for(uint8_t b=0;b<PROFILE_BUCKETS;b++) w.histogram[b] += profile_waves[core][wave].histogram[b];
+            w.samples += profile_waves[core][wave].samples;
+            w.renders += profile_waves[core][wave].renders;
+        }
+        if(w.renders == 0) continue;
+        printf("%-9s %u renders, hold_and_modify %llu render %llu filter %llu, %2.2f per sample\n", waves[wave], w.renders,
+            (unsigned long long)w.ticks[PROFILE_HOLD_AND_MODIFY], (unsigned long long)w.ticks[PROFILE_RENDER],
+            (unsigned long long)w.ticks[PROFILE_FILTER],
+            (float)(w.ticks[PROFILE_HOLD_AND_MODIFY] + w.ticks[PROFILE_RENDER] + w.ticks[PROFILE_FILTER]) / w.samples);
+        printf("          per render:");
+        for(uint8_t b=0;b<PROFILE_BUCKETS;b++) if(w.histogram[b]) printf(" %lu+ %u", 1UL << b, w.histogram[b]);
+        printf("\n");
+    }
+    printf("eq: %u renders, %llu\n", profile_eq_renders, (unsigned long long)profile_eq_ticks);
+    for(uint16_t osc=0;osc<OSCS;osc++) {
+        if(profile_osc_ticks[osc][PROFILE_RENDER] == 0) continue;
+        printf("osc %d: hold_and_modify %llu render %llu filter %llu\n", osc, (unsigned long long)profile_osc_ticks[osc][PROFILE_HOLD_AND_MODIFY],
+            (unsigned long long)profile_osc_ticks[osc][PROFILE_RENDER], (unsigned long long)profile_osc_ticks[osc][PROFILE_FILTER]);
+    }
+}
+#endif
+
+// Render the next len samples (up to BLOCK_SIZE) of oscs start to end-1 into fbl[core]
+void render_task(uint16_t start, uint16_t end, uint8_t core, uint16_t len) {
+    for(uint16_t i=0;i<len;i++) { fbl[core][i] = 0; per_osc_fb[core][i] = 0; }
+    for(uint16_t osc=start; osc<end; osc++) {
         if(synth[osc].status==AUDIBLE) { // skip oscs that are silent or mod sources from playback
-            for(uint16_t i=0;i<BLOCK_SIZE;i++) { per_osc_fb[core][i] = 0; }
-            hold_and_modify(osc); // apply bp / mod
-            if(synth[osc].wave == NOISE) render_noise(per_osc_fb[core], osc);
-            if(synth[osc].wave == SAW) render_saw(per_osc_fb[core], osc);
-            if(synth[osc].wave == PULSE) render_pulse(per_osc_fb[core], osc);
-            if(synth[osc].wave == TRIANGLE) render_triangle(per_osc_fb[core], osc);
-            if(synth[osc].wave == SINE) render_sine(per_osc_fb[core], osc);
-            if(synth[osc].wave == KS) render_ks(per_osc_fb[core], osc);
-            if(synth[osc].wave == PCM) render_pcm(per_osc_fb[core], osc);
-            if(synth[osc].wave == ALGO) render_algo(per_osc_fb[core], osc);
-            if(synth[osc].wave == PARTIAL) render_partial(per_osc_fb[core], osc);
-            if(synth[osc].wave == PARTIALS) render_partials(per_osc_fb[core], osc);
+            for(uint16_t i=0;i<len;i++) { per_osc_fb[core][i] = 0; }
+            PROFILE_TICK(tick);
+            hold_and_modify(osc, len); // apply bp / mod
+            PROFILE_STAGE(tick, osc, PROFILE_HOLD_AND_MODIFY, core);
+            if(synth[osc].wave == NOISE) render_noise(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == SAW) render_saw(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == PULSE) render_pulse(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == TRIANGLE) render_triangle(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == SINE) render_sine(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == KS) render_ks(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == PCM) render_pcm(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == ALGO) render_algo(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == PARTIAL) render_partial(per_osc_fb[core], osc, len);
+            if(synth[osc].wave == PARTIALS) render_partials(per_osc_fb[core], osc, len);
+            PROFILE_STAGE(tick, osc, PROFILE_RENDER, core);
             // Check it's not off, just in case. TODO, why do i care?
             if(synth[osc].wave != OFF) {
                 // Apply filter to osc if set
-                if(synth[osc].filter_type != FILTER_NONE) filter_process(per_osc_fb[core], osc);
-                for(uint16_t i=0;i<BLOCK_SIZE;i++) { fbl[core][i] += per_osc_fb[core][i]; }
+                if(synth[osc].filter_type != FILTER_NONE) {
+                    filter_process(per_osc_fb[core], osc, len);
+                    PROFILE_STAGE(tick, osc, PROFILE_FILTER, core);
+                }
+                for(uint16_t i=0;i<len;i++) { fbl[core][i] += per_osc_fb[core][i]; }
             }
+            PROFILE_OSC(tick, osc, core, len);
         }
     }
-    // apply the EQ filters if set
-    if(global.eq[0] != 0 || global.eq[1] != 0 || global.eq[2] != 0) parametric_eq_process(fbl[core]);
 }
 
+#ifndef ESP_PLATFORM
+// On desktop, render_threads threads split the oscs like the ESP32's two cores do. fill_audio_buffer() renders the 
+// first share itself and wakes a worker for each of the others, each with its own fbl[] and per_osc_fb[] 
+pthread_t render_workers[MAX_RENDER_THREADS];
+pthread_mutex_t render_pool_mutex = PTHREAD_MUTEX_INITIALIZER; // held while rendering a block or changing the pool
+pthread_mutex_t render_mutex = PTHREAD_MUTEX_INITIALIZER;
+pthread_cond_t render_go = PTHREAD_COND_INITIALIZER;
+pthread_cond_t render_done = PTHREAD_COND_INITIALIZER;
+uint32_t render_generation = 0; // goes up by one per block, to wake the workers
+uint32_t render_spawn_generation = 0;
+uint8_t render_pending = 0; // workers still rendering this block
+uint8_t render_stopping = 0;
+uint16_t render_len = 0; // samples in this block, set with render_go
+
+void render_share(uint8_t which, uint8_t threads, uint16_t len) {
+    render_task((OSCS * which) / threads, (OSCS * (which + 1)) / threads, which, len);
+}
+
+void *render_worker(void *vargp) {
+    uint8_t which = (uint8_t)(intptr_t)vargp;
+    uint32_t seen = render_spawn_generation;
+    pthread_mutex_lock(&render_mutex);
+    while(1) {
+        while(render_generation == seen) pthread_cond_wait(&render_go, &render_mutex);
+        seen = render_generation;
+        if(render_stopping) break;
+        pthread_mutex_unlock(&render_mutex);
+        render_share(which, render_threads, render_len);
+        pthread_mutex_lock(&render_mutex);
+        if(--render_pending == 0) pthread_cond_signal(&render_done);
+    }
+    pthread_mutex_unlock(&render_mutex);
+    return NULL;
+}
+
+// Render with this many threads (1 to MAX_RENDER_THREADS), from the next block on
+void set_render_threads(uint8_t threads) {
+    if(threads < 1) threads = 1;
+    if(threads > MAX_RENDER_THREADS) threads = MAX_RENDER_THREADS;
+    pthread_mutex_lock(&render_pool_mutex);
+    if(threads != render_threads) {
+        // Stop the old workers
+        pthread_mutex_lock(&render_mutex);
+        render_stopping = 1;
+        render_generation++;
+        pthread_cond_broadcast(&render_go);
+        pthread_mutex_unlock(&render_mutex);
+        for(uint8_t i=1;i<render_threads;i++) pthread_join(render_workers[i], NULL);
+        render_stopping = 0;
+        // And start the new ones
+        render_threads = threads;
+        render_spawn_generation = render_generation;
+        for(uint8_t i=1;i<render_threads;i++) pthread_create(&render_workers[i], NULL, render_worker, (void *)(intptr_t)i);
+    }
+    pthread_mutex_unlock(&render_pool_mutex);
+}
+
+// Render the next len samples of every osc into fbl[], len up to BLOCK_SIZE
+void render_oscs(uint16_t len) {
+    pthread_mutex_lock(&render_pool_mutex);
+    update_mod_sources(len);
+    if(render_threads > 1) {
+        pthread_mutex_lock(&render_mutex);
+        render_len = len;
+        render_pending = render_threads - 1;
+        render_generation++;
+        pthread_cond_broadcast(&render_go);
+        pthread_mutex_unlock(&render_mutex);
+    }
+    render_share(0, render_threads, len);
+    if(render_threads > 1) {
+        pthread_mutex_lock(&render_mutex);
+        while(render_pending > 0) pthread_cond_wait(&render_done, &render_mutex);
+        pthread_mutex_unlock(&render_mutex);
+    }
+    pthread_mutex_unlock(&render_pool_mutex);
+}
+#endif
+
 // On all platforms, sysclock is based on total samples played, using audio out (i2s or etc) as system clock
 int64_t get_sysclock() {
     return (total_samples / (float)SAMPLE_RATE) * 1000;
 }
 
+// Deltas are timed in samples on the same clock, so they can play partway into a block
+int64_t sysclock_to_samples(int64_t sysclock) {
+    return (sysclock * SAMPLE_RATE) / 1000;
+}
+
+// Has this delta's time come, by the end of the next this many samples
+uint8_t delta_due(struct delta *d, uint32_t samples) {
+    return (int32_t)(d->time - (uint32_t)(total_samples + samples)) < 0;
+}
+
 
 #ifndef ESP_PLATFORM
-int16_t leftover_buf[BLOCK_SIZE]; 
+int16_t * leftover_buf; 
 uint16_t leftover_samples = 0;
 int16_t channel = -1;
 int16_t device_id = -1;
 uint8_t file_write = 0;
 FILE * raw = NULL;
 extern char * raw_file;
+// What live_start() opened, for live_stop() to close
+struct SoundIoDevice * live_device = NULL;
+struct SoundIoOutStream * live_outstream = NULL;
+pthread_t soundio_thread;
+volatile uint8_t soundio_running = 0;
 
 void print_devices() {
     struct SoundIo *soundio2 = soundio_create();
@@ -611,7 +862,7 @@ static void soundio_callback(struct SoundIoOutStream *outstream, int frame_count
     leftover_samples = 0;
 
     // Now send the bulk of the frames
-    for(uint8_t i=0;i<(uint8_t)(frame_count / BLOCK_SIZE);i++) {
+    for(uint16_t i=0;i<(uint16_t)(frame_count / BLOCK_SIZE);i++) {
         int16_t *buf = fill_audio_buffer_task();
         for(uint16_t frame=0;frame<BLOCK_SIZE;frame++) {
             for(uint8_t c=0;c<layout->channel_count;c++) {
@@ -685,6 +936,7 @@ amy_err_t soundio_init() {
     }
 
     struct SoundIoDevice *device = soundio_get_output_device(soundio, selected_device_index);
+    live_device = device;
     if(channel > device->layouts[0].channel_count-1) {
         printf("Requested channel number more than available, setting to -1\n");
         channel = -1;
@@ -703,6 +955,7 @@ amy_err_t soundio_init() {
     }
 
     struct SoundIoOutStream *outstream = soundio_outstream_create(device);
+    live_outstream = outstream;
     if (!outstream) {
         fprintf(stderr, "out of memory\n");
         return 1;
@@ -736,26 +989,43 @@ amy_err_t soundio_init() {
 }
 
 void *soundio_run(void *vargp) {
-    soundio_init();
-    for(;;) {
+    if(soundio_init() != AMY_OK) return NULL;
+    while(soundio_running) {
         soundio_flush_events(soundio);
         usleep(THREAD_USLEEP);
     }
+    return NULL;
 }
 
 void live_start() {
+    leftover_buf = (int16_t*)malloc(sizeof(int16_t) * BLOCK_SIZE);
     // kick off a thread running soundio_run
     if(strlen(raw_file) > 0) {
         file_write = 1;
         raw = fopen(raw_file, "wb");
     }
-    pthread_t thread_id;
-    pthread_create(&thread_id, NULL, soundio_run, NULL);
+    soundio_running = 1;
+    pthread_create(&soundio_thread, NULL, soundio_run, NULL);
 }
 
 
+// Stop playing out the speakers. The stream and its callback are gone when this returns, so AMY can be stopped after
 void live_stop() {
-    soundio_destroy(soundio);
+    soundio_running = 0;
+    pthread_join(soundio_thread, NULL);
+    if(live_outstream != NULL) soundio_outstream_destroy(live_outstream);
+    if(live_device != NULL) soundio_device_unref(live_device);
+    if(soundio != NULL) soundio_destroy(soundio);
+    live_outstream = NULL;
+    live_device = NULL;
+    soundio = NULL;
+    free(leftover_buf);
+    leftover_buf = NULL;
+    leftover_samples = 0;
+    if(file_write) {
+        fclose(raw);
+        file_write = 0;
+    }
 }
 
 #endif // ifndef ESP_PLATFORM
@@ -772,25 +1042,36 @@ void decrease_volume() {
 
 // This takes scheduled events and plays them at the right time
 int16_t * fill_audio_buffer_task() {
-    // Check to see which sounds to play 
-    int64_t sysclock = get_sysclock(); 
+    return fill_audio_buffer(block);
+}
+
+// Microseconds on a clock that only goes forward, to time rendering with
+int64_t amy_clock_us() {
+#ifdef ESP_PLATFORM
+    return esp_timer_get_time();
+#else
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (int64_t)ts.tv_sec * 1000000 + ts.tv_nsec / 1000;
+#endif
+}
 
+// Render the next BLOCK_SIZE samples into buf, which can be any buffer that big, e.g. straight into libamy's output
+int16_t * fill_audio_buffer(i2s_sample_type * buf) {
+    int64_t render_start = amy_clock_us();
 #ifdef ESP_PLATFORM
     // put a mutex around this so that the mcastTask doesn't touch these while i'm running  
     xSemaphoreTake(xQueueSemaphore, portMAX_DELAY);
-#endif
 
     // Find any events that need to be played from the (in-order) queue
-    while(sysclock >= global.event_start->time) {
-        play_event(*global.event_start);
-        global.event_start->time = UINT32_MAX;
-        global.event_qsize--;
-        global.event_start = global.event_start->next;
+    while(global.event_qsize > 0 && delta_due(&events[0], 1)) {
+        play_event(pop_delta_from_queue());
     }
-#ifdef ESP_PLATFORM
     // Give the mutex back
     xSemaphoreGive(xQueueSemaphore);
 
+    update_mod_sources(BLOCK_SIZE);
+
     //gpio_set_level(CPU_MONITOR_1, 1);
     // Tell the rendering threads to start rendering
     xTaskNotifyGive(renderTask[0]);
@@ -799,16 +1080,49 @@ int16_t * fill_audio_buffer_task() {
     // And wait for each of them to come back
     ulTaskNotifyTake(pdFALSE, portMAX_DELAY);
     ulTaskNotifyTake(pdFALSE, portMAX_DELAY);
+
+    // Mix all the oscillator buffers into one, always in the same order so the output doesn't depend on which finished first
+    for(uint8_t core=1; core<render_threads; core++) {
+        for(uint16_t i=0;i<BLOCK_SIZE;i++) fbl[0][i] += fbl[core][i];
+    }
+    float * mix_block = fbl[0];
+    total_samples += BLOCK_SIZE;
 #else
-    render_task(0, OSCS, 0);        
+    // Split the block at each delta's time, so it plays at its exact sample. Each piece renders on its own, with the
+    // control rate things (envelopes, mods) moving on by just the samples it has
+    uint16_t done = 0;
+    while(done < BLOCK_SIZE) {
+        // Find any events that need to be played from the (in-order) queue, and when the next one is, with the
+        // queue mutex held so nothing is added to the heap meanwhile
+        pthread_mutex_lock(&queue_mutex);
+        while(global.event_qsize > 0 && delta_due(&events[0], 1)) {
+            play_event(pop_delta_from_queue());
+        }
+        uint16_t piece = BLOCK_SIZE - done;
+        if(global.event_qsize > 0 && delta_due(&events[0], piece)) piece = events[0].time - (uint32_t)total_samples;
+        pthread_mutex_unlock(&queue_mutex);
+        render_oscs(piece);
+        // Mix all the oscillator buffers into one, always in the same order so the output doesn't depend on which finished first
+        for(uint16_t i=0;i<piece;i++) mix_block[done + i] = fbl[0][i];
+        for(uint8_t core=1; core<render_threads; core++) {
+            for(uint16_t i=0;i<piece;i++) mix_block[done + i] += fbl[core][i];
+        }
+        total_samples += piece;
+        done += piece;
+    }
 #endif
+    // apply the EQ filters if set
+    if(global.eq[0] != 0 || global.eq[1] != 0 || global.eq[2] != 0) {
+        PROFILE_TICK(tick);
+        parametric_eq_process(mix_block);
+        PROFILE_EQ(tick);
+    }
 
     // Global volume is supposed to max out at 10, so scale by 0.1.
     float volume_scale = 0.1 * global.volume;
     //uint8_t nonzero = 0;
     for(int16_t i=0; i < BLOCK_SIZE; ++i) {
-        // Mix all the oscillator buffers into one
-        float fsample = volume_scale * (fbl[0][i] + fbl[1][i]) * 32767.0;
+        float fsample = volume_scale * mix_block[i] * 32767.0;
         // Soft clipping.
         int positive = 1; 
         if (fsample < 0) positive = 0;
@@ -834,13 +1148,16 @@ int16_t * fill_audio_buffer_task() {
     	}
 #ifdef ESP_PLATFORM
         // ESP32's i2s driver has this bug
-        block[i ^ 0x01] = sample;
+        buf[i ^ 0x01] = sample;
 #else
-        block[i] = sample;
+        buf[i] = sample;
 #endif
     }
-    total_samples += BLOCK_SIZE;
-    return block;
+    // How long that took next to how long the block plays for, over 1 means we can't keep up
+    float load = (float)(amy_clock_us() - render_start) / (BLOCK_SIZE * 1000000.0 / SAMPLE_RATE);
+    global.render_load += (load - global.render_load) * 0.05;
+    if(load > global.render_peak) global.render_peak = load;
+    return buf;
 }
 
 int32_t ms_to_samples(int32_t ms) {
@@ -891,17 +1208,179 @@ void parse_breakpoint(struct event * e, char* message, uint8_t which_bpset) {
     }
 }
 
+// Move a parsed event onto our own clock and add it to the queue, if it's for this client
+// e.time comes in as the host's time in samples and goes out as ours. computed_delta stays in ms, sync uses it.
+// With own_clock, e.time is already on our clock (a k time), from a host that tracks it, and skips computed_delta
+void schedule_event(struct event e, int16_t client, uint8_t own_clock) {
+    int64_t sysclock = get_sysclock();
+    int64_t latency = sysclock_to_samples(LATENCY_MS);
+    // Now adjust time in some useful way:
+    if(own_clock) {
+        e.time = e.time + latency;
+        // One that can't be right plays asap
+        if(e.time < 0 || e.time > total_samples + latency + sysclock_to_samples(MAX_DRIFT_MS)) e.time = total_samples + latency;
+    } else if(computed_delta_set && e.time > 0) {
+        // if we have a delta & got a time in this message, use it schedule it properly
+        // OK, so check for potentially negative numbers here (or really big numbers-sysclock) 
+        int64_t potential_time = (e.time - sysclock_to_samples(computed_delta)) + latency;
+        if(potential_time < 0 || (potential_time > total_samples + latency + sysclock_to_samples(MAX_DRIFT_MS))) {
+            printf("recomputing time base: message came in with %lld, mine is %lld, computed delta was %lld\n", (e.time * 1000) / SAMPLE_RATE, sysclock, computed_delta);
+            computed_delta = (e.time * 1000) / SAMPLE_RATE - sysclock;
+            printf("computed delta now %lld\n", computed_delta);
+        }
+        e.time = (e.time - sysclock_to_samples(computed_delta)) + latency;
+    } else { // else play it asap 
+        e.time = total_samples + latency;
+    }
+    e.status = SCHEDULED;
+
+    // Assume it's for me
+    uint8_t for_me = 1;
+    // But wait, they specified, so don't assume
+    if(client >= 0) {
+        for_me = 0;
+        if(client <= 255) {
+            // If they gave an individual client ID check that it exists
+            if(alive>0) { // alive may get to 0 in a bad situation
+                if(client >= alive) {
+                    client = client % alive;
+                } 
+            }
+        }
+        // It's actually precisely for me
+        if(client == client_id) for_me = 1;
+        if(client > 255) {
+            // It's a group message, see if i'm in the group
+            if(client_id % (client-255) == 0) for_me = 1;
+        }
+    }
+    if(for_me) {
+        // A late one still plays, just as soon as it can. Only count the ones we play for the sync replies
+        if(e.time < total_samples) global.event_late++;
+        add_event(e);
+    }
+}
+
+// Little endian readers for binary messages, safe for unaligned data
+uint16_t read_u16(uint8_t *p) { return p[0] | (p[1] << 8); }
+uint32_t read_u32(uint8_t *p) { return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t)p[3] << 24); }
+float read_f32(uint8_t *p) { uint32_t u = read_u32(p); float f; memcpy(&f, &u, 4); return f; }
+
+// Bytes of each binary param, in enum binary_params order. Breakpoints and algo sources are their count byte
+const uint8_t binary_param_sizes[BINARY_PARAMS] = { 1, 1, 4, 4, 1, 4, 2,  4, 4, 1, 1, 1, 1, 1,  1, 2, 4, 4, 4, 4, 4,  4, 1, 1, 1, 1, 1, 1,  4, 4, 4, 1 };
+
+// Binary messages are BINARY_MAGIC, the total length in bytes, a param mask (7 bits per byte, high bit set if
+// another mask byte follows), a uint32 time in ms, a uint8 of 256ths of a ms past it, and then each param in the
+// mask, in bit order, little endian.
+// Numbers are uint8, uint16 or float32 and breakpoints are a count of pairs then that many (uint16 ms, float32) pairs,
+// see alles.binary_params. This skips all the atof/atoi of the ASCII messages and is about half the size.
+void parse_binary_task() {
+    uint8_t * message = (uint8_t *) message_start_pointer;
+    uint8_t length = message[1];
+    uint8_t c = 2;
+    uint32_t mask = 0;
+    int16_t client = -1;
+    struct event e = default_event();
+
+    if(length > message_length) length = message_length;
+    for(uint8_t shift=0; c < length; shift += 7) {
+        mask = mask | ((uint32_t)(message[c] & 0x7F) << shift);
+        if(!(message[c++] & 0x80)) break;
+    }
+    if(c + 5 > length) return;
+    int64_t host_ms = read_u32(message + c);
+    // The fraction of a ms lands it between two of our samples, like a fractional ASCII time
+    e.time = ((host_ms * 256 + message[c + 4]) * SAMPLE_RATE) / 256000;
+    c += 5;
+    if(!computed_delta_set) {
+        int64_t sysclock = get_sysclock();
+        computed_delta = host_ms - sysclock;
+        printf("setting computed delta to %lld (e.time is %lld sysclock %lld) max_drift_ms %d latency %d\n", computed_delta, host_ms, sysclock, MAX_DRIFT_MS, LATENCY_MS);
+        computed_delta_set = 1;
+    }
+    for(uint8_t bit=0; bit<BINARY_PARAMS; bit++) {
+        if(!(mask & ((uint32_t)1 << bit))) continue;
+        // Check the param fits before reading it. Breakpoints and algo sources check the rest of their length
+        if(c + binary_param_sizes[bit] > length) return;
+        uint8_t * p = message + c;
+        c += binary_param_sizes[bit];
+        switch(bit) {
+            case B_OSC: e.osc = p[0] % OSCS; break; // allow osc wraparound
+            case B_WAVE: e.wave = p[0]; break;
+            case B_VEL: e.velocity = read_f32(p); break;
+            case B_FREQ: e.freq = read_f32(p); break;
+            case B_NOTE: e.midi_note = p[0]; break;
+            case B_AMP: e.amp = read_f32(p); break;
+            case B_PATCH: e.patch = read_u16(p); break;
+            case B_PHASE: e.phase = read_f32(p); break;
+            case B_FEEDBACK: e.feedback = read_f32(p); break;
+            case B_BP0: case B_BP1: case B_BP2: {
+                uint8_t bp_set = bit - B_BP0;
+                uint8_t pairs = p[0];
+                if(c + pairs*6 > length) return;
+                for(uint8_t i=0;i<MAX_BREAKPOINTS;i++) {
+                    e.breakpoint_times[bp_set][i] = -1;
+                    e.breakpoint_values[bp_set][i] = -1;
+                }
+                for(uint8_t i=0;i<pairs;i++) {
+                    if(i < MAX_BREAKPOINTS) {
+                        e.breakpoint_times[bp_set][i] = ms_to_samples(read_u16(message + c));
+                        e.breakpoint_values[bp_set][i] = read_f32(message + c + 2);
+                    }
+                    c += 6;
+                }
+                break;
+            }
+            case B_BP0_TARGET: e.breakpoint_target[0] = p[0]; break;
+            case B_BP1_TARGET: e.breakpoint_target[1] = p[0]; break;
+            case B_BP2_TARGET: e.breakpoint_target[2] = p[0]; break;
+            case B_CLIENT: client = read_u16(p); break;
+            case B_DUTY: e.duty = read_f32(p); break;
+            case B_DETUNE: e.detune = read_f32(p); break;
+            case B_VOLUME: e.volume = read_f32(p); break;
+            case B_RESONANCE: e.resonance = read_f32(p); break;
+            case B_FILTER_FREQ: e.filter_freq = read_f32(p); break;
+            case B_RATIO: e.ratio = read_f32(p); break;
+            case B_ALGORITHM: e.algorithm = p[0]; break;
+            case B_ALGO_SOURCE: {
+                uint8_t sources = p[0];
+                if(c + sources > length) return;
+                for(uint8_t i=0;i<sources;i++) {
+                    if(i < MAX_ALGO_OPS) e.algo_source[i] = (int8_t)message[c];
+                    c++;
+                }
+                break;
+            }
+            case B_MOD_TARGET: e.mod_target = p[0]; break;
+            case B_MOD_SOURCE: e.mod_source = p[0]; break;
+            case B_RESET: if(p[0] > OSCS-1) { reset_oscs(); } else { reset_osc(p[0]); } break;
+            case B_DEBUG: show_debug(p[0]); break;
+            case B_EQ_L: e.eq_l = read_f32(p); break;
+            case B_EQ_M: e.eq_m = read_f32(p); break;
+            case B_EQ_H: e.eq_h = read_f32(p); break;
+            case B_FILTER_TYPE: e.filter_type = p[0]; break;
+        }
+    }
+    schedule_event(e, client, 0);
+}
+
 void parse_task() {
     uint8_t mode = 0;
     int16_t client = -1;
     int64_t sync = -1;
     int8_t sync_index = -1;
     uint8_t ipv4 = 0; 
+    double own_ms = -1; // a k time, on our own clock
     uint16_t start = 0;
     uint16_t c = 0;
     char * message = message_start_pointer;
     int16_t length = message_length;
 
+    if((uint8_t)message[0] == BINARY_MAGIC) {
+        parse_binary_task();
+        return;
+    }
+
     struct event e = default_event();
     int64_t sysclock = get_sysclock();
     uint8_t sync_response = 0;
@@ -920,11 +1399,13 @@ void parse_task() {
         if(b == '_' && c==0) sync_response = 1;
         if( ((b >= 'a' && b <= 'z') || (b >= 'A' && b <= 'Z')) || b == 0) {  // new mode or end
             if(mode=='t') {
-                e.time=atol(message + start);
+                // Times are sent in ms, but can have a fraction to land between two of our samples
+                double host_ms = atof(message + start);
+                e.time = host_ms * SAMPLE_RATE / 1000.0;
                 // if we haven't yet synced our times, do it now
                 if(!computed_delta_set) {
-                    computed_delta = e.time - sysclock;
-                    printf("setting computed delta to %lld (e.time is %lld sysclock %lld) max_drift_ms %d latency %d\n", computed_delta, e.time, sysclock, MAX_DRIFT_MS, LATENCY_MS);
+                    computed_delta = (int64_t)host_ms - sysclock;
+                    printf("setting computed delta to %lld (e.time is %lld sysclock %lld) max_drift_ms %d latency %d\n", computed_delta, (int64_t)host_ms, sysclock, MAX_DRIFT_MS, LATENCY_MS);
                     computed_delta_set = 1;
                 }
             }
@@ -946,6 +1427,7 @@ void parse_task() {
             if(mode=='g') e.mod_target = atoi(message + start); 
             if(mode=='i') sync_index = atoi(message + start);
             if(mode=='I') e.ratio = atof(message + start);
+            if(mode=='k') own_ms = atof(message + start);
             if(mode=='l') e.velocity=atof(message + start);
             if(mode=='L') e.mod_source=atoi(message + start);
             if(mode=='n') e.midi_note=atoi(message + start);
@@ -957,7 +1439,7 @@ void parse_task() {
             if(mode=='R') e.resonance=atof(message + start);
             if(mode=='s') sync = atol(message + start); 
             if(mode=='S') { 
-                uint8_t osc = atoi(message + start); 
+                uint16_t osc = atoi(message + start); 
                 if(osc > OSCS-1) { reset_oscs(); } else { reset_osc(osc); }
             }
             if(mode=='T') e.breakpoint_target[0] = atoi(message + start); 
@@ -983,49 +1465,12 @@ void parse_task() {
     }
     // Only do this if we got some data
     if(length >0) {
-        // Now adjust time in some useful way:
-        // if we have a delta & got a time in this message, use it schedule it properly
-        if(computed_delta_set && e.time > 0) {
-            // OK, so check for potentially negative numbers here (or really big numbers-sysclock) 
-            int64_t potential_time = (e.time - computed_delta) + LATENCY_MS;
-            if(potential_time < 0 || (potential_time > sysclock + LATENCY_MS + MAX_DRIFT_MS)) {
-                printf("recomputing time base: message came in with %lld, mine is %lld, computed delta was %lld\n", e.time, sysclock, computed_delta);
-                computed_delta = e.time - sysclock;
-                printf("computed delta now %lld\n", computed_delta);
-            }
-            e.time = (e.time - computed_delta) + LATENCY_MS;
-
-        } else { // else play it asap 
-            e.time = sysclock + LATENCY_MS;
-        }
-        e.status = SCHEDULED;
-
-        // TODO -- not that it matters, but the below could probably be one or two lines long instead
         // Don't add sync messages to the event queue
         if(sync >= 0 && sync_index >= 0) {
             handle_sync(sync, sync_index);
         } else {
-            // Assume it's for me
-            uint8_t for_me = 1;
-            // But wait, they specified, so don't assume
-            if(client >= 0) {
-                for_me = 0;
-                if(client <= 255) {
-                    // If they gave an individual client ID check that it exists
-                    if(alive>0) { // alive may get to 0 in a bad situation
-                        if(client >= alive) {
-                            client = client % alive;
-                        } 
-                    }
-                }
-                // It's actually precisely for me
-                if(client == client_id) for_me = 1;
-                if(client > 255) {
-                    // It's a group message, see if i'm in the group
-                    if(client_id % (client-255) == 0) for_me = 1;
-                }
-            }
-            if(for_me) add_event(e);
+            if(own_ms >= 0) e.time = own_ms * SAMPLE_RATE / 1000.0;
+            schedule_event(e, client, own_ms >= 0);
         }
     }
 }
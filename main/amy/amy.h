@@ -11,27 +11,46 @@
 #include <unistd.h>
 
 // Constants you can change if you want
+#if defined(ESP_PLATFORM) 
 #define OSCS 64              // # of simultaneous oscs to keep track of 
 #define BLOCK_SIZE 256       // buffer block size in samples
-#if defined(ESP_PLATFORM) 
 #define LATENCY_MS 1000      // fixed latency in milliseconds
 #define EVENT_FIFO_LEN 3000  // number of events the queue can store
 #define MAX_DRIFT_MS 20000   // ms of time you can schedule ahead before synth recomputes time base
-#elif defined(DESKTOP_PLATFORM)
-#define LATENCY_MS 1000      
-#define EVENT_FIFO_LEN 3000  // number of events the queue can store
-#define MAX_DRIFT_MS 20000   // ms of time you can schedule ahead before synth recomputes time base
 #else
-#define LATENCY_MS 0          // no latency for local mode
-#define EVENT_FIFO_LEN 30000  // number of events the queue can store
+// Desktop and libamy set these at startup (alles -v -b -e -m, or libamy.start()) before start_amy(), 
+// these are their defaults
+#define DEFAULT_OSCS 64
+#define DEFAULT_BLOCK_SIZE 256
+#if defined(DESKTOP_PLATFORM)
+#define DEFAULT_LATENCY_MS 1000      
+#define DEFAULT_EVENT_FIFO_LEN 3000  
+#define MAX_DRIFT_MS 20000   
+#else
+#define DEFAULT_LATENCY_MS 0          // no latency for local mode
+#define DEFAULT_EVENT_FIFO_LEN 30000 
 #define MAX_DRIFT_MS 60000
 #endif
+extern uint16_t amy_oscs;
+extern uint16_t amy_block_size;
+extern uint32_t amy_event_fifo_len;
+extern uint32_t amy_latency_ms;
+#define OSCS amy_oscs
+#define BLOCK_SIZE amy_block_size
+#define EVENT_FIFO_LEN amy_event_fifo_len
+#define LATENCY_MS amy_latency_ms
+#endif
 #define SAMPLE_RATE 44100    // playback sample rate
 #define SAMPLE_MAX 32767
 #define MAX_ALGO_OPS 6 // dx7
 #define MAX_BREAKPOINTS 8
 #define MAX_BREAKPOINT_SETS 3
 #define THREAD_USLEEP 500
+#if defined(ESP_PLATFORM)
+#define MAX_RENDER_THREADS 2 // one per core
+#else
+#define MAX_RENDER_THREADS 8 // desktop render worker pool, see set_render_threads()
+#endif
 #define BYTES_PER_SAMPLE 2
 
 // This can be 32 bit, int32_t -- helpful for digital output to a i2s->USB teensy3 board
@@ -103,22 +122,33 @@ enum params{
     NO_PARAM
 };
 
+// Binary messages start with this byte instead of an ASCII letter, and carry a mask of these params in this order
+#define BINARY_MAGIC 0xA5
+enum binary_params{
+    B_OSC, B_WAVE, B_VEL, B_FREQ, B_NOTE, B_AMP, B_PATCH,
+    B_PHASE, B_FEEDBACK, B_BP0, B_BP1, B_BP2, B_BP0_TARGET, B_BP1_TARGET,
+    B_BP2_TARGET, B_CLIENT, B_DUTY, B_DETUNE, B_VOLUME, B_RESONANCE, B_FILTER_FREQ,
+    B_RATIO, B_ALGORITHM, B_ALGO_SOURCE, B_MOD_TARGET, B_MOD_SOURCE, B_RESET, B_DEBUG,
+    B_EQ_L, B_EQ_M, B_EQ_H, B_FILTER_TYPE,
+    BINARY_PARAMS
+};
+
 // Delta holds the individual changes from an event, it's sorted in order of playback time 
 // this is more efficient in memory than storing entire events per message 
 struct delta {
     uint32_t data; // casted to the right thing later
     enum params param; // which parameter is being changed
-    uint32_t time; // what time to play / change this parameter
-    int8_t osc; // which oscillator it impacts
-    struct delta * next; // the next event, in time 
+    uint32_t time; // what sample to play / change this parameter at, wraps after a day or so
+    uint16_t osc; // which oscillator it impacts
+    uint32_t seq; // order it was added in, to keep deltas with the same time in order 
 };
 
 
 // Events are used to parse from ASCII UDP strings into, and also as each oscillators current internal state 
 struct event {
     // todo -- clean up types here - many don't need to be signed anymore, and time doesn't need to be int64
-    int64_t time;
-    int8_t osc;
+    int64_t time; // in samples
+    int16_t osc;
     int16_t wave;
     int16_t patch;
     int16_t midi_note;
@@ -132,16 +162,17 @@ struct event {
     float detune;
     float step;
     float substep;
+    uint16_t fade; // PARTIAL: samples into its BLOCK_SIZE fade in or out, which can span pieces of blocks
     float sample;
     float volume;
     float filter_freq;
     float ratio;
     float resonance;
-    int8_t mod_source;
+    int16_t mod_source;
     int8_t mod_target;
     int8_t algorithm;
     int8_t filter_type;
-    int8_t algo_source[MAX_ALGO_OPS];
+    int16_t algo_source[MAX_ALGO_OPS];
 
     // TODO -- this may be too much for Alles, to have per osc. Could have a fixed stack of EGs that get assigned to oscs, maybe 32 of them 
     int64_t note_on_clock;
@@ -176,15 +207,24 @@ struct mod_event {
     float filter_freq;
     float resonance;
     float feedback;
+    float mod_scale; // this osc's output as a mod source for the current render, see update_mod_sources()
+    uint8_t mod_stepped;
 };
 
 struct event default_event();
 void add_event(struct event e);
-void render_task(uint8_t start, uint8_t end, uint8_t core);
+void add_delta_to_queue(struct delta d);
+struct delta pop_delta_from_queue();
+void delta_heap_push(struct delta * heap, uint32_t * size, struct delta d);
+struct delta delta_heap_pop(struct delta * heap, uint32_t * size);
+void render_task(uint16_t start, uint16_t end, uint8_t core, uint16_t len);
+void set_render_threads(uint8_t threads);
+extern uint8_t render_threads;
 void show_debug(uint8_t type) ;
 void oscs_deinit() ;
 void reset_oscs() ;
 int64_t get_sysclock();
+int64_t sysclock_to_samples(int64_t sysclock);
 float freq_for_midi_note(uint8_t midi_note);
 int8_t check_init(amy_err_t (*fn)(), char *name);
 
@@ -204,26 +244,77 @@ extern uint8_t DEBUG;
 struct state {
     float volume;
     float eq[3];
-    uint16_t event_qsize;
-    int16_t next_event_write;
-    struct delta * event_start; // start of the sorted list
+    uint32_t event_qsize;
+    uint32_t event_seq; // seq of the next delta added
+    uint32_t event_drops; // deltas add_delta_to_queue() had no room for
+    uint32_t event_late; // events that came in after the time they were meant to play
+    float render_load; // time to render a block over the time it plays for, averaged
+    float render_peak; // the most a block's render_load has been since the last sync reply or ping
 };
 
 // Shared structures
-extern float coeffs[OSCS][5];
-extern float delay[OSCS][2];
+extern float (*coeffs)[5];
+extern float (*delay)[2];
 extern int64_t total_samples;
 extern struct event *synth;
 extern struct mod_event *msynth; // the synth that is being modified by modulations & envelopes
 extern struct state global; 
 
+// Render profiling. Build with -DAMY_PROFILE (make PROFILE=1, or AMY_PROFILE=1 for setup.py) and turn it on with amy_profile(1) or a D10 message to count the ticks
+// (ns on desktop, CPU cycles on the ESP32) each osc spends in each stage of render_task(), see amy_profile_print()
+#ifdef AMY_PROFILE
+#define PROFILE_HOLD_AND_MODIFY 0
+#define PROFILE_RENDER 1
+#define PROFILE_FILTER 2
+#define PROFILE_STAGES 3
+#define PROFILE_WAVES (OFF + 1)
+#define PROFILE_BUCKETS 32 // histogram of ticks per osc per render, bucket b is 2^b to 2^(b+1)-1 ticks
+#if defined(ESP_PLATFORM)
+#define PROFILE_TICKS_PER_SECOND (CONFIG_ESP32_DEFAULT_CPU_FREQ_MHZ * 1000000)
+#else
+#define PROFILE_TICKS_PER_SECOND 1000000000
+#endif
+// Per wave, per render thread so the threads don't share them
+struct profile_wave {
+    uint64_t ticks[PROFILE_STAGES];
+    uint64_t samples; // rendered, to get ticks per sample out of ticks
+    uint32_t renders;
+    uint32_t histogram[PROFILE_BUCKETS];
+};
+extern uint8_t amy_profiling;
+extern uint64_t (*profile_osc_ticks)[PROFILE_STAGES];
+extern struct profile_wave profile_waves[MAX_RENDER_THREADS][PROFILE_WAVES];
+extern uint64_t profile_eq_ticks;
+extern uint32_t profile_eq_renders;
+uint32_t profile_ticks();
+uint32_t profile_stage(uint32_t start, uint16_t osc, uint8_t stage, uint8_t core);
+void profile_osc(uint16_t osc, uint8_t core, uint16_t len);
+void profile_clear();
+void amy_profile(uint8_t on);
+void amy_profile_print();
+#define PROFILE_TICK(t) uint32_t t = amy_profiling ? profile_ticks() : 0
+// t is 0 if profiling was off when it started, so turning it on partway through a render doesn't count a bad time
+#define PROFILE_STAGE(t, osc, stage, core) if(amy_profiling && t) t = profile_stage(t, osc, stage, core)
+#define PROFILE_OSC(t, osc, core, len) if(amy_profiling && t) profile_osc(osc, core, len)
+#define PROFILE_EQ(t) if(amy_profiling && t) { profile_eq_ticks += profile_ticks() - t; profile_eq_renders++; }
+#else
+#define PROFILE_TICK(t)
+#define PROFILE_STAGE(t, osc, stage, core)
+#define PROFILE_OSC(t, osc, core, len)
+#define PROFILE_EQ(t)
+#endif
+
 
 int8_t oscs_init();
 void parse_breakpoint(struct event * e, char* message, uint8_t bp_set) ;
 void parse_algorithm(struct event * e, char* message) ;
-void hold_and_modify(uint8_t osc) ;
+void hold_and_modify(uint16_t osc, uint16_t len) ;
 int16_t * fill_audio_buffer_task();
+int16_t * fill_audio_buffer(i2s_sample_type * buf);
+int64_t amy_clock_us();
 void parse_task();
+void parse_binary_task();
+void schedule_event(struct event e, int16_t client, uint8_t own_clock);
 void start_amy();
 void stop_amy();
 int32_t ms_to_samples(int32_t ms) ;
@@ -233,58 +324,59 @@ int32_t ms_to_samples(int32_t ms) ;
 void live_start();
 void live_stop();
 
-extern float render_am_lut(float * buf, float step, float skip, float incoming_amp, float ending_amp, const float* lut, int16_t lut_size, float *mod, float bandwidth);
+extern float render_am_lut(float * buf, float step, float skip, float incoming_amp, float ending_amp, const float* lut, int16_t lut_size, float *mod, float bandwidth, uint16_t len);
 extern void ks_init();
 extern void ks_deinit();
 extern void algo_init();
+extern void algo_deinit();
 extern void pcm_init();
-extern void render_ks(float * buf, uint8_t osc); 
-extern void render_sine(float * buf, uint8_t osc); 
-extern void render_fm_sine(float *buf, uint8_t osc, float *mod, float feedback_level, uint8_t algo_osc);
-extern void render_pulse(float * buf, uint8_t osc); 
-extern void render_saw(float * buf, uint8_t osc);
-extern void render_triangle(float * buf, uint8_t osc); 
-extern void render_noise(float * buf, uint8_t osc); 
-extern void render_pcm(float * buf, uint8_t osc);
-extern void render_algo(float * buf, uint8_t osc) ;
-extern void render_partial(float *buf, uint8_t osc) ;
-extern void partials_note_on(uint8_t osc);
-extern void partials_note_off(uint8_t osc);
-extern void render_partials(float *buf, uint8_t osc);
-
-extern float compute_mod_pulse(uint8_t osc);
-extern float compute_mod_noise(uint8_t osc);
-extern float compute_mod_sine(uint8_t osc);
-extern float compute_mod_saw(uint8_t osc);
-extern float compute_mod_triangle(uint8_t osc);
-extern float compute_mod_pcm(uint8_t osc);
-
-extern void ks_note_on(uint8_t osc); 
-extern void ks_note_off(uint8_t osc);
-extern void sine_note_on(uint8_t osc); 
-extern void fm_sine_note_on(uint8_t osc, uint8_t algo_osc); 
-extern void saw_note_on(uint8_t osc); 
-extern void triangle_note_on(uint8_t osc); 
-extern void pulse_note_on(uint8_t osc); 
-extern void pcm_note_on(uint8_t osc);
-extern void pcm_note_off(uint8_t osc);
-extern void partial_note_on(uint8_t osc);
-extern void partial_note_off(uint8_t osc);
-extern void algo_note_on(uint8_t osc);
-extern void algo_note_off(uint8_t osc) ;
-extern void sine_mod_trigger(uint8_t osc);
-extern void saw_mod_trigger(uint8_t osc);
-extern void triangle_mod_trigger(uint8_t osc);
-extern void pulse_mod_trigger(uint8_t osc);
-extern void pcm_mod_trigger(uint8_t osc);
+extern void render_ks(float * buf, uint16_t osc, uint16_t len); 
+extern void render_sine(float * buf, uint16_t osc, uint16_t len); 
+extern void render_fm_sine(float *buf, uint16_t osc, float *mod, float feedback_level, uint16_t algo_osc, uint16_t len);
+extern void render_pulse(float * buf, uint16_t osc, uint16_t len); 
+extern void render_saw(float * buf, uint16_t osc, uint16_t len);
+extern void render_triangle(float * buf, uint16_t osc, uint16_t len); 
+extern void render_noise(float * buf, uint16_t osc, uint16_t len); 
+extern void render_pcm(float * buf, uint16_t osc, uint16_t len);
+extern void render_algo(float * buf, uint16_t osc, uint16_t len) ;
+extern void render_partial(float *buf, uint16_t osc, uint16_t len) ;
+extern void partials_note_on(uint16_t osc);
+extern void partials_note_off(uint16_t osc);
+extern void render_partials(float *buf, uint16_t osc, uint16_t len);
+
+extern float compute_mod_pulse(uint16_t osc, uint16_t len);
+extern float compute_mod_noise(uint16_t osc, uint16_t len);
+extern float compute_mod_sine(uint16_t osc, uint16_t len);
+extern float compute_mod_saw(uint16_t osc, uint16_t len);
+extern float compute_mod_triangle(uint16_t osc, uint16_t len);
+extern float compute_mod_pcm(uint16_t osc, uint16_t len);
+
+extern void ks_note_on(uint16_t osc); 
+extern void ks_note_off(uint16_t osc);
+extern void sine_note_on(uint16_t osc); 
+extern void fm_sine_note_on(uint16_t osc, uint16_t algo_osc); 
+extern void saw_note_on(uint16_t osc); 
+extern void triangle_note_on(uint16_t osc); 
+extern void pulse_note_on(uint16_t osc); 
+extern void pcm_note_on(uint16_t osc);
+extern void pcm_note_off(uint16_t osc);
+extern void partial_note_on(uint16_t osc);
+extern void partial_note_off(uint16_t osc);
+extern void algo_note_on(uint16_t osc);
+extern void algo_note_off(uint16_t osc) ;
+extern void sine_mod_trigger(uint16_t osc);
+extern void saw_mod_trigger(uint16_t osc);
+extern void triangle_mod_trigger(uint16_t osc);
+extern void pulse_mod_trigger(uint16_t osc);
+extern void pcm_mod_trigger(uint16_t osc);
 extern float get_random();
 
 // filters
 extern void filters_init();
 extern void filters_deinit();
-extern void filter_process(float * block, uint8_t osc);
+extern void filter_process(float * block, uint16_t osc, uint16_t len);
 extern void parametric_eq_process(float *block);
-extern void update_filter(uint8_t osc);
+extern void update_filter(uint16_t osc);
 extern float dsps_sqrtf_f32_ansi(float f);
 extern int8_t dsps_biquad_gen_lpf_f32(float *coeffs, float f, float qFactor);
 extern int8_t dsps_biquad_f32_ansi(const float *input, float *output, int len, float *coef, float *w);
@@ -297,9 +389,10 @@ esp_err_t dsps_biquad_f32_ae32(const float *input, float *output, int len, float
 
 
 // envelopes
-extern float compute_breakpoint_scale(uint8_t osc, uint8_t bp_set);
-extern float compute_mod_scale(uint8_t osc);
-extern void retrigger_mod_source(uint8_t osc);
+extern float compute_breakpoint_scale(uint16_t osc, uint8_t bp_set);
+extern float compute_mod_scale(uint16_t osc, uint16_t len);
+extern void update_mod_sources(uint16_t len);
+extern void retrigger_mod_source(uint16_t osc);
 
 
 
@@ -18,29 +18,40 @@ extern struct mod_state mglobal;
 
 
 
-// modulation scale is not like bp scale, it can also make a thing bigger, so return range is between -1 and 1, where 1 = 2x and 0 = 1x
-float compute_mod_scale(uint8_t osc) {
-    int8_t source = synth[osc].mod_source;
-    if(synth[osc].mod_target >= 1 && source >= 0) {
-        if(source != osc) {  // that would be weird
-            msynth[source].amp = synth[source].amp;
-            msynth[source].duty = synth[source].duty;
-            msynth[source].freq = synth[source].freq;
-            msynth[source].filter_freq = synth[source].filter_freq;
-            msynth[source].feedback = synth[source].feedback;
-            msynth[source].resonance = synth[source].resonance;
-            if(synth[source].wave == NOISE) return compute_mod_noise(source);
-            if(synth[source].wave == SAW) return compute_mod_saw(source);
-            if(synth[source].wave == PULSE) return compute_mod_pulse(source);
-            if(synth[source].wave == TRIANGLE) return compute_mod_triangle(source);
-            if(synth[source].wave == SINE) return compute_mod_sine(source);
-            if(synth[source].wave == PCM) return compute_mod_pcm(source);
-        }
+// Advance each mod source that an audible osc listens to, once per render of len samples and before any render thread
+// starts, so carriers sharing a source (maybe on different threads) all read the same step and never write the source
+void update_mod_sources(uint16_t len) {
+    for(uint16_t osc=0;osc<OSCS;osc++) msynth[osc].mod_stepped = 0;
+    for(uint16_t osc=0;osc<OSCS;osc++) {
+        int16_t source = synth[osc].mod_source;
+        if(synth[osc].status != AUDIBLE || synth[osc].mod_target < 1 || source < 0 || source == osc) continue; // source == osc would be weird
+        if(msynth[source].mod_stepped) continue;
+        msynth[source].mod_stepped = 1;
+        msynth[source].mod_scale = 0;
+        msynth[source].amp = synth[source].amp;
+        msynth[source].duty = synth[source].duty;
+        msynth[source].freq = synth[source].freq;
+        msynth[source].filter_freq = synth[source].filter_freq;
+        msynth[source].feedback = synth[source].feedback;
+        msynth[source].resonance = synth[source].resonance;
+        if(synth[source].wave == NOISE) msynth[source].mod_scale = compute_mod_noise(source, len);
+        if(synth[source].wave == SAW) msynth[source].mod_scale = compute_mod_saw(source, len);
+        if(synth[source].wave == PULSE) msynth[source].mod_scale = compute_mod_pulse(source, len);
+        if(synth[source].wave == TRIANGLE) msynth[source].mod_scale = compute_mod_triangle(source, len);
+        if(synth[source].wave == SINE) msynth[source].mod_scale = compute_mod_sine(source, len);
+        if(synth[source].wave == PCM) msynth[source].mod_scale = compute_mod_pcm(source, len);
     }
+}
+
+// modulation scale is not like bp scale, it can also make a thing bigger, so return range is between -1 and 1, where 1 = 2x and 0 = 1x
+// Only reads the source, update_mod_sources() already stepped it for this render
+float compute_mod_scale(uint16_t osc, uint16_t len) {
+    int16_t source = synth[osc].mod_source;
+    if(synth[osc].mod_target >= 1 && source >= 0 && source != osc) return msynth[source].mod_scale;
     return 0; // 0 is no change, unlike bp scale
 }
 
-float compute_breakpoint_scale(uint8_t osc, uint8_t bp_set) {
+float compute_breakpoint_scale(uint16_t osc, uint8_t bp_set) {
     // given a breakpoint list, compute the scale
     // we first see how many BPs are defined, and where we are in them?
     uint8_t exp = 1;
@@ -124,7 +135,7 @@ float compute_breakpoint_scale(uint8_t osc, uint8_t bp_set) {
 //def release(t, release, S):
 //    return S*exp(-3 * t / release)
 /*
-float compute_adsr_scale(uint8_t osc) {
+float compute_adsr_scale(uint16_t osc) {
     // get the scale out of a osc
     float scale = 1.0; // the overall ratio to modify the thing
     int32_t t_a = synth[osc].adsr_a;
@@ -4,8 +4,8 @@
 // Filters tend to get weird under this ratio -- this corresponds to 4.4Hz 
 #define LOWEST_RATIO 0.0001
 
-float coeffs[OSCS][5];
-float delay[OSCS][2];
+float (*coeffs)[5]; // per osc, OSCS of them
+float (*delay)[2];
 
 float eq_coeffs[3][5];
 float eq_delay[3][2];
@@ -111,7 +111,7 @@ int8_t dsps_biquad_f32_ansi(const float *input, float *output, int len, float *c
     return 0;
 }
 
-void update_filter(uint8_t osc) {
+void update_filter(uint16_t osc) {
     // reset the delay for a filter
     // normal mod / adsr will just change the coeffs
     delay[osc][0] = 0; delay[osc][1] = 0;
@@ -122,7 +122,9 @@ void filters_init() {
     dsps_biquad_gen_lpf_f32(eq_coeffs[0], EQ_CENTER_LOW /(float)SAMPLE_RATE, 0.707);
     dsps_biquad_gen_bpf_f32(eq_coeffs[1], EQ_CENTER_MED /(float)SAMPLE_RATE, 1.000);
     dsps_biquad_gen_hpf_f32(eq_coeffs[2], EQ_CENTER_HIGH/(float)SAMPLE_RATE, 0.707);
-    for(uint8_t i=0;i<OSCS;i++) { delay[i][0] = 0; delay[i][1] = 0; }
+    coeffs = malloc(sizeof(float) * 5 * OSCS);
+    delay = malloc(sizeof(float) * 2 * OSCS);
+    for(uint16_t i=0;i<OSCS;i++) { delay[i][0] = 0; delay[i][1] = 0; }
     eq_delay[0][0] = 0; eq_delay[0][1] = 0;
     eq_delay[1][0] = 0; eq_delay[1][1] = 0;
     eq_delay[2][0] = 0; eq_delay[2][1] = 0;
@@ -146,7 +148,7 @@ void parametric_eq_process(float *block) {
 
 
 
-void filter_process(float * block, uint8_t osc) {
+void filter_process(float * block, uint16_t osc, uint16_t len) {
     float output[BLOCK_SIZE];
     float ratio = msynth[osc].filter_freq/(float)SAMPLE_RATE;
     if(ratio < LOWEST_RATIO) ratio = LOWEST_RATIO;
@@ -154,15 +156,17 @@ void filter_process(float * block, uint8_t osc) {
     if(synth[osc].filter_type==FILTER_BPF) dsps_biquad_gen_bpf_f32(coeffs[osc], ratio, msynth[osc].resonance);
     if(synth[osc].filter_type==FILTER_HPF) dsps_biquad_gen_hpf_f32(coeffs[osc], ratio, msynth[osc].resonance);
 #ifdef ESP_PLATFORM
-    dsps_biquad_f32_ae32(block, output, BLOCK_SIZE, coeffs[osc], delay[osc]);
+    dsps_biquad_f32_ae32(block, output, len, coeffs[osc], delay[osc]);
 #else
-    dsps_biquad_f32_ansi(block, output, BLOCK_SIZE, coeffs[osc], delay[osc]);
+    dsps_biquad_f32_ansi(block, output, len, coeffs[osc], delay[osc]);
 #endif
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+    for(uint16_t i=0;i<len;i++) {
         block[i] = output[i];
     }
 }
 
 void filters_deinit() {
+    free(coeffs);
+    free(delay);
 }
 
@@ -0,0 +1,323 @@
+// libamy.c
+// Python bindings for AMY, to run the engine on your computer without alles. Build with python setup.py install
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <time.h>
+#include "amy.h"
+
+// libamy is the only synth there is, so every message is for it. These are what sync.c and alles_desktop.c
+// give amy.c in an alles build
+char * raw_file = "";
+uint8_t alive = 1;
+int16_t client_id = 0;
+void update_map(uint8_t client, uint8_t ipv4, int64_t time) { }
+void handle_sync(int64_t time, int8_t index) { }
+
+extern char *message_start_pointer;
+extern int16_t message_length;
+
+uint8_t amy_started = 0;
+uint8_t amy_live = 0;
+// The end of the last block render() started but didn't need, it goes out first next time
+int16_t * render_leftover;
+uint16_t render_leftover_samples = 0;
+
+int64_t monotonic_ns() {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (int64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+// Start AMY with this many oscs, block size in samples, event queue length and latency in ms. Anything not given
+// is the default. Does nothing if AMY is already started, stop() it first to change them
+static PyObject * start_wrapper(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static char *keywords[] = {"oscs", "block_size", "event_fifo_len", "latency_ms", NULL};
+    int oscs = DEFAULT_OSCS;
+    int block_size = DEFAULT_BLOCK_SIZE;
+    long event_fifo_len = DEFAULT_EVENT_FIFO_LEN;
+    long latency_ms = DEFAULT_LATENCY_MS;
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|iill", keywords, &oscs, &block_size, &event_fifo_len, &latency_ms)) return NULL;
+    if(amy_started) Py_RETURN_NONE;
+    if(oscs < 1 || oscs > UINT16_MAX || block_size < 1 || block_size > 4096 || event_fifo_len < 1 || event_fifo_len > UINT32_MAX || latency_ms < 0) {
+        PyErr_SetString(PyExc_ValueError, "oscs must be 1-65535, block_size 1-4096, event_fifo_len at least 1 and latency_ms at least 0");
+        return NULL;
+    }
+    amy_oscs = oscs;
+    amy_block_size = block_size;
+    amy_event_fifo_len = event_fifo_len;
+    amy_latency_ms = latency_ms;
+    start_amy();
+    amy_started = 1;
+    render_leftover = (int16_t*)malloc(sizeof(int16_t) * BLOCK_SIZE);
+    render_leftover_samples = 0;
+    Py_RETURN_NONE;
+}
+
+static PyObject * stop_wrapper(PyObject *self, PyObject *args) {
+    if(amy_started) {
+        // The speakers' callback renders from the buffers stop_amy() frees, stop it first
+        if(amy_live) {
+            live_stop();
+            amy_live = 0;
+        }
+        stop_amy();
+        free(render_leftover);
+        amy_started = 0;
+    }
+    Py_RETURN_NONE;
+}
+
+// What AMY is running with, as a dict
+static PyObject * config_wrapper(PyObject *self, PyObject *args) {
+    return Py_BuildValue("{s:i,s:i,s:k,s:k,s:i,s:i}", "oscs", OSCS, "block_size", BLOCK_SIZE, "event_fifo_len", (unsigned long)EVENT_FIFO_LEN,
+        "latency_ms", (unsigned long)LATENCY_MS, "sample_rate", SAMPLE_RATE, "render_threads", render_threads);
+}
+
+// How many deltas are in the event queue waiting to play. Without live_start() they only play as render() goes
+static PyObject * queued_wrapper(PyObject *self, PyObject *args) {
+    if(!amy_started) {
+        PyErr_SetString(PyExc_RuntimeError, "call libamy.start() first");
+        return NULL;
+    }
+    return PyLong_FromUnsignedLong(global.event_qsize);
+}
+
+// Set how many threads render the oscs, or just return it with no argument
+static PyObject * render_threads_wrapper(PyObject *self, PyObject *args) {
+    int threads = -1;
+    if(!PyArg_ParseTuple(args, "|i", &threads)) return NULL;
+    if(threads >= 0) {
+        if(!amy_started) {
+            PyErr_SetString(PyExc_RuntimeError, "call libamy.start() first");
+            return NULL;
+        }
+        set_render_threads(threads);
+    }
+    return PyLong_FromLong(render_threads);
+}
+
+// Play out the speakers as well, like alles does
+static PyObject * live_start_wrapper(PyObject *self, PyObject *args) {
+    if(!amy_started) {
+        PyErr_SetString(PyExc_RuntimeError, "call libamy.start() first");
+        return NULL;
+    }
+    if(!amy_live) {
+        live_start();
+        amy_live = 1;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject * live_stop_wrapper(PyObject *self, PyObject *args) {
+    if(amy_live) {
+        live_stop();
+        amy_live = 0;
+    }
+    Py_RETURN_NONE;
+}
+
+// Parse AMY messages, as bytes. Like the multicast listener, this splits ASCII messages on Z and binary ones by
+// their length, so a whole datagram's worth can be sent at once
+static PyObject * send_wrapper(PyObject *self, PyObject *args) {
+    const char * data;
+    Py_ssize_t length;
+    if(!PyArg_ParseTuple(args, "y#", &data, &length)) return NULL;
+    if(!amy_started) {
+        PyErr_SetString(PyExc_RuntimeError, "call libamy.start() first");
+        return NULL;
+    }
+    // parse_task() wants each message 0 terminated, so work on a copy
+    char * messages = (char*)malloc(length + 1);
+    memcpy(messages, data, length);
+    messages[length] = 0;
+    Py_ssize_t start = 0;
+    for(Py_ssize_t i=0;i<length;i++) {
+        if(i == start && (uint8_t)messages[i] == BINARY_MAGIC) {
+            uint8_t binary_length = (i+1 < length) ? (uint8_t)messages[i+1] : 0;
+            if(binary_length < 2 || start + binary_length > length) break;
+            message_start_pointer = messages + start;
+            message_length = binary_length;
+            parse_task();
+            start = start + binary_length;
+            i = start - 1;
+        } else if(messages[i] == 'Z') {
+            messages[i] = 0;
+            message_start_pointer = messages + start;
+            message_length = i - start;
+            parse_task();
+            start = i+1;
+        }
+    }
+    free(messages);
+    Py_RETURN_NONE;
+}
+
+// Render the next samples of audio into buf, with no copies of the blocks in between
+static void render_samples(int16_t * buf, Py_ssize_t samples) {
+    // First what's left of the last block
+    Py_ssize_t done = render_leftover_samples;
+    if(done > samples) done = samples;
+    memcpy(buf, render_leftover + (BLOCK_SIZE - render_leftover_samples), done * sizeof(int16_t));
+    render_leftover_samples -= done;
+    // Then whole blocks right into the output
+    while(samples - done >= BLOCK_SIZE) {
+        fill_audio_buffer(buf + done);
+        done += BLOCK_SIZE;
+    }
+    // And the start of one more, keeping the rest for next time
+    if(done < samples) {
+        fill_audio_buffer(render_leftover);
+        memcpy(buf + done, render_leftover, (samples - done) * sizeof(int16_t));
+        render_leftover_samples = BLOCK_SIZE - (samples - done);
+    }
+}
+
+// Render the next seconds of audio as int16 samples into out, a writable buffer at least that big, and return it.
+// Without out they go in a new bytearray. alles.render() wraps it in a numpy array
+static PyObject * render_wrapper(PyObject *self, PyObject *args) {
+    double seconds;
+    PyObject * out = NULL;
+    if(!PyArg_ParseTuple(args, "d|O", &seconds, &out)) return NULL;
+    if(!amy_started) {
+        PyErr_SetString(PyExc_RuntimeError, "call libamy.start() first");
+        return NULL;
+    }
+    if(seconds < 0) {
+        PyErr_SetString(PyExc_ValueError, "seconds must be positive");
+        return NULL;
+    }
+    Py_ssize_t samples = seconds * SAMPLE_RATE;
+    if(out == NULL || out == Py_None) {
+        out = PyByteArray_FromStringAndSize(NULL, samples * sizeof(int16_t));
+        if(out == NULL) return NULL;
+        render_samples((int16_t *) PyByteArray_AS_STRING(out), samples);
+        return out;
+    }
+    Py_buffer view;
+    if(PyObject_GetBuffer(out, &view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) < 0) return NULL;
+    if(view.len < (Py_ssize_t)(samples * sizeof(int16_t))) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "out is too small for that many samples");
+        return NULL;
+    }
+    render_samples((int16_t *) view.buf, samples);
+    PyBuffer_Release(&view);
+    Py_INCREF(out);
+    return out;
+}
+
+// Time count adds of deltas at random times to the event queue, then taking them all off again, and check
+// they came off in order. Returns (ns per add, ns per pop)
+static PyObject * queue_benchmark_wrapper(PyObject *self, PyObject *args) {
+    int count = EVENT_FIFO_LEN;
+    unsigned int seed = 0;
+    if(!PyArg_ParseTuple(args, "|iI", &count, &seed)) return NULL;
+    if(count < 1) {
+        PyErr_SetString(PyExc_ValueError, "count must be at least 1");
+        return NULL;
+    }
+    // Time the event queue's heap on a heap of our own, so it doesn't touch the live queue or play anything
+    struct delta * heap = (struct delta*)malloc(sizeof(struct delta) * count);
+    struct delta * deltas = (struct delta*)malloc(sizeof(struct delta) * count);
+    uint32_t size = 0;
+    srand(seed);
+    for(int i=0;i<count;i++) {
+        deltas[i].time = ((uint64_t)(rand() % 600000) * SAMPLE_RATE) / 1000; // ten minutes in samples, on whole ms so some share a time
+        deltas[i].osc = 0;
+        deltas[i].param = VELOCITY;
+        deltas[i].data = i;
+        deltas[i].seq = i;
+    }
+    int64_t tic = monotonic_ns();
+    for(int i=0;i<count;i++) delta_heap_push(heap, &size, deltas[i]);
+    int64_t added = monotonic_ns();
+    for(int i=0;i<count;i++) deltas[i] = delta_heap_pop(heap, &size);
+    int64_t popped = monotonic_ns();
+
+    int in_order = 1;
+    for(int i=1;i<count;i++) {
+        if(deltas[i].time < deltas[i-1].time) in_order = 0;
+        if(deltas[i].time == deltas[i-1].time && deltas[i].data < deltas[i-1].data) in_order = 0;
+    }
+    free(deltas);
+    free(heap);
+    if(!in_order) {
+        PyErr_SetString(PyExc_AssertionError, "event queue played deltas out of order");
+        return NULL;
+    }
+    return Py_BuildValue("(dd)", (double)(added - tic) / count, (double)(popped - added) / count);
+}
+
+// Turn render profiling on (from zero) or off if given a bool, and return what it has counted so far: for each wave
+// that rendered, its ticks in each stage, samples, renders and histogram of ticks per osc per render
+static PyObject * profile_wrapper(PyObject *self, PyObject *args) {
+#ifdef AMY_PROFILE
+    PyObject * on = NULL;
+    if(!PyArg_ParseTuple(args, "|O", &on)) return NULL;
+    if(!amy_started) {
+        PyErr_SetString(PyExc_RuntimeError, "call libamy.start() first");
+        return NULL;
+    }
+    if(on != NULL && on != Py_None) amy_profile(PyObject_IsTrue(on));
+    const char * names[PROFILE_WAVES] = { "SINE", "PULSE", "SAW", "TRIANGLE", "NOISE", "KS", "PCM", "ALGO", "PARTIAL", "PARTIALS", "OFF" };
+    PyObject * waves = PyDict_New();
+    for(uint8_t wave=0;wave<PROFILE_WAVES;wave++) {
+        struct profile_wave w;
+        memset(&w, 0, sizeof(w));
+        for(uint8_t core=0;core<MAX_RENDER_THREADS;core++) {
+            for(uint8_t i=0;i<PROFILE_STAGES;i++) w.ticks[i] += profile_waves[core][wave].ticks[i];
+            for(uint8_t b=0;b<PROFILE_BUCKETS;b++) w.histogram[b] += profile_waves[core][wave].histogram[b];
+            w.samples += profile_waves[core][wave].samples;
+            w.renders += profile_waves[core][wave].renders;
+        }
+        if(w.renders == 0) continue;
+        PyObject * histogram = PyList_New(PROFILE_BUCKETS);
+        for(uint8_t b=0;b<PROFILE_BUCKETS;b++) PyList_SET_ITEM(histogram, b, PyLong_FromUnsignedLong(w.histogram[b]));
+        PyObject * stats = Py_BuildValue("{s:K,s:K,s:K,s:K,s:k,s:N}", "hold_and_modify", (unsigned long long)w.ticks[PROFILE_HOLD_AND_MODIFY],
+            "render", (unsigned long long)w.ticks[PROFILE_RENDER], "filter", (unsigned long long)w.ticks[PROFILE_FILTER],
+            "samples", (unsigned long long)w.samples, "renders", (unsigned long)w.renders, "histogram", histogram);
+        PyDict_SetItemString(waves, names[wave], stats);
+        Py_DECREF(stats);
+    }
+    PyObject * oscs = PyList_New(OSCS);
+    for(uint16_t osc=0;osc<OSCS;osc++) {
+        PyList_SET_ITEM(oscs, osc, Py_BuildValue("(KKK)", (unsigned long long)profile_osc_ticks[osc][PROFILE_HOLD_AND_MODIFY],
+            (unsigned long long)profile_osc_ticks[osc][PROFILE_RENDER], (unsigned long long)profile_osc_ticks[osc][PROFILE_FILTER]));
+    }
+    return Py_BuildValue("{s:O,s:N,s:N,s:K,s:k,s:K}", "on", amy_profiling ? Py_True : Py_False, "waves", waves, "oscs", oscs,
+        "eq", (unsigned long long)profile_eq_ticks, "eq_renders", (unsigned long)profile_eq_renders,
+        "ticks_per_second", (unsigned long long)PROFILE_TICKS_PER_SECOND);
+#else
+    PyErr_SetString(PyExc_RuntimeError, "libamy was built without AMY_PROFILE");
+    return NULL;
+#endif
+}
+
+static PyMethodDef libAMYMethods[] = {
+    {"start", (PyCFunction)(void(*)(void))start_wrapper, METH_VARARGS | METH_KEYWORDS, "Start AMY"},
+    {"stop", stop_wrapper, METH_VARARGS, "Stop AMY"},
+    {"config", config_wrapper, METH_VARARGS, "Get the oscs, block size, event queue length and latency AMY runs with"},
+    {"send", send_wrapper, METH_VARARGS, "Send AMY messages"},
+    {"queued", queued_wrapper, METH_VARARGS, "How many deltas are waiting in the event queue"},
+    {"render", render_wrapper, METH_VARARGS, "Render seconds of audio as int16 samples, into out if given"},
+    {"render_threads", render_threads_wrapper, METH_VARARGS, "Set how many threads render the oscs"},
+    {"live_start", live_start_wrapper, METH_VARARGS, "Play out the speakers"},
+    {"live_stop", live_stop_wrapper, METH_VARARGS, "Stop playing out the speakers"},
+    {"profile", profile_wrapper, METH_VARARGS, "Turn render profiling on or off and get its counts"},
+    {"queue_benchmark", queue_benchmark_wrapper, METH_VARARGS, "Time adding and playing deltas on the event queue"},
+    { NULL, NULL, 0, NULL }
+};
+
+static struct PyModuleDef libamyDef = {
+    PyModuleDef_HEAD_INIT,
+    "libamy",
+    "AMY, the Alles synthesis engine",
+    -1,
+    libAMYMethods
+};
+
+PyMODINIT_FUNC PyInit_libamy(void) {
+    return PyModule_Create(&libamyDef);
+}
@@ -64,18 +64,18 @@ const float *choose_from_lutset(float period, lut_entry *lutset, int16_t *plut_s
 // step == scaled_phase
 // skip == step (scaled_step)
 
-float render_lut_fm_osc(float * buf, float phase, float step, float incoming_amp, float ending_amp, const float* lut, int16_t lut_size, float * mod, float feedback_level, float * last_two) { 
+float render_lut_fm_osc(float * buf, float phase, float step, float incoming_amp, float ending_amp, const float* lut, int16_t lut_size, float * mod, float feedback_level, float * last_two, uint16_t len) { 
     int lut_mask = lut_size - 1;
     float past0 = last_two[0];
     float past1 = last_two[1];
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+    for(uint16_t i=0;i<len;i++) {
         float scaled_phase = lut_size * (phase + mod[i] + feedback_level * ((past1 + past0) / 2.0));
         int base_index = (int)scaled_phase;
         float frac = scaled_phase - base_index;
         float b = lut[base_index & lut_mask];
         float c = lut[(base_index+1) & lut_mask];
         float sample = b + ((c - b) * frac);
-        float scaled_amp = incoming_amp + (ending_amp - incoming_amp)*((float)i/(float)BLOCK_SIZE);
+        float scaled_amp = incoming_amp + (ending_amp - incoming_amp)*((float)i/(float)len);
         buf[i] += sample * scaled_amp;
         phase += step;
         phase -= (int)phase;
@@ -89,10 +89,10 @@ float render_lut_fm_osc(float * buf, float phase, float step, float incoming_amp
 
 // TODO -- move this render_LUT to use the "New terminology" that render_lut_fm_osc uses
 // pass in unscaled phase, use step instead of skip, etc
-float render_lut(float * buf, float step, float skip, float incoming_amp, float ending_amp, const float* lut, int32_t lut_size) { 
+float render_lut(float * buf, float step, float skip, float incoming_amp, float ending_amp, const float* lut, int32_t lut_size, uint16_t len) { 
     // We assume lut_size == 2^R for some R, so (lut_size - 1) consists of R '1's in binary.
     int lut_mask = lut_size - 1;
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+    for(uint16_t i=0;i<len;i++) {
         // Floor is very slow on the esp32, so we just cast. Dan told me to add this comment. -- baw
         //uint16_t base_index = (uint16_t)floor(step);
         uint32_t base_index = (uint32_t)step;
@@ -115,7 +115,7 @@ float render_lut(float * buf, float step, float skip, float incoming_amp, float
         float cminusb = c - b;
         float sample = b + frac * (cminusb - 0.1666667f * (1.-frac) * ((d - a - 3.0f * cminusb) * frac + (d + 2.0f*a - 3.0f*b)));
 #endif /* LINEAR_INTERP */
-        float scaled_amp = incoming_amp + (ending_amp - incoming_amp)*((float)i/(float)BLOCK_SIZE);
+        float scaled_amp = incoming_amp + (ending_amp - incoming_amp)*((float)i/(float)len);
         buf[i] += sample * scaled_amp;
 
         step += skip;
@@ -124,9 +124,9 @@ float render_lut(float * buf, float step, float skip, float incoming_amp, float
     return step;
 }
 
-float render_am_lut(float * buf, float step, float skip, float incoming_amp, float ending_amp, const float* lut, int16_t lut_size, float *mod, float bandwidth) { 
+float render_am_lut(float * buf, float step, float skip, float incoming_amp, float ending_amp, const float* lut, int16_t lut_size, float *mod, float bandwidth, uint16_t len) { 
     int lut_mask = lut_size - 1;
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+    for(uint16_t i=0;i<len;i++) {
         uint16_t base_index = (uint16_t)step;
         float frac = step - (float)base_index;
         float b = lut[(base_index + 0) & lut_mask];
@@ -134,7 +134,7 @@ float render_am_lut(float * buf, float step, float skip, float incoming_amp, flo
         float sample = b + ((c - b) * frac);
         float mod_sample = mod[i]; // * (1.0 / bandwidth);
         float am = dsps_sqrtf_f32_ansi(1.0-bandwidth) + (mod_sample * dsps_sqrtf_f32_ansi(2.0*bandwidth));
-        float scaled_amp = incoming_amp + (ending_amp - incoming_amp)*((float)i/(float)BLOCK_SIZE);
+        float scaled_amp = incoming_amp + (ending_amp - incoming_amp)*((float)i/(float)len);
         buf[i] += sample * scaled_amp * am ;
         step += skip;
         if(step >= lut_size) step -= lut_size;
@@ -142,9 +142,9 @@ float render_am_lut(float * buf, float step, float skip, float incoming_amp, flo
     return step;
 }
 
-void lpf_buf(float *buf, float decay, float *state) {
+void lpf_buf(float *buf, float decay, float *state, uint16_t len) {
     // Implement first-order low-pass (leaky integrator).
-    for (uint16_t i = 0; i < BLOCK_SIZE; ++i) {
+    for (uint16_t i = 0; i < len; ++i) {
         float s = *state;
         buf[i] = decay * s + buf[i];
         *state = buf[i];
@@ -156,7 +156,7 @@ void lpf_buf(float *buf, float decay, float *state) {
 
 /* Pulse wave */
 
-void pulse_note_on(uint8_t osc) {
+void pulse_note_on(uint16_t osc) {
     float period_samples = (float)SAMPLE_RATE / synth[osc].freq;
     synth[osc].lut = choose_from_lutset(period_samples, impulse_lutset, &synth[osc].lut_size);
     synth[osc].step = (float)synth[osc].lut_size * synth[osc].phase;
@@ -166,7 +166,7 @@ void pulse_note_on(uint8_t osc) {
     synth[osc].lpf_state = -0.5 * amp * synth[osc].lut[0];
 }
 
-void render_pulse(float * buf, uint8_t osc) {
+void render_pulse(float * buf, uint16_t osc, uint16_t len) {
     // LPF time constant should be ~ 10x osc period, so droop is minimal.
     float period_samples = (float)SAMPLE_RATE / msynth[osc].freq;
     synth[osc].lpf_alpha = 1.0 - 1.0 / (10.0 * period_samples);
@@ -178,20 +178,23 @@ void render_pulse(float * buf, uint8_t osc) {
     float amp = msynth[osc].amp * skip * 4.0 / synth[osc].lut_size;
     float pwm_step = synth[osc].step + duty * synth[osc].lut_size;
     if (pwm_step >= synth[osc].lut_size)  pwm_step -= synth[osc].lut_size;
-    synth[osc].step = render_lut(buf, synth[osc].step, skip, synth[osc].last_amp, amp, synth[osc].lut, synth[osc].lut_size);
-    render_lut(buf, pwm_step, skip, -synth[osc].last_amp, -amp, synth[osc].lut, synth[osc].lut_size);
-    lpf_buf(buf, synth[osc].lpf_alpha, &synth[osc].lpf_state);
+    synth[osc].step = render_lut(buf, synth[osc].step, skip, synth[osc].last_amp, amp, synth[osc].lut, synth[osc].lut_size, len);
+    render_lut(buf, pwm_step, skip, -synth[osc].last_amp, -amp, synth[osc].lut, synth[osc].lut_size, len);
+    lpf_buf(buf, synth[osc].lpf_alpha, &synth[osc].lpf_state, len);
     synth[osc].last_amp = amp;
 }
 
-void pulse_mod_trigger(uint8_t osc) {
+void pulse_mod_trigger(uint16_t osc) {
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;
     float period = 1. / (synth[osc].freq/mod_sr);
     synth[osc].step = period * synth[osc].phase;
 }
 
+// The compute_mod_ functions run from update_mod_sources() once per render at the control rate mod_sr, one step per BLOCK_SIZE samples.
+// A render of len samples (less than BLOCK_SIZE when a block is split at an event) moves them len/BLOCK_SIZE of a step
+
 // dpwe sez to use this method for low-freq mod pulse still 
-float compute_mod_pulse(uint8_t osc) {
+float compute_mod_pulse(uint16_t osc, uint16_t len) {
     // do BW pulse gen at SR=44100/64
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;
     if(msynth[osc].duty < 0.001 || msynth[osc].duty > 0.999) msynth[osc].duty = 0.5;
@@ -203,18 +206,19 @@ float compute_mod_pulse(uint8_t osc) {
         synth[osc].step = 0;
     } 
     if(synth[osc].sample == 1) {
-        if(synth[osc].substep++ > period2) {
+        if(synth[osc].substep > period2) {
             synth[osc].sample = -1;
         }
+        synth[osc].substep += (float)len / (float)BLOCK_SIZE;
     }
-    synth[osc].step++;
+    synth[osc].step += (float)len / (float)BLOCK_SIZE;
     return (synth[osc].sample * msynth[osc].amp); // -1 .. 1
 }
 
 
 /* Saw wave */
 
-void saw_note_on(uint8_t osc) {
+void saw_note_on(uint16_t osc) {
     float period_samples = (float)SAMPLE_RATE / synth[osc].freq;
     synth[osc].lut = choose_from_lutset(period_samples, impulse_lutset, &synth[osc].lut_size);
     synth[osc].step = (float)synth[osc].lut_size * synth[osc].phase;
@@ -231,33 +235,33 @@ void saw_note_on(uint8_t osc) {
     synth[osc].dc_offset = -lut_sum / synth[osc].lut_size;
 }
 
-void render_saw(float * buf, uint8_t osc) {
+void render_saw(float * buf, uint16_t osc, uint16_t len) {
     float period_samples = (float)SAMPLE_RATE / msynth[osc].freq;
     synth[osc].lpf_alpha = 1.0 - 1.0 / (10.0 * period_samples);
     float skip = synth[osc].lut_size / period_samples;
     // Scale the impulse proportional to the skip so its integral remains ~constant.
     float amp = msynth[osc].amp * skip * 4.0 / synth[osc].lut_size;
     synth[osc].step = render_lut(
-          buf, synth[osc].step, skip, synth[osc].last_amp, amp, synth[osc].lut, synth[osc].lut_size);
+          buf, synth[osc].step, skip, synth[osc].last_amp, amp, synth[osc].lut, synth[osc].lut_size, len);
     // Give the impulse train a negative bias so that it integrates to zero mean.
     float offset = amp * synth[osc].dc_offset;
-    for (int i = 0; i < BLOCK_SIZE; ++i) {
+    for (int i = 0; i < len; ++i) {
         buf[i] += offset;
     }
-    lpf_buf(buf, synth[osc].lpf_alpha, &synth[osc].lpf_state);
+    lpf_buf(buf, synth[osc].lpf_alpha, &synth[osc].lpf_state, len);
     synth[osc].last_amp = amp;
 }
 
 
 
-void saw_mod_trigger(uint8_t osc) {
+void saw_mod_trigger(uint16_t osc) {
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;
     float period = 1. / (synth[osc].freq/mod_sr);
     synth[osc].step = period * synth[osc].phase;
 }
 
 // TODO -- this should use dpwe code
-float compute_mod_saw(uint8_t osc) {
+float compute_mod_saw(uint16_t osc, uint16_t len) {
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;
     float period = 1. / (msynth[osc].freq/mod_sr);
     if(synth[osc].step >= period || synth[osc].step == 0) {
@@ -266,36 +270,36 @@ float compute_mod_saw(uint8_t osc) {
     } else {
         synth[osc].sample = -1 + (synth[osc].step * (2.0 / period));
     }
-    synth[osc].step++;
+    synth[osc].step += (float)len / (float)BLOCK_SIZE;
     return (synth[osc].sample * msynth[osc].amp); 
 }
 
 
 /* triangle wave */
 
-void triangle_note_on(uint8_t osc) {
+void triangle_note_on(uint16_t osc) {
     float period_samples = (float)SAMPLE_RATE / synth[osc].freq;
     synth[osc].lut = choose_from_lutset(period_samples, triangle_lutset, &synth[osc].lut_size);
     synth[osc].step = (float)synth[osc].lut_size * synth[osc].phase;
 }
 
-void render_triangle(float * buf, uint8_t osc) {
+void render_triangle(float * buf, uint16_t osc, uint16_t len) {
     float period_samples = (float)SAMPLE_RATE / msynth[osc].freq;
     float skip = synth[osc].lut_size / period_samples;
     float amp = msynth[osc].amp;
-    synth[osc].step = render_lut(buf, synth[osc].step, skip, synth[osc].last_amp, amp, synth[osc].lut, synth[osc].lut_size);
+    synth[osc].step = render_lut(buf, synth[osc].step, skip, synth[osc].last_amp, amp, synth[osc].lut, synth[osc].lut_size, len);
     synth[osc].last_amp = amp;
 }
 
 
-void triangle_mod_trigger(uint8_t osc) {
+void triangle_mod_trigger(uint16_t osc) {
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;
     float period = 1. / (synth[osc].freq/mod_sr);
     synth[osc].step = period * synth[osc].phase;
 }
 
 // TODO -- this should use dpwe code 
-float compute_mod_triangle(uint8_t osc) {
+float compute_mod_triangle(uint16_t osc, uint16_t len) {
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;    
     float period = 1. / (msynth[osc].freq/mod_sr);
     if(synth[osc].step >= period || synth[osc].step == 0) {
@@ -308,7 +312,7 @@ float compute_mod_triangle(uint8_t osc) {
             synth[osc].sample = 1 - ((synth[osc].step-(period/2)) * (2 / period * 2));
         }
     }
-    synth[osc].step++;
+    synth[osc].step += (float)len / (float)BLOCK_SIZE;
     return (synth[osc].sample * msynth[osc].amp); // -1 .. 1
     
 }
@@ -319,7 +323,7 @@ extern int64_t total_samples;
 
 /* FM */
 // NB this uses new lingo for step, skip, phase etc
-void fm_sine_note_on(uint8_t osc, uint8_t algo_osc) {
+void fm_sine_note_on(uint16_t osc, uint16_t algo_osc) {
     if(synth[osc].ratio >= 0) {
         msynth[osc].freq = (msynth[algo_osc].freq * synth[osc].ratio);
     }
@@ -327,7 +331,7 @@ void fm_sine_note_on(uint8_t osc, uint8_t algo_osc) {
     float period_samples = (float)SAMPLE_RATE / msynth[osc].freq;
     synth[osc].lut = choose_from_lutset(period_samples, sine_lutset, &synth[osc].lut_size);
 }
-void render_fm_sine(float *buf, uint8_t osc, float *mod, float feedback_level, uint8_t algo_osc) {
+void render_fm_sine(float *buf, uint16_t osc, float *mod, float feedback_level, uint16_t algo_osc, uint16_t len) {
     if(synth[osc].ratio >= 0) {
         msynth[osc].freq = msynth[algo_osc].freq * synth[osc].ratio;
     }
@@ -335,13 +339,13 @@ void render_fm_sine(float *buf, uint8_t osc, float *mod, float feedback_level, u
     float step = msynth[osc].freq / (float)SAMPLE_RATE;
     float amp = msynth[osc].amp;
     synth[osc].phase = render_lut_fm_osc(buf, synth[osc].phase, step, synth[osc].last_amp, amp, 
-                 synth[osc].lut, synth[osc].lut_size, mod, feedback_level, synth[osc].last_two);
+                 synth[osc].lut, synth[osc].lut_size, mod, feedback_level, synth[osc].last_two, len);
     synth[osc].last_amp = amp;
 }
 
 /* sine */
 
-void sine_note_on(uint8_t osc) {
+void sine_note_on(uint16_t osc) {
     // There's really only one sine table, but for symmetry with the other ones...
     //float period_samples = (float)SAMPLE_RATE / synth[osc].freq;
     synth[osc].lut = sine_lutable_0; //choose_from_lutset(period_samples, sine_lutset, &synth[osc].lut_size);
@@ -349,76 +353,89 @@ void sine_note_on(uint8_t osc) {
     synth[osc].step = (float)synth[osc].lut_size * synth[osc].phase;
 }
 
-void render_partial(float * buf, uint8_t osc) {
+void render_partial(float * buf, uint16_t osc, uint16_t len) {
     if(msynth[osc].feedback > 0) {
         float scratch[2][BLOCK_SIZE];
-        for(uint16_t i=0;i<BLOCK_SIZE;i++) scratch[0][i] = get_random() *  20.0;
+        for(uint16_t i=0;i<len;i++) scratch[0][i] = get_random() *  20.0;
         dsps_biquad_gen_lpf_f32(coeffs[osc], 100.0/SAMPLE_RATE, 0.707);
         #ifdef ESP_PLATFORM
-            dsps_biquad_f32_ae32(scratch[0], scratch[1], BLOCK_SIZE, coeffs[osc], delay[osc]);
+            dsps_biquad_f32_ae32(scratch[0], scratch[1], len, coeffs[osc], delay[osc]);
         #else
-            dsps_biquad_f32_ansi(scratch[0], scratch[1], BLOCK_SIZE, coeffs[osc], delay[osc]);
+            dsps_biquad_f32_ansi(scratch[0], scratch[1], len, coeffs[osc], delay[osc]);
         #endif
         float skip = msynth[osc].freq / (float)SAMPLE_RATE * synth[osc].lut_size;
         float amp = msynth[osc].amp;
         synth[osc].step = render_am_lut(buf, synth[osc].step, skip, synth[osc].last_amp, amp, 
-                 synth[osc].lut, synth[osc].lut_size, scratch[1], msynth[osc].feedback);
+                 synth[osc].lut, synth[osc].lut_size, scratch[1], msynth[osc].feedback, len);
     } else {
         float skip = msynth[osc].freq / (float)SAMPLE_RATE * synth[osc].lut_size;
         float amp = msynth[osc].amp;
         synth[osc].step = render_lut(buf, synth[osc].step, skip, synth[osc].last_amp, amp, 
-                    synth[osc].lut, synth[osc].lut_size);
+                    synth[osc].lut, synth[osc].lut_size, len);
     }
     synth[osc].last_amp = msynth[osc].amp;
+    // Fades run over BLOCK_SIZE samples even when the block is rendered in pieces, fade counts how far along they are
     if(synth[osc].substep==1) {
         // fade in
         //printf("%d fading in partial osc %d from 0 to %f\n", total_samples, osc, msynth[osc].amp);
-        synth[osc].substep = 0;
-        for(uint16_t i=0;i<BLOCK_SIZE;i++) buf[i] = buf[i] * ((float)i/(float)BLOCK_SIZE);
+        for(uint16_t i=0;i<len && synth[osc].fade<BLOCK_SIZE;i++) buf[i] = buf[i] * ((float)synth[osc].fade++/(float)BLOCK_SIZE);
+        if(synth[osc].fade >= BLOCK_SIZE) synth[osc].substep = 0;
     }
     if(synth[osc].substep==2) {
         // fade out
         //printf("%d fading out partial osc %d from %f to 0\n", total_samples, osc, msynth[osc].amp);
-        synth[osc].substep = 0;
-        for(uint16_t i=0;i<BLOCK_SIZE;i++) buf[i] = buf[i] * ((float)(BLOCK_SIZE-i)/(float)BLOCK_SIZE);
-        synth[osc].status=OFF; 
-
+        for(uint16_t i=0;i<len;i++) {
+            if(synth[osc].fade < BLOCK_SIZE) {
+                buf[i] = buf[i] * ((float)(BLOCK_SIZE-synth[osc].fade++)/(float)BLOCK_SIZE);
+            } else {
+                buf[i] = 0;
+            }
+        }
+        if(synth[osc].fade >= BLOCK_SIZE) {
+            synth[osc].substep = 0;
+            synth[osc].status=OFF; 
+            synth[osc].note_off_clock = -1;
+        }
     }
     //printf("%d rendering partial osc %d at %f %f\n", total_samples, osc, msynth[osc].amp, msynth[osc].freq);
 }
 
-void partial_note_on(uint8_t osc) {
+void partial_note_on(uint16_t osc) {
     synth[osc].lut = sine_lutable_0; //choose_from_lutset(period_samples, sine_lutset, &synth[osc].lut_size);
     synth[osc].lut_size = 256;
     if(synth[osc].phase >= 0) {
         synth[osc].step = (float)synth[osc].lut_size * synth[osc].phase;
         synth[osc].substep = 1; // use for block fade
+        synth[osc].fade = 0;
     } // else keep the old step / no fade, it's a continuation
 
 }
 
-void partial_note_off(uint8_t osc) {
+void partial_note_off(uint16_t osc) {
+    // Fade out from wherever a fade in got to, not from full
+    if(synth[osc].substep == 1) synth[osc].fade = BLOCK_SIZE - synth[osc].fade;
+    else if(synth[osc].substep != 2) synth[osc].fade = 0;
     synth[osc].substep = 2;
     synth[osc].note_on_clock = -1;
     synth[osc].note_off_clock = total_samples;   
 }
 
-void render_sine(float * buf, uint8_t osc) { 
+void render_sine(float * buf, uint16_t osc, uint16_t len) { 
 
     float skip = msynth[osc].freq / (float)SAMPLE_RATE * synth[osc].lut_size;
     synth[osc].step = render_lut(buf, synth[osc].step, skip, synth[osc].last_amp, msynth[osc].amp, 
-				 synth[osc].lut, synth[osc].lut_size);
+				 synth[osc].lut, synth[osc].lut_size, len);
     synth[osc].last_amp = msynth[osc].amp;
     //printf("sysclock %d amp %f\n", get_sysclock(), msynth[osc].amp);
 }
 
 
 // TOOD -- not needed anymore
-float compute_mod_sine(uint8_t osc) { 
+float compute_mod_sine(uint16_t osc, uint16_t len) { 
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;
     int sinlut_size = sine_lutset[0].table_size;
     const float *sinlut = sine_lutset[0].table;
-    float skip = msynth[osc].freq / mod_sr * sinlut_size;
+    float skip = msynth[osc].freq / mod_sr * sinlut_size * ((float)len / (float)BLOCK_SIZE);
 
     int lut_mask = sinlut_size - 1;
     uint16_t base_index = (uint16_t)(synth[osc].step);
@@ -433,7 +450,7 @@ float compute_mod_sine(uint8_t osc) {
 }
 
 
-void sine_mod_trigger(uint8_t osc) {
+void sine_mod_trigger(uint16_t osc) {
     sine_note_on(osc);
 }
 
@@ -448,22 +465,22 @@ float get_random() {
 
 /* noise */
 
-void render_noise(float *buf, uint8_t osc) {
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+void render_noise(float *buf, uint16_t osc, uint16_t len) {
+    for(uint16_t i=0;i<len;i++) {
         buf[i] = get_random() * msynth[osc].amp; 
     }
 }
 
-float compute_mod_noise(uint8_t osc) {
+float compute_mod_noise(uint16_t osc, uint16_t len) {
     return get_random() * msynth[osc].amp;
 }
 
 /* karplus-strong */
 
-void render_ks(float * buf, uint8_t osc) {
+void render_ks(float * buf, uint16_t osc, uint16_t len) {
     if(msynth[osc].freq >= 55) { // lowest note we can play
         uint16_t buflen = (SAMPLE_RATE / msynth[osc].freq);
-        for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+        for(uint16_t i=0;i<len;i++) {
             uint16_t index = (synth[osc].step);
             synth[osc].sample = ks_buffer[ks_polyphony_index][index];
             ks_buffer[ks_polyphony_index][index] = (ks_buffer[ks_polyphony_index][index] + ks_buffer[ks_polyphony_index][(index + 1) % buflen]) * 0.5 * synth[osc].feedback;
@@ -473,7 +490,7 @@ void render_ks(float * buf, uint8_t osc) {
     }
 }
 
-void ks_note_on(uint8_t osc) {
+void ks_note_on(uint16_t osc) {
     if(msynth[osc].freq<=0) msynth[osc].freq = 1;
     uint16_t buflen = (SAMPLE_RATE / msynth[osc].freq);
     if(buflen > MAX_KS_BUFFER_LEN) buflen = MAX_KS_BUFFER_LEN;
@@ -485,7 +502,7 @@ void ks_note_on(uint8_t osc) {
     if(ks_polyphony_index == KS_OSCS) ks_polyphony_index = 0;
 }
 
-void ks_note_off(uint8_t osc) {
+void ks_note_off(uint16_t osc) {
     msynth[osc].amp = 0;
 }
 
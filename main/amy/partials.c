@@ -32,7 +32,7 @@ typedef struct {
 
 
 // choose a patch from the .h file
-void partials_note_on(uint8_t osc) {
+void partials_note_on(uint16_t osc) {
     // just like PCM, start & end breakpoint are stored here
     partial_breakpoint_map_t patch = partial_breakpoint_map[synth[osc].patch];
     synth[osc].step = patch.bp_offset;
@@ -44,7 +44,7 @@ void partials_note_on(uint8_t osc) {
     }
 }
 
-void partials_note_off(uint8_t osc) {
+void partials_note_off(uint16_t osc) {
     // todo; finish the sustain
     synth[osc].step = -1;
 }
@@ -52,7 +52,7 @@ void partials_note_off(uint8_t osc) {
 // render a full partial set at offset osc (with patch)
 // freq controls pitch_ratio, amp amp_ratio, ratio controls time ratio
 // do all patches have sustain point?
-void render_partials(float *buf, uint8_t osc) {
+void render_partials(float *buf, uint16_t osc, uint16_t len) {
     partial_breakpoint_map_t patch = partial_breakpoint_map[synth[osc].patch % PARTIALS_PATCHES];
     // If ratio is set (not 0 or -1), use it for a time stretch
     float time_ratio = 1;
@@ -66,7 +66,7 @@ void render_partials(float *buf, uint8_t osc) {
             partial_breakpoint_t pb = partial_breakpoints[(uint32_t)synth[osc].step];
             if(ms_since_started >= pb.ms_offset ) {
                 // set up this oscillator
-                uint8_t o = (pb.osc + 1 + osc) % OSCS; // just in case
+                uint16_t o = (pb.osc + 1 + osc) % OSCS; // just in case
     
                 #ifdef ESP_PLATFORM
                     if(o % 2) o = o + 32; // scale
@@ -124,19 +124,19 @@ void render_partials(float *buf, uint8_t osc) {
     // now, render everything, add it up
     uint8_t oscs = patch.oscs_alloc;
     float pbuf[BLOCK_SIZE];
-    for(uint8_t i=osc+1;i<osc+1+oscs;i++) {
-        uint8_t o = i % OSCS;
+    for(uint16_t i=osc+1;i<osc+1+oscs;i++) {
+        uint16_t o = i % OSCS;
         #ifdef ESP_PLATFORM
             if(o % 2) o = o + 32; // scale
         #endif
         if(synth[o].status ==IS_ALGO_SOURCE) {
-            hold_and_modify(o);
+            hold_and_modify(o, len);
             //printf("[%d %d] %d amp %f (%f) freq %f (%f) on %d off %d bp0 %d %f bp1 %d %f wave %d\n", total_samples, ms_since_started, o, synth[o].amp, msynth[o].amp, synth[o].freq, msynth[o].freq, synth[o].note_on_clock, synth[o].note_off_clock, synth[o].breakpoint_times[0][0], 
             //    synth[o].breakpoint_values[0][0], synth[o].breakpoint_times[1][0], synth[o].breakpoint_values[1][0], synth[o].wave);
-            for(uint16_t j=0;j<BLOCK_SIZE;j++) pbuf[j] = 0;
-            if(synth[o].wave==SINE) render_sine(pbuf, o);
-            if(synth[o].wave==PARTIAL) render_partial(pbuf, o); 
-            for(uint16_t j=0;j<BLOCK_SIZE;j++) buf[j] = buf[j] + (pbuf[j] * msynth[osc].amp);
+            for(uint16_t j=0;j<len;j++) pbuf[j] = 0;
+            if(synth[o].wave==SINE) render_sine(pbuf, o, len);
+            if(synth[o].wave==PARTIAL) render_partial(pbuf, o, len); 
+            for(uint16_t j=0;j<len;j++) buf[j] = buf[j] + (pbuf[j] * msynth[osc].amp);
         }
     }
 }
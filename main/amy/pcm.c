@@ -29,7 +29,7 @@ void pcm_init() {
 */
 }
 
-void pcm_note_on(uint8_t osc) {
+void pcm_note_on(uint16_t osc) {
 	// if no freq given, just play it at midinote
 	if(synth[osc].patch<0) synth[osc].patch = 0;
 	pcm_map_t patch = pcm_map[synth[osc].patch];
@@ -44,11 +44,11 @@ void pcm_note_on(uint8_t osc) {
     synth[osc].lpf_alpha = patch.loopend;
 }
 
-void pcm_mod_trigger(uint8_t osc) {
+void pcm_mod_trigger(uint16_t osc) {
     pcm_note_on(osc);
 }
 
-void pcm_note_off(uint8_t osc) {
+void pcm_note_off(uint16_t osc) {
     // if looping set, set loopend to the end of the sample, so it'll play through and die out
     if(msynth[osc].feedback > 0) {
         synth[osc].lpf_alpha = synth[osc].substep;
@@ -58,7 +58,7 @@ void pcm_note_off(uint8_t osc) {
     }
 }
 
-void render_pcm(float * buf, uint8_t osc) {
+void render_pcm(float * buf, uint16_t osc, uint16_t len) {
     pcm_map_t patch = pcm_map[synth[osc].patch];
     float playback_freq = PCM_SAMPLE_RATE;
     if(msynth[osc].freq < PCM_SAMPLE_RATE) { // user adjusted freq 
@@ -66,7 +66,7 @@ void render_pcm(float * buf, uint8_t osc) {
         playback_freq = (msynth[osc].freq / base_freq) * PCM_SAMPLE_RATE;
     }
     float skip = playback_freq / (float)SAMPLE_RATE;
-    for(uint16_t i=0;i<BLOCK_SIZE;i++) {
+    for(uint16_t i=0;i<len;i++) {
         float float_index = synth[osc].step;
         uint32_t base_index = (uint32_t) float_index;
         float frac = float_index - (float)base_index;
@@ -90,9 +90,9 @@ void render_pcm(float * buf, uint8_t osc) {
 
 }
 
-float compute_mod_pcm(uint8_t osc) {
+float compute_mod_pcm(uint16_t osc, uint16_t len) {
     float mod_sr = (float)SAMPLE_RATE / (float)BLOCK_SIZE;
-    float skip = msynth[osc].freq / mod_sr;
+    float skip = msynth[osc].freq / mod_sr * ((float)len / (float)BLOCK_SIZE);
     float sample = pcm[(int)(synth[osc].step)];
     synth[osc].step = (synth[osc].step + skip);
     if(synth[osc].step >= synth[osc].substep ) { // end
@@ -6,7 +6,11 @@ sources = glob.glob("*.c")
 os.environ["CC"] = "gcc"
 os.environ["CXX"] = "g++"
 
-extension_mod = Extension("libamy", sources=sources, extra_link_args=["-lsoundio", "-lpthread"])
+# AMY_PROFILE=1 python setup.py build builds in render profiling, libamy.profile(True) turns it on
+define_macros = []
+if(os.environ.get("AMY_PROFILE", "0") not in ("", "0")):
+    define_macros.append(("AMY_PROFILE", None))
+extension_mod = Extension("libamy", sources=sources, define_macros=define_macros, extra_link_args=["-lsoundio", "-lpthread"])
 
 setup(name = "libamy", 
 	ext_modules=[extension_mod])
\ No newline at end of file
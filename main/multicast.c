@@ -217,7 +217,20 @@ void mcast_listen_task(void *pvParameters) {
                     uint16_t start = 0;
                     // Break the packet up into messages (delimited by \n.)
                     for(uint16_t i=0;i<full_message_length;i++) {
-                        if(udp_message[i] == 'Z') {
+                        if(i == start && (uint8_t)udp_message[i] == BINARY_MAGIC) {
+                            // Binary messages can have Zs in them, so use the length in their header instead
+                            uint8_t binary_length = (i+1 < full_message_length) ? (uint8_t)udp_message[i+1] : 0;
+                            if(binary_length < 2 || start + binary_length > full_message_length) break;
+                            udp_message_counter++;
+                            message_start_pointer = udp_message + start;
+                            message_length = binary_length;
+                            // tell the parse task, time to parse this message into deltas and add to the queue
+                            xTaskNotifyGive(parseTask);
+                            // And wait for it to come back
+                            ulTaskNotifyTake(pdFALSE, portMAX_DELAY);
+                            start = start + binary_length;
+                            i = start - 1;
+                        } else if(udp_message[i] == 'Z') {
                             udp_message[i] = 0;
                             udp_message_counter++;
                             message_start_pointer = udp_message + start;
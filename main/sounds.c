@@ -2,7 +2,7 @@
 // various little "make a sound in firmware" methods
 #include "alles.h"
 
-void note_on(int8_t osc, int64_t time) {
+void note_on(uint16_t osc, int64_t time) {
     struct event e = default_event();
     e.osc = osc;
     e.time = time;
@@ -15,9 +15,9 @@ void note_on(int8_t osc, int64_t time) {
 
 void upgrade_tone() {
     struct event e = default_event();
-    int64_t sysclock = get_sysclock();
+    int64_t now = total_samples;
     e.osc = 0;
-    e.time = sysclock;
+    e.time = now;
     e.wave = SINE;
     e.freq = 220;
     parse_breakpoint(&e, "0,0,10,1,500,0,0,0",0);
@@ -35,9 +35,9 @@ void upgrade_tone() {
 // Play a sonar ping -- searching for wifi
 void wifi_tone() {
     struct event e = default_event();
-    int64_t sysclock = get_sysclock();
+    int64_t now = total_samples;
     e.osc = 0;
-    e.time = sysclock;
+    e.time = now;
     e.wave = SINE;
     e.freq = 440;
     parse_breakpoint(&e, "0,0,10,1,500,0,0,0",0);
@@ -54,17 +54,17 @@ void wifi_tone() {
 // Schedule a bleep now
 void bleep() {
     struct event e = default_event();
-    int64_t sysclock = get_sysclock();
-    e.time = sysclock;
+    int64_t now = total_samples;
+    e.time = now;
     e.wave = SINE;
     e.freq = 220;
     add_event(e);
     e.velocity = 1;
     add_event(e);
-    e.time = sysclock + 150;
+    e.time = now + sysclock_to_samples(150);
     e.freq = 440;
     add_event(e);
-    e.time = sysclock + 300;
+    e.time = now + sysclock_to_samples(300);
     e.velocity = 0;
     e.amp = 0;
     e.freq = 0;
@@ -73,16 +73,16 @@ void bleep() {
 
 void debleep() {
     struct event e = default_event();
-    int64_t sysclock = get_sysclock();
-    e.time = sysclock;
+    int64_t now = total_samples;
+    e.time = now;
     e.wave = SINE;
     e.freq = 440;
     e.velocity = 1;
     add_event(e);
-    e.time = sysclock + 150;
+    e.time = now + sysclock_to_samples(150);
     e.freq = 220;
     add_event(e);
-    e.time = sysclock + 300;
+    e.time = now + sysclock_to_samples(300);
     e.velocity = 0;
     e.freq = 0;
     add_event(e);
@@ -92,9 +92,9 @@ void debleep() {
 // Plays a short scale 
 void scale(uint8_t wave) {
     struct event e = default_event();
-    int64_t sysclock = get_sysclock();
+    int64_t now = total_samples;
     for(uint8_t i=0;i<12;i++) {
-        e.time = sysclock + (i*250);
+        e.time = now + sysclock_to_samples(i*250);
         e.wave = wave;
         e.midi_note = 48+i;
         e.velocity = 1;
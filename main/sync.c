@@ -66,14 +66,23 @@ void update_map(uint8_t client, uint8_t ipv4, int64_t time) {
     }
 }
 
+// A sync reply or ping: my time, the sync index (-1 for a ping), my client id, ip and battery status, then how I'm
+// doing -- deltas on my event queue, deltas dropped and events that came in late since boot, and the average and
+// peak render time per block as a % of its duration. Starts a new peak
+void sync_message(char * message, int64_t sysclock, int8_t index) {
+    sprintf(message, "_s%lldi%dc%dr%dy%dq%ud%ul%uu%dm%dZ", sysclock, index, client_id, ipv4_quartet, battery_mask,
+        global.event_qsize, global.event_drops, global.event_late, (int)(global.render_load * 100), (int)(global.render_peak * 100));
+    global.render_peak = 0;
+}
+
 void handle_sync(int64_t time, int8_t index) {
     // I am called when I get an s message, which comes along with host time and index
     int64_t sysclock = get_sysclock();
-    char message[100];
+    char message[160];
     // Before I send, i want to update the map locally
     update_map(client_id, ipv4_quartet, sysclock);
     // Send back sync message with my time and received sync index and my client id & battery status (if any)
-    sprintf(message, "_s%lldi%dc%dr%dy%dZ", sysclock, index, client_id, ipv4_quartet, battery_mask);
+    sync_message(message, sysclock, index);
     mcast_send(message, strlen(message));
     // Update computed delta (i could average these out, but I don't think that'll help too much)
     //int64_t old_cd = computed_delta;
@@ -83,9 +92,9 @@ void handle_sync(int64_t time, int8_t index) {
 }
 
 void ping(int64_t sysclock) {
-    char message[100];
+    char message[160];
     //printf("[%d %d] pinging with %lld\n", ipv4_quartet, client_id, sysclock);
-    sprintf(message, "_s%lldi-1c%dr%dy%dZ", sysclock, client_id, ipv4_quartet, battery_mask);
+    sync_message(message, sysclock, -1);
     update_map(client_id, ipv4_quartet, sysclock);
     mcast_send(message, strlen(message));
     last_ping_time = sysclock;
@@ -1,6 +1,3 @@
-import datetime as dt
-import time
-
 import alles
 
 
@@ -16,25 +13,26 @@ class Note:
         return f"<Note: {self.frequency} hz, {self.velocity} velocity>"
 
 
-def play_note(osc_id, num_oscs, num_speakers, note):
+def play_note(voices, note, scheduler, t):
     first_breakpoint_ms = round(((note.duration) / 2) * 1000)
     second_breakpoint_ms = round((note.duration) * 1000)
     breakpoint_string = f"{first_breakpoint_ms},10,{second_breakpoint_ms},0.05,500,0"
 
-    print("sending ...", note, osc_id)
-    alles.send(
+    voice = voices.note_on(vel=note.velocity, duration_ms=second_breakpoint_ms, t=t)
+    for stolen in voice.stolen:
+        scheduler.at(t, vel=0, osc=stolen.osc, client=stolen.client)
+    print("sending ...", note, voice)
+    scheduler.at(
+        t,
         vel=note.velocity,
         volume=note.volume,
         freq=note.frequency,
         bp0=breakpoint_string,
         bp0_target=alles.TARGET_AMP,
         wave=alles.TRIANGLE,
-        osc=osc_id,
-        client=osc_id % num_speakers,
+        osc=voice.osc,
+        client=voice.client,
     )
-    osc_id += 1
-    next_osc_id = osc_id % num_oscs
-    return next_osc_id
 
 
 def convert_to_notes(events):
@@ -49,18 +47,11 @@ def block_and_play_events(
     sorted_events, start_time, total_duration_minutes, num_speakers, num_oscs
 ):
     alles.reset()
-    current_time = 0
-    osc_id = 0
+    scheduler = alles.Scheduler()
+    voices = alles.VoiceAllocator(clients=num_speakers, oscs=num_oscs)
     notes = convert_to_notes(sorted_events)
     for note in notes:
-        start = note.start
-
-        if start <= current_time:
-            now = dt.datetime.now()
-            osc_id = play_note(osc_id, num_oscs, num_speakers, note)
-        else:
-            time_to_current = start - current_time
-            time.sleep(time_to_current)
-            current_time += time_to_current
-            now = dt.datetime.now()
-            osc_id = play_note(osc_id, num_oscs, num_speakers, note)
+        t = scheduler.start + note.start * 1000
+        scheduler.wait(t)
+        play_note(voices, note, scheduler, t)
+    scheduler.wait()
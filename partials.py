@@ -1,4 +1,4 @@
-import alles, sys
+import alles, sys, os, array, hashlib
 
 import pydub
 import loris
@@ -6,6 +6,7 @@ import time
 import numpy as np
 from math import pi
 from collections import deque
+import heapq
 
 
 tests = [
@@ -17,6 +18,12 @@ tests = [
     "/Users/bwhitman/sounds/aps/samples/AMTMODERNCOMPOSER/ALPHA BASS/ALPHA B.-C2.wav"
 ]
 
+# A sequence is a numpy structured array with a row per breakpoint, in time order. ms_delta and the other deltas go
+# to the same partial's next breakpoint, as ratios except for ms_delta. phase is -1 for breakpoints in the middle of
+# a partial and -2 for the last
+SEQUENCE_DTYPE = np.dtype([("ms", np.float64), ("osc", np.int32), ("freq", np.float64), ("amp", np.float64), ("bw", np.float64),
+    ("phase", np.float64), ("ms_delta", np.float64), ("amp_delta", np.float64), ("freq_delta", np.float64), ("bw_delta", np.float64)])
+
 def list_from_py2_iterator(obj, how_many):
     # Oof, the loris object uses some form of iteration that py3 doesn't like. 
     ret = []
@@ -25,6 +32,45 @@ def list_from_py2_iterator(obj, how_many):
         ret.append(it.next())
     return ret
 
+def breakpoint_arrays(partials_it):
+    # Pull every breakpoint of a loris PartialList out in one pass. Returns (counts, first_phases, columns): how many
+    # breakpoints each partial has, the phase of each one's first breakpoint, and the time, freq, amp and bw of all
+    # of them in partial order as one (4, breakpoints) array. This loop is the only per-breakpoint Python
+    # in sequence(), the rest works on whole columns with numpy
+    partials = list_from_py2_iterator(partials_it, partials_it.size())
+    counts = [partial.numBreakpoints() for partial in partials]
+    first_phases = np.zeros(len(partials))
+    values = array.array("d")
+    add = values.extend
+    for partial_idx, partial in enumerate(partials):
+        if(counts[partial_idx] == 0): continue
+        next_bp = partial.iterator().next
+        bp = next_bp()
+        first_phases[partial_idx] = bp.phase()
+        add((bp.time(), bp.frequency(), bp.amplitude(), bp.bandwidth()))
+        for i in range(counts[partial_idx] - 1):
+            bp = next_bp()
+            add((bp.time(), bp.frequency(), bp.amplitude(), bp.bandwidth()))
+    columns = np.frombuffer(values, dtype=np.float64).reshape(-1, 4).T
+    return (np.array(counts, dtype=np.int64), first_phases, columns)
+
+def breakpoints(partials_it):
+    # The [ms, partial_idx, freq, amp, bw, phase] breakpoints of a loris PartialList for link(), as one array, from
+    # partials with more than one breakpoint. Returns (breakpoints, how many partials they're from)
+    (counts, first_phases, (times, freqs, amps, bws)) = breakpoint_arrays(partials_it)
+    multiple = counts > 1
+    firsts = np.cumsum(counts) - counts
+    phase = np.full(len(times), -1.0)
+    # Last breakpoints
+    phase[(firsts + counts - 1)[multiple]] = -2
+    # First breakpoints
+    first_phases = first_phases / (2*pi)
+    phase[firsts[multiple]] = np.where(first_phases < 0, first_phases + 1, first_phases)[multiple]
+    time_ms = (times * 1000.0).astype(np.int64)
+    partial_idx = np.repeat(np.arange(len(counts)), counts)
+    rows = np.column_stack((time_ms, partial_idx, freqs, amps, bws, phase))[np.repeat(multiple, counts)]
+    return (rows, np.count_nonzero(multiple))
+
 def loris_synth(filename, freq_res=150, analysis_window=100,amp_floor=-30, max_len_s = 10, noise_ratio=1, hop_time=0.04):
     # Pure loris synth for A/B testing
     audio = pydub.AudioSegment.from_file(filename)
@@ -38,28 +84,55 @@ def loris_synth(filename, freq_res=150, analysis_window=100,amp_floor=-30, max_l
     analyzer.setAmpFloor(amp_floor)
     analyzer.setHopTime(hop_time)
     partials = analyzer.analyze(y,44100)
-    bps = 0
-    for i in list_from_py2_iterator(partials, len(partials)):
-        bps = bps + len(list_from_py2_iterator(i, i.numBreakpoints()))
+    bps = sum([i.numBreakpoints() for i in list_from_py2_iterator(partials, len(partials))])
     print("%d partials %d bps" % (len(partials), bps))
     loris.scaleNoiseRatio(partials, noise_ratio)
     return loris.synthesize(partials,44100)
 
-def sequence(filename, max_len_s = 10, amp_floor=-30, hop_time=0.04, max_oscs=alles.OSCS, freq_res = 10, freq_drift=20, analysis_window = 100):
-    # my job: take a file, analyze it, output a sequence + some metadata
-    # i do voice stealing to keep maximum partials at once to max_oscs 
-    # my sequence is an ordered list of partials/oscillators, a list with (ms, osc, freq, amp, bw, phase, time_delta, amp_delta, freq_delta, bw_delta)
+def analyze(filename, max_len_s = 10, amp_floor=-30, hop_time=0.04, freq_res = 10, freq_drift=20, analysis_window = 100):
+    # Decode and loris analyze a file. Returns (breakpoints, partial_count, samples), see breakpoints(), or None if
+    # its sample rate isn't ours
     audio = pydub.AudioSegment.from_file(filename)
     audio = audio[:int(max_len_s*1000.0)]
     y = np.array(audio.get_array_of_samples())
     if int(audio.frame_rate) != int(alles.SAMPLE_RATE):
         print("SR mismatch, todo")
-        return (None, None)
+        return None
     if audio.channels == 2:
         y =y.reshape((-1, 2))
         y = y[:,1]
     y = np.float64(y) / 2**15
-    metadata = {"filename":filename, "samples":y.shape[0]}
+
+    # Do the loris analyze
+    analyzer = loris.Analyzer(freq_res, analysis_window)
+    analyzer.setAmpFloor(amp_floor)
+    analyzer.setFreqDrift(freq_drift)
+    analyzer.setHopTime(hop_time)
+    partials_it = analyzer.analyze(y, audio.frame_rate)
+    (rows, partial_count) = breakpoints(partials_it)
+    return (rows, partial_count, y.shape[0])
+
+def sequence(filename, max_len_s = 10, amp_floor=-30, hop_time=0.04, max_oscs=alles.OSCS, freq_res = 10, freq_drift=20, analysis_window = 100, cache=True, \
+        cents=0, db=0, steal=True):
+    # my job: take a file, analyze it, output a sequence + some metadata
+    # i do voice stealing to keep maximum partials at once to max_oscs 
+    # my sequence is an ordered array of partials/oscillators, see SEQUENCE_DTYPE
+    # The analysis comes from the cache if this file was analyzed with these settings before, see cache_dir
+    # With cents or db, breakpoints that their neighbours' lines get to within cents and db are dropped, see decimate()
+    # With steal, louder partials take the oscs of quieter ones when all max_oscs are busy, see link()
+    params = dict(max_len_s=max_len_s, amp_floor=amp_floor, hop_time=hop_time, freq_res=freq_res, freq_drift=freq_drift, analysis_window=analysis_window)
+    analyzed = None
+    if(cache):
+        key = cache_key(filename, **params)
+        analyzed = cache_load(key)
+    if(analyzed is None):
+        analyzed = analyze(filename, **params)
+        if(analyzed is None):
+            return (None, None)
+        if(cache):
+            cache_save(key, *analyzed)
+    (rows, partial_count, samples) = analyzed
+    metadata = {"filename":filename, "samples":samples}
 
     if(filename.endswith(".wav")):
         import wavdumper # Forked version
@@ -73,162 +146,459 @@ def sequence(filename, max_len_s = 10, amp_floor=-30, hop_time=0.04, max_oscs=al
         except AttributeError:
             pass # No wav metadata
 
-    # Do the loris analyze
-    analyzer = loris.Analyzer(freq_res, analysis_window)
-    analyzer.setAmpFloor(amp_floor)
-    analyzer.setFreqDrift(freq_drift)
-    analyzer.setHopTime(hop_time)
-    partials_it = analyzer.analyze(y, audio.frame_rate)
     # build the sequence
-    sequence = []
-    partials = list_from_py2_iterator(partials_it, partials_it.size())
-    partial_count = 0
-    for partial_idx, partial in enumerate(partials):
-        breakpoints = list_from_py2_iterator(partial, partial.numBreakpoints())
-        if(len(breakpoints)>1):
-            partial_count = partial_count + 1
-            for bp_idx, bp in enumerate(breakpoints):
-                phase = -1
-                # Last breakpoint?
-                if(bp_idx == len(breakpoints)-1): phase = -2
-                # First breakpoint
-                if(bp_idx == 0):
-                    phase = bp.phase() / (2*pi)
-                    if(phase < 0): phase = phase + 1
-                time_ms = int(bp.time() * 1000.0)
-                sequence.append( [time_ms, partial_idx, bp.frequency(), bp.amplitude(), bp.bandwidth(), phase] )
-
-    # Now go and order them and figure out which oscillator gets which partial
-    time_ordered = sorted(sequence, key=lambda x:x[0])
-    first_time = time_ordered[0][0]
-    # Clear the sequence
-    sequence = []
-    min_q_len = max_oscs
-    # Now add in a voice / osc # 
-    osc_map = {}
-    osc_q = deque(range(max_oscs)) 
-    for i,s in enumerate(time_ordered):
-        next_idx = -1
-        time_delta, amp_delta, freq_delta, bw_delta = (0,0,0,0)
-        if(s[5] != -2): # if not the end of a partial
-            next_idx = i+1
-            while(time_ordered[next_idx][1] != s[1]):
-                next_idx = next_idx + 1
-            n = time_ordered[next_idx]
-            time_delta = n[0] - s[0]
-            amp_delta = n[3]/s[3]
-            freq_delta = n[2]/s[2]
-            if(s[4]>0):
-                bw_delta = n[4]/s[4]
-            else:
-                bw_delta = 0
-
-        s.append(time_delta)
-        s.append(amp_delta)
-        s.append(freq_delta)
-        s.append(bw_delta)
-
-        # Start the partials at 0
-        s[0] = s[0] - first_time
-
-        if(s[5]>=0): #new partial
-            if(len(osc_q)):
-                osc_map[s[1]] = osc_q.popleft()
-                # Replace the partial_idx with a osc offset
-                s[1] = osc_map[s[1]]
-                sequence.append(s)
-        else:
-            osc = osc_map.get(s[1], None)
-            if(osc is not None):
-                s[1] = osc_map[s[1]]
-                sequence.append(s)
-                if(s[5] == -2): # last bp
-                    # Put the oscillator back
-                    osc_q.appendleft(osc)
-        if(len(osc_q) < min_q_len): min_q_len = len(osc_q)
+    if(cents > 0 or db > 0):
+        analyzed_count = len(rows)
+        rows = decimate(rows, cents=cents, db=db)
+        print("decimated %d breakpoints to %d" % (analyzed_count, len(rows)))
+    (sequence, first_time, min_q_len, report) = link(rows, max_oscs=max_oscs, steal=steal)
     print("%d partials and %d breakpoints, max oscs used at once was %d" % (partial_count, len(sequence), max_oscs - min_q_len))
+    if(report["dropped"] or report["stolen"]):
+        print("dropped %d partials and stole %d oscs, losing %2.2f%% of the energy" % (report["dropped"], report["stolen"], \
+            100.0 * report["dropped_energy"] / max(report["energy"], 1e-12)))
     # Fix sustain_ms
     if(metadata.get("sustain_ms", 0) > 0):
-        metadata["sustain_ms"] = metadata["sustain_ms"] - first_time
+        metadata["sustain_ms"] = metadata["sustain_ms"] - int(first_time)
     metadata["oscs_alloc"] = max_oscs-min_q_len
+    metadata["dropped_partials"] = report["dropped"]
+    metadata["stolen_oscs"] = report["stolen"]
+    metadata["dropped_energy"] = report["dropped_energy"] / max(report["energy"], 1e-12)
     return (metadata, sequence)
 
 
-def play(sequence, osc_offset=0, sustain_ms = -1, sustain_len_ms = 0, time_ratio = 1, pitch_ratio = 1, amp_ratio = 1, bw_ratio = 1, round_robin=False):
+"""
+    Analysis cache. sequence() keeps the breakpoints of each analysis in cache_dir, one .npz file per file contents
+    and analysis settings, and throws out the least recently used ones once they add up to more than cache_max_bytes
+"""
+cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "alles", "partials")
+cache_max_bytes = 2 * 1024 * 1024 * 1024
+CACHE_VERSION = 1 # bump when analyze() changes what it returns for the same file and settings
+
+def cache_key(filename, **params):
+    # A hash of the file's contents, the analysis settings and CACHE_VERSION
+    h = hashlib.sha1()
+    h.update(("version=%d;" % (CACHE_VERSION)).encode("ascii"))
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    for k in sorted(params.keys()):
+        h.update(("%s=%r;" % (k, params[k])).encode("ascii"))
+    return h.hexdigest()
+
+def cache_load(key):
+    # (breakpoints, partial_count, samples) from the cache, or None
+    path = os.path.join(cache_dir, key + ".npz")
+    try:
+        with np.load(path) as f:
+            analyzed = (f["breakpoints"], int(f["partial_count"]), int(f["samples"]))
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+    # Its mtime is when it was last used
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return analyzed
+
+def cache_save(key, rows, partial_count, samples):
+    # Best effort, a cache we can't write (full disk, read only home) just means analyzing again next time
+    path = os.path.join(cache_dir, key + ".npz")
+    # Write it under another name and move it in place, so a reader (or another process) never sees half of it
+    tmp = os.path.join(cache_dir, "%s.%d.tmp" % (key, os.getpid()))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp, "wb") as f:
+            np.savez(f, breakpoints=rows, partial_count=partial_count, samples=samples)
+        os.replace(tmp, path)
+        cache_evict()
+    except OSError as e:
+        print("Couldn't cache the analysis in %s: %s" % (cache_dir, e))
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def cache_evict(max_bytes=None):
+    # Delete the least recently used analyses until the cache fits in max_bytes, cache_max_bytes by default
+    if(max_bytes is None): max_bytes = cache_max_bytes
+    entries = []
+    for name in os.listdir(cache_dir):
+        if(name.endswith(".npz")):
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum([e[1] for e in entries])
+    for (mtime, size, name) in sorted(entries):
+        if(total <= max_bytes): break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            pass
+        total = total - size
+
+def cache_clear():
+    if(os.path.isdir(cache_dir)): cache_evict(0)
+
+
+DECIMATE_MAX_MS = 65535 # ms_delta is a uint16_t in partials.c
+
+def decimate(breakpoints, cents=10, db=1):
+    # Drop the [ms, partial_idx, freq, amp, bw, phase] breakpoints that a straight line between the ones kept either
+    # side of them gets to within cents in freq and db in amp, which is how AMY ramps between them. Douglas-Peucker
+    # on every partial at once: each round keeps the worst point of each stretch that's out of tolerance, until
+    # none are. A tolerance of 0 ignores that one. link() works out the deltas for what's left
+    bp = np.asarray(breakpoints, dtype=np.float64).reshape(-1, 6)
+    if(len(bp) == 0):
+        return bp
+    # Partials together, each in time order
+    bp = bp[np.lexsort((bp[:,0], bp[:,1]))]
+    (ms, partial, freq, amp) = (bp[:,0], bp[:,1], bp[:,2], np.maximum(bp[:,3], 1e-9))
+    # Keep the first and last breakpoints of each partial
+    edges = np.nonzero(np.diff(partial))[0]
+    keep = np.zeros(len(bp), dtype=bool)
+    keep[0] = keep[-1] = True
+    keep[edges] = True
+    keep[edges + 1] = True
+    points = np.arange(len(bp))
+    while 1:
+        kept = np.nonzero(keep)[0]
+        # The kept breakpoints either side of each one, in the same partial as it
+        a = kept[np.maximum(np.searchsorted(kept, points, side="right") - 1, 0)]
+        b = kept[np.minimum(np.searchsorted(kept, points, side="left"), len(kept) - 1)]
+        span = ms[b] - ms[a]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = np.where(span > 0, (ms - ms[a]) / span, 0)
+        error = np.zeros(len(bp))
+        if(cents > 0):
+            line = freq[a] + (freq[b] - freq[a]) * w
+            error = np.maximum(error, np.abs(1200 * np.log2(line / freq)) / cents)
+        if(db > 0):
+            line = amp[a] + (amp[b] - amp[a]) * w
+            error = np.maximum(error, np.abs(20 * np.log10(line / amp)) / db)
+        # Stretches too long for ms_delta get split too
+        error = np.where(span > DECIMATE_MAX_MS, np.inf, error)
+        error[keep] = 0
+        # Keep each stretch's worst breakpoint if it's out of tolerance
+        worst = np.zeros(len(kept))
+        np.maximum.at(worst, np.searchsorted(kept, a), error)
+        add = (error > 1) & (error == worst[np.searchsorted(kept, a)])
+        if(not np.any(add)):
+            break
+        keep = keep | add
+    return bp[keep]
+
+def next_breakpoints(which):
+    # Each breakpoint's next one in the same partial is the one after it sorted by partial, then time
+    by_partial = np.lexsort((np.arange(len(which)), which))
+    next_bp = np.zeros(len(which), dtype=np.int64)
+    next_bp[by_partial[:-1]] = by_partial[1:]
+    return next_bp
+
+def link(breakpoints, max_oscs=alles.OSCS, steal=True):
+    # I take the [ms, partial_idx, freq, amp, bw, phase] breakpoints of sequence(), put them in time order, add the
+    # deltas to each one's next breakpoint in the same partial and give each partial an osc. When all max_oscs are busy
+    # a new partial takes the osc of the quietest playing one (by peak amp) if it's louder, and that one fades out to
+    # where the new one starts. Without steal, or if it's the quietest, the new partial is dropped.
+    # Returns (sequence, first_time, min_q_len, report), report saying how many partials and how much of the
+    # energy (amp^2 * ms) was dropped or stolen
+    bp = np.asarray(breakpoints, dtype=np.float64).reshape(-1, 6)
+    # Time order, keeping the order they came in at the same time
+    bp = bp[np.argsort(bp[:,0], kind="stable")]
+    (ms, partial, freq, amp, bw, phase) = bp.T
+    first_time = ms[0]
+    (partial_ids, which) = np.unique(partial, return_inverse=True)
+    peak = np.zeros(len(partial_ids))
+    np.maximum.at(peak, which, amp)
+    # The energy each breakpoint holds until the next one, for the report
+    next_bp = next_breakpoints(which)
+    energy = np.where(phase != -2, amp * amp * (ms[next_bp] - ms), 0)
+
+    # Now go through the starts and ends of partials in order, and figure out which oscillator gets which partial
+    min_q_len = max_oscs
+    osc_of = [-1] * len(partial_ids)
+    playing = [False] * len(partial_ids)
+    cut = np.full(len(partial_ids), np.inf) # where a stolen partial stops
+    by_peak = [] # heap of (peak, partial) of the playing partials, with some that stopped since
+    peaks = peak.tolist()
+    stolen = 0
+    osc_q = deque(range(max_oscs)) 
+    ends = np.nonzero((phase >= 0) | (phase == -2))[0]
+    for (i, p, ph) in zip(ends.tolist(), which[ends].tolist(), phase[ends].tolist()):
+        if(ph >= 0): # new partial
+            if(len(osc_q)):
+                osc_of[p] = osc_q.popleft()
+            elif(steal):
+                while(len(by_peak) and not playing[by_peak[0][1]]):
+                    heapq.heappop(by_peak)
+                if(len(by_peak) and by_peak[0][0] < peaks[p]):
+                    (_, quietest) = heapq.heappop(by_peak)
+                    playing[quietest] = False
+                    cut[quietest] = ms[i]
+                    osc_of[p] = osc_of[quietest]
+                    stolen += 1
+            if(osc_of[p] >= 0):
+                playing[p] = True
+                heapq.heappush(by_peak, (peaks[p], p))
+        elif(playing[p]): # last bp
+            # Put the oscillator back
+            playing[p] = False
+            osc_q.appendleft(osc_of[p])
+        if(len(osc_q) < min_q_len): min_q_len = len(osc_q)
+    osc_of = np.array(osc_of, dtype=np.int32)
+    allocated = osc_of[which] >= 0
+    keep = allocated & (ms < cut[which])
+    report = {"partials":len(partial_ids), "dropped":int(np.count_nonzero(osc_of < 0)), "stolen":stolen, \
+        "energy":float(energy.sum()), "dropped_energy":float(energy[~keep].sum())}
+
+    # A stolen partial gets a last breakpoint going to amp 0 where it was stolen, from its last one before then
+    rows = np.nonzero(keep)[0]
+    last = np.zeros(len(partial_ids), dtype=np.int64) - 1
+    last[which[rows]] = rows
+    faded = np.nonzero(np.isfinite(cut) & (last >= 0))[0]
+    fades = bp[last[faded]].copy()
+    fades[:,0] = cut[faded]
+    fades[:,3] = 0
+    fades[:,5] = -2
+    # and goes before anything else at that time, so it's off before its osc starts the partial that stole it
+    order = np.lexsort((np.concatenate((rows, np.zeros(len(faded), dtype=np.int64))), \
+        np.concatenate((np.ones(len(rows)), np.zeros(len(faded)))), np.concatenate((ms[rows], fades[:,0]))))
+    bp = np.concatenate((bp[rows], fades))[order]
+    which = np.concatenate((which[rows], faded))[order]
+    (ms, partial, freq, amp, bw, phase) = bp.T
+
+    next_bp = next_breakpoints(which)
+    linked = phase != -2 # if not the end of a partial
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ms_delta = np.where(linked, ms[next_bp] - ms, 0)
+        amp_delta = np.where(linked, amp[next_bp] / amp, 0)
+        freq_delta = np.where(linked, freq[next_bp] / freq, 0)
+        bw_delta = np.where(linked & (bw > 0), bw[next_bp] / bw, 0)
+
+    sequence = np.zeros(len(bp), dtype=SEQUENCE_DTYPE)
+    # Start the partials at 0
+    sequence["ms"] = ms - first_time
+    sequence["osc"] = osc_of[which]
+    sequence["freq"] = freq
+    sequence["amp"] = amp
+    sequence["bw"] = bw
+    sequence["phase"] = phase
+    sequence["ms_delta"] = ms_delta
+    sequence["amp_delta"] = amp_delta
+    sequence["freq_delta"] = freq_delta
+    sequence["bw_delta"] = bw_delta
+    return (sequence, first_time, min_q_len, report)
+
+def transform(sequence, osc_offset=0, time_ratio=1, pitch_ratio=1, amp_ratio=1, bw_ratio=1):
+    # A copy of sequence on oscs osc_offset up, time_ratio times as fast, pitch_ratio times higher and amp_ratio and
+    # bw_ratio times the amplitude and bandwidth. Each is one operation on a whole column
+    sequence = sequence.copy()
+    sequence["osc"] += osc_offset
+    sequence["ms"] /= time_ratio
+    sequence["ms_delta"] /= time_ratio
+    sequence["freq"] *= pitch_ratio
+    sequence["amp"] *= amp_ratio
+    sequence["bw"] *= bw_ratio
+    return sequence
+
+
+def timeline(sequence, osc_offset=0, sustain_ms=-1, sustain_len_ms=0, time_ratio=1, pitch_ratio=1, amp_ratio=1, bw_ratio=1):
+    # transform() sequence, and work out the ms from the start each breakpoint plays at, holding sustain_len_ms at
+    # sustain_ms. Returns (transformed, ms)
+    if(sustain_ms > 0):
+        if(sustain_ms > sequence["ms"][-1]):
+            print("Moving sustain_ms from %d to %d" % (sustain_ms, sequence["ms"][-1]-100))
+            sustain_ms = sequence["ms"][-1] - 100
+    transformed = transform(sequence, osc_offset=osc_offset, time_ratio=time_ratio, pitch_ratio=pitch_ratio, amp_ratio=amp_ratio, bw_ratio=bw_ratio)
+    timestamps = transformed["ms"]
+    if(sustain_ms > 0):
+        timestamps = timestamps + np.where(sequence["ms"] > sustain_ms, sustain_len_ms/time_ratio, 0)
+    return (transformed, timestamps)
+
+def compile_sequence(sequence, start=None, osc_offset=0, sustain_ms=-1, sustain_len_ms=0, time_ratio=1, pitch_ratio=1, amp_ratio=1, \
+        bw_ratio=1, size=508, window_ms=100):
+    # The AMY messages that play sequence from host time start (default now) with these settings, like play() sends
+    # them, packed in time order into datagrams of at most size bytes and window_ms of timestamps. The messages are
+    # binary if alles.binary() is on, like send() makes them. Returns a list of (first timestamp, last timestamp, deltas, datagram) for alles.send_paced()
+    if(start is None): start = alles.millis()
+    if(not hasattr(sequence, "dtype")):
+        sequence = np.array([tuple(s) for s in sequence], dtype=SEQUENCE_DTYPE)
+    if(not len(sequence)):
+        return []
+    (transformed, timestamps) = timeline(sequence, osc_offset=osc_offset, sustain_ms=sustain_ms, sustain_len_ms=sustain_len_ms, \
+        time_ratio=time_ratio, pitch_ratio=pitch_ratio, amp_ratio=amp_ratio, bw_ratio=bw_ratio)
+    phase = transformed["phase"]
+    starts = phase >= 0
+    ends = phase == -2
+
+    events = np.zeros(len(transformed), dtype=[("timestamp", "i8"), ("osc", "i4"), ("wave", "i4"), ("amp", "f8"), ("freq", "f8"), \
+        ("feedback", "f8"), ("vel", "f8"), ("phase", "f8"), ("bp0", "U64"), ("bp1", "U64"), ("bp2", "U64"), ("bp0_target", "i4"), \
+        ("bp1_target", "i4"), ("bp2_target", "i4")])
+    events["timestamp"] = start + np.floor(timestamps).astype(np.int64)
+    events["osc"] = transformed["osc"]
+    events["wave"] = alles.PARTIAL
+    events["amp"] = transformed["amp"]
+    events["freq"] = transformed["freq"]
+    events["feedback"] = transformed["bw"]
+    # note on with the phase at the start, note off at the end
+    events["vel"] = np.where(starts, transformed["amp"], np.where(ends, 0, -1))
+    events["phase"] = np.where(starts, phase, -1)
+    # Envelope strings
+    ms_delta = alles.trunc_column(transformed["ms_delta"].astype(np.int64))
+    events["bp0"] = ["%s,%s,0,0" % x for x in zip(ms_delta, alles.trunc_column(transformed["amp_delta"]))]
+    events["bp1"] = ["%s,%s,0,0" % x for x in zip(ms_delta, alles.trunc_column(transformed["freq_delta"]))]
+    if(bw_ratio > 0):
+        events["bp2"] = ["%s,%s,0,0" % x for x in zip(ms_delta, alles.trunc_column(transformed["bw_delta"]))]
+    else:
+        events["bp2"] = ""
+    events["bp0_target"] = alles.TARGET_AMP+alles.TARGET_LINEAR
+    events["bp1_target"] = alles.TARGET_FREQ+alles.TARGET_LINEAR
+    events["bp2_target"] = alles.TARGET_FEEDBACK+alles.TARGET_LINEAR
+    messages = alles.encode_many(events)
+    # What alles.delta_count() says for each: wave, amp, freq, feedback, the targets, 4 for each envelope, and vel and phase
+    deltas = 15 + (4 if bw_ratio > 0 else 0) + np.where(starts, 2, np.where(ends, 1, 0))
+
+    datagrams = []
+    d = ""
+    for (m, t, n) in zip(messages, events["timestamp"].tolist(), deltas.tolist()):
+        if(len(d) and (len(d) + len(m) > size or t - first > window_ms)):
+            datagrams.append((first, last, count, d))
+            d = ""
+        if(not len(d)):
+            (first, count) = (t, 0)
+        d = d + m
+        last = t
+        count = count + n
+    datagrams.append((first, last, count, d))
+    return datagrams
+
+def play(sequence, osc_offset=0, sustain_ms = -1, sustain_len_ms = 0, time_ratio = 1, pitch_ratio = 1, amp_ratio = 1, bw_ratio = 1, round_robin=False, \
+        lookahead_ms=250):
     # i take a sequence and play it to AMY, just like native AMY will do from a .h file
+    # Each datagram from compile_sequence() goes out lookahead_ms before it plays
     my_start_time = alles.millis()
+    if(not hasattr(sequence, "dtype")):
+        sequence = np.array([tuple(s) for s in sequence], dtype=SEQUENCE_DTYPE)
 
-    if(round_robin):
-        next_client = 0
-        osc_to_client_map = {}
-        print("Syncing mesh....")
-        clients = len(alles.sync())
-        # After a sync, we don't want to immediately spam the mesh, so let's wait 2000ms
-        time.sleep(2)
-        print("Ready to play among %d speakers" % (clients))
-    
-    sustain_offset = 0
-    if(sustain_ms > 0):
-        if(sustain_ms > sequence[-1][0]):
-            print("Moving sustain_ms from %d to %d" % (sustain_ms, sequence[-1][0]-100))
-            sustain_ms = sequence[-1][0] - 100
+    # alles waits for room in the synthesizers' queues for each datagram, so I don't overflow their state
+    old_policy = alles.queue_policy
+    if(old_policy is None): alles.backpressure("wait")
+    try:
+        if(round_robin):
+            play_round_robin(sequence, my_start_time, osc_offset=osc_offset, sustain_ms=sustain_ms, sustain_len_ms=sustain_len_ms, \
+                time_ratio=time_ratio, pitch_ratio=pitch_ratio, amp_ratio=amp_ratio, bw_ratio=bw_ratio)
+        else:
+            datagrams = compile_sequence(sequence, start=my_start_time, osc_offset=osc_offset, sustain_ms=sustain_ms, sustain_len_ms=sustain_len_ms, \
+                time_ratio=time_ratio, pitch_ratio=pitch_ratio, amp_ratio=amp_ratio, bw_ratio=bw_ratio)
+            alles.send_paced(datagrams, lookahead_ms=lookahead_ms)
+    finally:
+        # Even if we were interrupted, don't leave backpressure on for everything else
+        if(old_policy is None): alles.backpressure(None)
+    return float(sequence["ms"][-1] / time_ratio)
 
-    for i,s in enumerate(sequence):
-        # Wait for the item in the sequence to be close, so I don't overflow the synthesizers' state
-        while(my_start_time + (s[0] / time_ratio) > (alles.millis() - 500)):
-            time.sleep(0.01)
+def play_round_robin(sequence, my_start_time, osc_offset=0, sustain_ms = -1, sustain_len_ms = 0, time_ratio = 1, pitch_ratio = 1, amp_ratio = 1, bw_ratio = 1):
+    # play() spread across the mesh. Voices go to speakers as the partials start, so each message is made as it's sent
+    partial_voices = {}
+    print("Syncing mesh....")
+    mesh = alles.sync()
+    clients = len(mesh)
+    # Puts partials on the least loaded, most reliable speakers
+    voices = alles.VoiceAllocator(table=mesh)
+    # After a sync, we don't want to immediately spam the mesh, so let's wait 2000ms
+    time.sleep(2)
+    print("Ready to play among %d speakers" % (clients))
 
+    (transformed, timestamps) = timeline(sequence, osc_offset=osc_offset, sustain_ms=sustain_ms, sustain_len_ms=sustain_len_ms, \
+        time_ratio=time_ratio, pitch_ratio=pitch_ratio, amp_ratio=amp_ratio, bw_ratio=bw_ratio)
+    timestamps = my_start_time + timestamps
+
+    for (s, timestamp) in zip(transformed.tolist(), timestamps.tolist()):
+        (ms, osc, freq, amp, bw, phase, ms_delta, amp_delta, freq_delta, bw_delta) = s
         # Make envelope strings
-        bp0 = "%d,%s,0,0" % (s[6] / time_ratio, alles.trunc(s[7]))
-        bp1 = "%d,%s,0,0" % (s[6] / time_ratio, alles.trunc(s[8]))
+        bp0 = "%d,%s,0,0" % (ms_delta, alles.trunc(amp_delta))
+        bp1 = "%d,%s,0,0" % (ms_delta, alles.trunc(freq_delta))
         if(bw_ratio > 0):
-            bp2 = "%d,%s,0,0" % (s[6] / time_ratio, alles.trunc(s[9]))
+            bp2 = "%d,%s,0,0" % (ms_delta, alles.trunc(bw_delta))
         else:
             bp2 = ""
-        if(sustain_ms > 0 and sustain_offset == 0):
-            if(s[0]/time_ratio > sustain_ms/time_ratio):
-                sustain_offset = sustain_len_ms/time_ratio
-
-        osc = s[1]+osc_offset
 
         partial_args = {}
 
-        if(round_robin):
-            if(osc_to_client_map.get(osc,None) is None):
-                osc_to_client_map[osc] = (next_client % clients)
-                next_client += 1
-            partial_args["client"] = osc_to_client_map[osc]
+        # Each partial gets a voice on the best speaker for it when it starts
+        if(phase >= 0):
+            if(osc in partial_voices):
+                voices.release(partial_voices.pop(osc), t=timestamp)
+            partial_voices[osc] = voices.note_on(wave=alles.PARTIAL, vel=amp, t=timestamp)
+            # Partials that lost their voice to this one stop there, and the rest of their breakpoints are dropped
+            for stolen in partial_voices[osc].stolen:
+                alles.send(client=stolen.client, osc=stolen.osc, vel=0, timestamp=timestamp)
+                for (k, v) in list(partial_voices.items()):
+                    if(v is stolen): del partial_voices[k]
+        if(osc not in partial_voices):
+            continue
+        voice = partial_voices[osc]
+        if(phase == -2):
+            voices.release(partial_voices.pop(osc), t=timestamp)
+        partial_args["client"] = voice.client
+        osc = voice.osc
 
-        partial_args.update({"timestamp":my_start_time + (s[0]/time_ratio + sustain_offset),
-            "osc":s[1]+osc_offset,
+        partial_args.update({"timestamp":timestamp,
+            "osc":osc,
             "wave":alles.PARTIAL,
-            "amp":s[3]*amp_ratio,
-            "freq":s[2]*pitch_ratio,
-            "feedback":s[4]*bw_ratio,
+            "amp":amp,
+            "freq":freq,
+            "feedback":bw,
             "bp0":bp0, "bp1":bp1, "bp2":bp2,
             "bp0_target":alles.TARGET_AMP+alles.TARGET_LINEAR,
             "bp1_target":alles.TARGET_FREQ+alles.TARGET_LINEAR,
             "bp2_target":alles.TARGET_FEEDBACK+alles.TARGET_LINEAR})
 
-        if(s[5]==-2): #end, add note off
+        if(phase==-2): #end, add note off
             alles.send(**partial_args, vel=0)
-        elif(s[5]==-1): # continue
+        elif(phase==-1): # continue
             alles.send(**partial_args)
         else: #start, add phase and note on
-            alles.send(**partial_args, vel=s[3]*amp_ratio, phase=s[5])
-
-    return sequence[-1][0]/time_ratio
+            alles.send(**partial_args, vel=amp, phase=phase)
 
 #In [6]: partials.generate_partials_header(fns,amp_floor=-40,analysis_window=40,freq_drift=5,hop_time=0.04,freq_res=5)
-def generate_partials_header(filenames, **kwargs):
+def generate_partials_header(filenames, workers=None, **kwargs):
     # given a list of filenames, output a partials.h
-    out = open("main/amy/partials.h", "w")
-    out.write("// Automatically generated by partials.generate_partials_header()\n#ifndef __PARTIALS_H\n#define __PARTIALS_H\n#define PARTIALS_PATCHES %d\n" % (len(filenames)))
+    # The files are analyzed on workers processes at once, as many as there are cores by default, and go in the header
+    # in the order given. A file that fails is reported and returned with its error in a list, and then the header isn't
+    # written, as the patch numbers after it would all move down by one
+    from concurrent.futures import ProcessPoolExecutor
     all_partials = []
-    for f in filenames:
-        m, s = sequence(f, **kwargs)
-        if(m is not None):
+    failed = []
+    pool = None
+    try:
+        if(workers != 1):
+            pool = ProcessPoolExecutor(max_workers=workers)
+            futures = [pool.submit(sequence, f, **kwargs) for f in filenames]
+        for i, f in enumerate(filenames):
+            try:
+                if(pool is None):
+                    m, s = sequence(f, **kwargs)
+                else:
+                    m, s = futures[i].result()
+            except Exception as e:
+                print("Couldn't analyze %s: %s" % (f, repr(e)))
+                failed.append((f, e))
+                continue
+            if(m is None):
+                print("Couldn't analyze %s: no audio" % (f))
+                failed.append((f, None))
+                continue
             all_partials.append((m ,s))
+    finally:
+        # Don't leave analyses running if we were interrupted
+        if(pool is not None):
+            pool.shutdown(cancel_futures=True)
+    if(len(failed)):
+        print("Not writing main/amy/partials.h, %d of %d files failed" % (len(failed), len(filenames)))
+        return failed
+    out = open("main/amy/partials.h", "w")
+    out.write("// Automatically generated by partials.generate_partials_header()\n#ifndef __PARTIALS_H\n#define __PARTIALS_H\n#define PARTIALS_PATCHES %d\n" % (len(all_partials)))
     out.write("const partial_breakpoint_map_t partial_breakpoint_map[%d] = {\n" % (len(all_partials)))
     out.write("\t// offset, length, midi_note, sustain_ms, oscs_alloc\n")
     start = 0
@@ -239,11 +609,11 @@ def generate_partials_header(filenames, **kwargs):
     out.write("const partial_breakpoint_t partial_breakpoints[%d] = {\n" % (start))
     out.write("\t// ms_offset, osc, freq, amp, bw, phase, ms_delta, amp_delta, freq_delta, bw_delta\n")
     for p in all_partials:
-        for s in p[1]:
-            out.write("\t { %d, %d, %f, %f, %f, %f, %d, %f, %f, %f }, \n" % tuple(s))
+        out.write("".join(["\t { %d, %d, %f, %f, %f, %f, %d, %f, %f, %f }, \n" % s for s in p[1].tolist()]))
     out.write("};\n")
     out.write("#endif // __PARTIALS_H\n")
     out.close()
+    return failed
 
 # OK defaults here
 def test(   filename="/Users/bwhitman/sounds/billboard/0157/0157.mp4", \